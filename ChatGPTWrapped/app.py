@@ -1,38 +1,70 @@
 from __future__ import annotations
 
 import json
+import os
 import zipfile
-from io import BytesIO
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import date
-from typing import Dict, List, Optional
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import streamlit as st
 
 from src.analytics import (
-    activity_heatmap,
+    apply_timezone,
     build_message_dataframe,
-    conversation_level,
-    highlights,
+    compact_dtypes,
+    date_bounds,
+    day_range,
+    is_compact,
     time_by_category,
     time_over_time,
     top_keywords,
-    tokens_by_category,
-    tokens_by_category_and_role,
-    tokens_over_time,
-    totals,
 )
 from src.archetypes import add_flair, assign_archetype
-from src.categorise import categorise
-from src.parse_export import ParsedMessage, parse_conversations
+from src.categorise import CategoryScores, RulePack, categorise_series, category_scores, rule_pack_from_env
+from src.cube import AggregateCube, ConversationDays
+from src.dataset_cache import DatasetCache, cache_from_env, content_hash, dataset_key, processing_profile
+from src.incremental import merge_incremental_texts
+from src.keywords import KeywordCounts
+from src.memo import TextMemo, memo_from_env
+from src.parse_export import (
+    BRANCHES_ACTIVE,
+    BRANCHES_ALL,
+    BufferReader,
+    MessageBatch,
+    build_message_batch,
+    iter_conversations,
+)
 from src.report_export import build_wrapped_html
-from src.tokens import estimate_tokens_heuristic, get_token_counter
+from src.search import SearchIndex
+from src.text_store import TEXT_INDEX_COLUMN, TextStore, with_text
+from src.tokens import (
+    SUPPORTED_ENCODINGS,
+    TIKTOKEN_ENCODING,
+    TOKENS_EXACT,
+    TOKENS_SAMPLED,
+    count_tokens_batch,
+    estimate_tokens_sampled,
+    get_encoding,
+    tokenizer_name,
+)
 from src.ui_helpers import hybrid_dna_tag, inject_css, metric_card, pills
 from src.theme import HEATMAP_BLUE_SCALE, apply_plotly_theme, DATA_COLORS
 
 APP_TITLE = "ChatGPT Wrapped"
 DEFAULT_TZ = "Australia/Melbourne"
+# Worker processes for parsing; above 1 the export is loaded whole and parsed in parallel.
+# Workers are forked from the server, which is unsafe with its other threads running
+# (see parallel.forked_map), so keep it at 1 unless parsing is known to be isolated.
+PARSE_WORKERS = int(os.environ.get("CHATGPT_WRAPPED_PARSE_WORKERS", "1"))
+# Conversations read from the start of an upload to find the cached import it updates.
+BASE_SAMPLE_CONVERSATIONS = 256
 
 
 def _format_int(n: int) -> str:
@@ -46,56 +78,240 @@ def _format_duration(minutes: float) -> str:
     return f"{minutes:.0f} mins"
 
 
-@st.cache_data(show_spinner=False)
-def _load_messages_from_upload(raw: bytes, name: str, timezone: str) -> List[ParsedMessage]:
-    """Parse an uploaded ChatGPT export into a list of messages.
+def _find_conversations_member(zf: zipfile.ZipFile) -> str:
+    names = zf.namelist()
+    for c in ("conversations.json", "data/conversations.json", "chatgpt/conversations.json"):
+        if c in names:
+            return c
+    for n in names:
+        if n.lower().endswith("conversations.json"):
+            return n
+    raise ValueError("Could not find conversations.json inside the ZIP export.")
+
+
+@dataclass(frozen=True)
+class ProcessingOptions:
+    """Sidebar choices that change the processed dataset (and so its cache key)."""
+
+    use_tiktoken: bool = True
+    encoding: str = TIKTOKEN_ENCODING
+    branches: str = BRANCHES_ALL
+    compact: bool = True
+    token_mode: str = TOKENS_EXACT
+
+
+@contextmanager
+def _upload_conversations(raw: Union[bytes, memoryview], name: str) -> Iterator[Iterator[Any]]:
+    """Stream the conversations of an upload in place (straight out of the ZIP member
+    when zipped), so neither the archive, the member nor the full object tree is ever
+    copied into memory."""
+    with BufferReader(raw) as src:
+        if name.lower().endswith(".zip"):
+            with zipfile.ZipFile(src) as zf:
+                with zf.open(_find_conversations_member(zf)) as fh:
+                    yield iter_conversations(fh)
+        else:
+            yield iter_conversations(src)
+
 
-    Caching prevents reparsing large exports on every rerun when users adjust filters
-    or switch tabs, which keeps the app responsive.
-    """
+def _load_messages_from_upload(raw: Union[bytes, memoryview], name: str, branches: str = BRANCHES_ALL,
+                               unchanged: Optional[Dict[str, float]] = None) -> MessageBatch:
+    """Parse an uploaded ChatGPT export into a columnar batch of messages.
 
-    if name.lower().endswith(".zip"):
-        with zipfile.ZipFile(BytesIO(raw)) as zf:
-            conv_path = None
-            for c in ("conversations.json", "data/conversations.json", "chatgpt/conversations.json"):
-                if c in zf.namelist():
-                    conv_path = c
-                    break
-            if conv_path is None:
-                for n in zf.namelist():
-                    if n.lower().endswith("conversations.json"):
-                        conv_path = n
-                        break
-            if conv_path is None:
-                raise ValueError("Could not find conversations.json inside the ZIP export.")
-            conv_data = json.loads(zf.read(conv_path).decode("utf-8"))
+    The JSON is streamed one conversation at a time (``_upload_conversations``).
+    Timestamps stay in UTC, so the timezone does not affect anything cached downstream.
+    ``unchanged`` is a prior import's manifest; conversations it already holds are not
+    re-parsed.
+    """
+    with _upload_conversations(raw, name) as conversations:
+        return build_message_batch(conversations, workers=PARSE_WORKERS, unchanged=unchanged, branches=branches)
+
+
+def _sample_conversation_ids(raw: Union[bytes, memoryview], name: str,
+                             n: int = BASE_SAMPLE_CONVERSATIONS) -> List[str]:
+    """Ids of the first ``n`` conversations of an upload, decoding only those."""
+    with _upload_conversations(raw, name) as conversations:
+        sample = list(islice(conversations, n))
+    return [str(c["id"]) for c in sample if isinstance(c, dict) and c.get("id")]
+
+
+def _build_df(messages: MessageBatch, use_tiktoken: bool = True, compact: bool = False,
+              encoding: str = TIKTOKEN_ENCODING, token_mode: str = TOKENS_EXACT) -> pd.DataFrame:
+    """Build the lean message frame. With ``token_mode=TOKENS_SAMPLED`` only a stratified
+    sample is tokenised exactly; the ~95% error bound on the token total is kept in
+    ``df.attrs["token_error_bound"]``. The share of messages whose text was a duplicate,
+    and so categorised once, is kept in ``df.attrs["category_dedup_ratio"]``."""
+    error_bound = None
+    if token_mode == TOKENS_SAMPLED and use_tiktoken:
+        texts = np.fromiter(messages.iter_texts(), dtype=object, count=len(messages))
+        sampled = estimate_tokens_sampled(texts, messages.column("role"), memo=_text_memo(), encoding=encoding)
+        tokens, error_bound = sampled.counts, sampled.error_bound
     else:
-        conv_data = json.loads(raw.decode("utf-8"))
-
-    return parse_conversations(conv_data, timezone=timezone)
-
-
-@st.cache_data(show_spinner=False)
-def _build_df(messages: List[ParsedMessage], use_tiktoken: bool = True) -> pd.DataFrame:
-    counter_fn, has_tiktoken, _ = get_token_counter()
-    counter = counter_fn if use_tiktoken and has_tiktoken else estimate_tokens_heuristic
-
-    rows: List[Dict] = []
-    for m in messages:
-        tok = counter(m.text)
-        rows.append(
-            {
-                "conversation_id": m.conversation_id,
-                "conversation_title": m.conversation_title,
-                "message_id": m.message_id,
-                "role": m.role,
-                "created_at": m.created_at,
-                "text": m.text,
-                "tokens": int(tok),
-                "category": categorise(m.text),
-            }
-        )
-    return build_message_dataframe(rows)
+        tokens = count_tokens_batch(messages.iter_texts(), use_tiktoken=use_tiktoken, memo=_text_memo(), encoding=encoding)
+    categories = categorise_series(messages.iter_texts(), _rule_pack().matcher, memo=_text_memo())
+
+    df = build_message_dataframe(
+        messages,
+        extra_columns={"tokens": tokens, "category": categories.array if compact else categories.to_numpy(dtype=object)},
+        timezone=None,
+        compact=compact,
+        keep_text=False,
+    )
+    if error_bound is not None:
+        df.attrs["token_error_bound"] = error_bound
+    df.attrs["category_dedup_ratio"] = categories.attrs["dedup"].dedup_ratio
+    return df
+
+
+@st.cache_resource(show_spinner=False)
+def _dataset_cache() -> Optional[DatasetCache]:
+    return cache_from_env()
+
+
+@st.cache_resource(show_spinner=False)
+def _rule_pack() -> RulePack:
+    """The category rules in use (``CHATGPT_WRAPPED_RULES_PATH`` or the built-in ones),
+    loaded and compiled once per process."""
+    return rule_pack_from_env()
+
+
+@st.cache_resource(show_spinner=False)
+def _text_memo() -> TextMemo:
+    """Per-text results shared by every session in this process (and, with a memo file, across replicas)."""
+    return memo_from_env()
+
+
+def _processing_profile(options: ProcessingOptions) -> str:
+    return processing_profile(tokenizer=tokenizer_name(options.use_tiktoken, options.encoding), rules=_rule_pack().version, branches=options.branches,
+                              compact=options.compact, tokens=options.token_mode)
+
+
+def _upload_hash(uploaded) -> str:
+    """Hash the upload once per file rather than on every rerun."""
+    hashes = st.session_state.setdefault("_upload_hashes", {})
+    file_id = getattr(uploaded, "file_id", None) or uploaded.name
+    if file_id not in hashes:
+        # getvalue() shares the upload's bytes; getbuffer() would copy them.
+        hashes[file_id] = content_hash(uploaded.getvalue())
+    return hashes[file_id]
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _load_dataset(key: str, profile: str, _raw: Union[bytes, memoryview], name: str,
+                  options: ProcessingOptions) -> Tuple[pd.DataFrame, TextStore]:
+    """Return the timezone-independent message frame for an upload and its message text.
+
+    ``key`` identifies the upload content and processing profile, so the raw bytes are
+    not hashed again on every rerun. Frames are also kept in the on-disk cache (when
+    configured), so a known export skips parsing even after a restart or on another
+    replica. For a new export, the cached import with the same profile that shares the
+    most of its first conversations (``DatasetCache.incremental_base``) is used as a
+    base. Only conversations that are new or have a newer ``update_time`` are parsed,
+    tokenised and categorised, then merged with the base's rows. With no such import
+    (e.g. only other users' exports are cached), the export is parsed in full.
+
+    The result is a shared resource rather than ``st.cache_data``, which would copy the
+    frame and all message text on every rerun; callers treat it as read-only. Only the
+    last few datasets are kept in memory; older ones are read back from the disk cache.
+    """
+    cache = _dataset_cache()
+    prior, prior_texts, prior_manifest = None, None, None
+    if cache is not None:
+        df, texts = cache.get(key), cache.get_texts(key)
+        if df is not None and texts is not None:
+            return df, texts
+        base_key = cache.incremental_base(profile, _sample_conversation_ids(_raw, name))
+        if base_key is not None:
+            prior_manifest = cache.get_manifest(base_key)
+            if prior_manifest is not None:
+                prior, prior_texts = cache.get(base_key), cache.get_texts(base_key)
+
+    use_prior = prior is not None and prior_texts is not None
+    batch = _load_messages_from_upload(_raw, name, branches=options.branches,
+                                       unchanged=prior_manifest if use_prior else None)
+    df = _build_df(batch, options.use_tiktoken, compact=options.compact, encoding=options.encoding,
+                   token_mode=options.token_mode)
+    texts = TextStore.from_batch(batch)
+    if use_prior:
+        bounds = [frame.attrs.get("token_error_bound", 0.0) for frame in (prior, df)]
+        dedup_ratio = df.attrs["category_dedup_ratio"]
+        df, texts = merge_incremental_texts(prior, prior_texts, df, texts, batch)
+        df.attrs["category_dedup_ratio"] = dedup_ratio
+        if any(bounds):
+            # Conservative: the prior's bound also covers rows the merge dropped.
+            df.attrs["token_error_bound"] = float(np.hypot(*bounds))
+    if cache is not None and not df.empty:
+        cache.put(key, df, profile=profile, manifest=batch.manifest(), texts=texts)
+    return df, texts
+
+
+@st.cache_resource(show_spinner=False)
+def _background_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="exact-tokens")
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _exact_tokens_job(key: str, _texts: TextStore, encoding: str) -> Future:
+    """Exact counts for every text of a sampled dataset, computed once per process in the
+    background. Counts already made for the sample come from the memo. A failed job is
+    cleared by the caller, so it is retried rather than kept."""
+    return _background_pool().submit(count_tokens_batch, _texts.iter_texts(), memo=_text_memo(), encoding=encoding)
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _with_exact_tokens(key: str, _df: pd.DataFrame, _job: Future) -> pd.DataFrame:
+    """The sampled frame ``_df`` with the finished job's exact counts swapped in."""
+    counts = _job.result()[_df[TEXT_INDEX_COLUMN].to_numpy()]
+    out = _df.assign(tokens=counts)
+    out.attrs.pop("token_error_bound", None)
+    return compact_dtypes(out) if is_compact(_df) else out
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _category_scores(key: str, _texts: TextStore) -> CategoryScores:
+    """Keyword hits per message and category for a dataset, scored once per process."""
+    return category_scores(_texts.iter_texts(), _rule_pack().matcher)
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _localised(key: str, timezone: str, exact: bool, _df: pd.DataFrame) -> pd.DataFrame:
+    """The timezone-independent frame ``_df`` localised once per dataset, timezone and
+    token source rather than on every rerun."""
+    return apply_timezone(_df, timezone)
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _aggregate_cube(key: str, timezone: str, exact: bool, _df: pd.DataFrame) -> AggregateCube:
+    """The localised frame ``_df`` aggregated once per dataset, timezone and token source,
+    so the Year and date filters only slice cells."""
+    return AggregateCube.from_frame(_df)
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _conversation_days(key: str, timezone: str, exact: bool, split: bool, _df: pd.DataFrame,
+                       _scores: Optional[CategoryScores]) -> ConversationDays:
+    """Per-conversation measures of the localised frame ``_df`` summed by day, so the
+    conversation table is rebuilt from those rows rather than from messages."""
+    return ConversationDays.from_frame(_df, _scores)
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _keyword_counts(key: str, timezone: str, _df: pd.DataFrame, _texts: TextStore) -> KeywordCounts:
+    """Keyword counts per local year and category, counted once per dataset and timezone."""
+    return KeywordCounts.from_frame(_df, _texts)
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _search_index(key: str, _df: pd.DataFrame, _texts: TextStore) -> SearchIndex:
+    """The dataset's inverted index, read from its on-disk cache entry or built on the
+    first search and stored there."""
+    cache = _dataset_cache()
+    index = cache.get_search_index(key) if cache is not None else None
+    if index is None:
+        index = SearchIndex.build(_df, _texts)
+        if cache is not None:
+            cache.put_search_index(key, index)
+    return index
 
 
 def _year_options(df: pd.DataFrame) -> List[str]:
@@ -104,41 +320,85 @@ def _year_options(df: pd.DataFrame) -> List[str]:
     return ["All time"] + years
 
 
-def _filter_df(df: pd.DataFrame, year_choice: str, start: Optional[date], end: Optional[date]) -> pd.DataFrame:
-    out = df
+def _year_filter(year_choice: str) -> Optional[int]:
     if year_choice != "All time":
         try:
-            y = int(year_choice)
-            out = out[out["year"] == y]
-        except Exception:
+            return int(year_choice)
+        except ValueError:
             pass
+    return None
+
+
+def _top_keywords(key: str, timezone: str, df: pd.DataFrame, df_f: pd.DataFrame, texts: TextStore,
+                  year_choice: str, ignore_dates: bool) -> pd.DataFrame:
+    """Top keywords of the filtered messages. A Year filter alone sums cached per-year
+    counts; only a date range recounts the text of ``df_f``."""
+    if not ignore_dates:
+        return top_keywords(df_f, n=25, texts=texts)
+    year = _year_filter(year_choice)
+    counts = _keyword_counts(key, timezone, df, texts)
+    return counts.top(25) if year is None else counts.top(25, year=year)
+
+
+def _filter_df(df: pd.DataFrame, year_choice: str, start: Optional[date], end: Optional[date]) -> pd.DataFrame:
+    """Messages in the chosen year and date range: a contiguous slice of the time-sorted frame."""
+    return day_range(df, *date_bounds(_year_filter(year_choice), start, end))
 
-    if start:
-        out = out[out["created_at"].dt.date >= start]
-    if end:
-        out = out[out["created_at"].dt.date <= end]
 
-    return out
+def _filter_cube(cube: AggregateCube, year_choice: str, start: Optional[date], end: Optional[date]) -> AggregateCube:
+    """``_filter_df`` for the aggregate cube."""
+    return cube.slice(_year_filter(year_choice), start, end)
 
 
-def _render_upload_sidebar() -> tuple[Optional[st.runtime.uploaded_file_manager.UploadedFile], str, bool]:  # type: ignore[name-defined]
-    """Render upload controls and return the chosen file and timezone."""
+def _render_upload_sidebar() -> tuple[Optional[st.runtime.uploaded_file_manager.UploadedFile], str, ProcessingOptions, bool]:  # type: ignore[name-defined]
+    """Render upload controls and return the chosen file, timezone, processing options and
+    whether to fill in exact token counts in the background."""
 
     with st.sidebar:
         st.subheader("Upload")
         uploaded = st.file_uploader("ChatGPT export (.zip) or conversations.json", type=["zip", "json"], key="export_upload")
         timezone = st.text_input("Timezone", value=DEFAULT_TZ, help="Used for grouping by day/hour.", key="timezone")
+        active_only = st.checkbox(
+            "Active thread only",
+            value=False,
+            help="Count only the thread each conversation ended on, ignoring edited and regenerated branches.",
+            key="active_only",
+        )
+        encoding = st.selectbox(
+            "Tokenizer",
+            options=list(SUPPORTED_ENCODINGS),
+            index=SUPPORTED_ENCODINGS.index(TIKTOKEN_ENCODING),
+            help="cl100k_base matches GPT-3.5/GPT-4, o200k_base matches GPT-4o and later models.",
+            key="encoding",
+        )
+        sampled = st.checkbox(
+            "Fast token estimate",
+            value=False,
+            help="Tokenise a sample of messages exactly and estimate the rest. Much faster for very large exports.",
+            key="sampled_tokens",
+        )
+        exact_in_background = sampled and st.checkbox(
+            "Fill in exact counts in the background",
+            value=True,
+            help="Keep counting every message after the first view; exact counts are used once they are ready.",
+            key="exact_in_background",
+        )
         st.markdown(" ")
         hybrid_dna_tag(muted=True)
 
-    _, has_tiktoken, _ = get_token_counter()
-    use_tiktoken = has_tiktoken
+    options = ProcessingOptions(
+        use_tiktoken=get_encoding(encoding) is not None,
+        encoding=encoding,
+        branches=BRANCHES_ACTIVE if active_only else BRANCHES_ALL,
+        token_mode=TOKENS_SAMPLED if sampled else TOKENS_EXACT,
+    )
 
-    return uploaded, timezone, use_tiktoken
+    return uploaded, timezone, options, exact_in_background
 
 
-def _render_filter_sidebar(years: List[str]) -> tuple[str, bool, Optional[date], Optional[date]]:
-    """Render filter inputs separately so they can be shown after data loads."""
+def _render_filter_sidebar(years: List[str]) -> tuple[str, bool, Optional[date], Optional[date], bool]:
+    """Render filter inputs separately so they can be shown after data loads. The last
+    value says whether to split messages across categories by keyword hits."""
 
     default_year = str(date.today().year)
     default_index = years.index(default_year) if default_year in years else 0
@@ -152,11 +412,18 @@ def _render_filter_sidebar(years: List[str]) -> tuple[str, bool, Optional[date],
         ignore_dates = st.checkbox("Ignore date range", value=st.session_state.get("ignore_dates", True), key="ignore_dates")
         start_date = st.date_input("Start date", value=default_start, disabled=ignore_dates, key="start_date")
         end_date = st.date_input("End date", value=default_end, disabled=ignore_dates, key="end_date")
+        split_categories = st.checkbox(
+            "Split messages across categories",
+            value=False,
+            help="Share each message's tokens among every category its keywords hit, not just the first match.",
+            key="split_categories",
+        )
 
-    return year_choice, ignore_dates, start_date, end_date
+    return year_choice, ignore_dates, start_date, end_date, split_categories
 
 
-def _render_archetype_summary(archetype, flair, metrics, token_label: str) -> None:
+def _render_archetype_summary(archetype, flair, metrics, token_label: str,
+                              token_note: str = "Calculated from message text.") -> None:
     container = st.container()
     with container:
         left, right = st.columns([1.25, 1.0], gap="large")
@@ -174,7 +441,7 @@ def _render_archetype_summary(archetype, flair, metrics, token_label: str) -> No
         with right:
             c1, c2, c3 = st.columns(3, gap="small")
             with c1:
-                metric_card(token_label, _format_int(int(metrics.get("tokens", 0))), "Calculated from message text.")
+                metric_card(token_label, _format_int(int(metrics.get("tokens", 0))), token_note)
             with c2:
                 metric_card("Messages", _format_int(int(metrics.get("messages", 0))))
             with c3:
@@ -296,15 +563,32 @@ def _render_deep_dive_tab(ts_df, time_ts_df, by_cat_role, hm):
     st.markdown(" ")
 
 
-def _render_conversation_tab(conv_df):
+def _render_conversation_tab(conv_df, search):
+    """``search(query)`` returns ranked matches (``SearchIndex.search``) under the current filters."""
     container = st.container()
     with container:
-        st.subheader("Top conversations (by token count)")
-        st.markdown(" ")
+        query = st.text_input("Search conversations", key="conversation_query",
+                              placeholder="Words from any message, e.g. docker compose")
+        show = conv_df.head(50)
+        extra = []
         if conv_df.empty:
+            st.subheader("Top conversations (by token count)")
+            st.markdown(" ")
             st.caption("No conversations available under the current filters.")
+        elif query.strip():
+            results = search(query)
+            show = results[["conversation_id", "hits", "snippet"]].merge(conv_df, on="conversation_id", how="inner")
+            show = show.rename(columns={"hits": "Matches", "snippet": "Snippet"})
+            extra = ["Matches", "Snippet"]
+            st.subheader(f"Conversations matching “{query.strip()}”")
+            st.markdown(" ")
+            if show.empty:
+                st.caption("No conversations under the current filters mention those words.")
         else:
-            show = conv_df.head(50).copy()
+            st.subheader("Top conversations (by token count)")
+            st.markdown(" ")
+        if not show.empty:
+            show = show.copy()
             show["first_at"] = show["first_at"].dt.strftime("%Y-%m-%d")
             show["assistant_share"] = (show["assistant_share"] * 100).round(1)
             show = show.rename(
@@ -317,7 +601,7 @@ def _render_conversation_tab(conv_df):
                 }
             )
             st.dataframe(
-                show[["Title", "First message", "Messages", "Tokens", "Assistant share (%)"]],
+                show[["Title", "First message", "Messages", "Tokens", "Assistant share (%)"] + extra],
                 use_container_width=True,
                 height=520,
             )
@@ -325,7 +609,7 @@ def _render_conversation_tab(conv_df):
     st.markdown(" ")
 
 
-def _render_downloads(year_choice, timezone, archetype, metrics, cat_df, ts_df, time_cat_df, time_ts_df, hi, df_f, conv_df):
+def _render_downloads(year_choice, timezone, archetype, metrics, cat_df, ts_df, time_cat_df, time_ts_df, hi, df_f, conv_df, texts):
     container = st.container()
     with container:
         st.subheader("Download your results")
@@ -365,7 +649,8 @@ def _render_downloads(year_choice, timezone, archetype, metrics, cat_df, ts_df,
 
         st.download_button(
             "Download per-message data (CSV)",
-            data=df_f.to_csv(index=False).encode("utf-8"),
+            # Built only when clicked: this is the one place the full message text is needed.
+            data=lambda: with_text(df_f, texts).to_csv(index=False).encode("utf-8"),
             file_name=f"chatgpt_messages_{year_label.replace(' ', '_').lower()}.csv",
             mime="text/csv",
         )
@@ -437,7 +722,7 @@ def main() -> None:
 
     st.write("")
 
-    uploaded, timezone, use_tiktoken = _render_upload_sidebar()
+    uploaded, timezone, options, exact_in_background = _render_upload_sidebar()
 
     if not uploaded:
         st.markdown(
@@ -456,43 +741,79 @@ def main() -> None:
         )
         st.stop()
 
+    try:
+        _rule_pack()
+    except (OSError, ValueError) as e:
+        st.error(f"Could not load the category rules: {e}")
+        st.stop()
+
     upload_name = getattr(uploaded, "name", "") or ""
+    # UploadedFile is a BytesIO over the received bytes; getvalue() hands back that same
+    # object rather than a copy, and the parser reads it in place.
     upload_bytes = uploaded.getvalue()
 
     try:
         with st.spinner("Parsing export..."):
-            messages = _load_messages_from_upload(upload_bytes, upload_name, timezone=timezone)
+            profile = _processing_profile(options)
+            key = dataset_key(_upload_hash(uploaded), profile)
+            base_df, texts = _load_dataset(key, profile, upload_bytes, upload_name, options)
     except Exception as e:
         st.error(f"Could not parse the uploaded file: {e}")
         st.stop()
 
-    df = _build_df(messages, use_tiktoken)
+    token_note = "Calculated from message text."
+    error_bound = base_df.attrs.get("token_error_bound")
+    if error_bound is not None and exact_in_background:
+        job = _exact_tokens_job(key, texts, options.encoding)
+        if not job.done():
+            st.sidebar.caption("Exact token counts are being computed; interact with the page to pick them up.")
+        elif job.exception() is not None:
+            # Drop the failed job so that the next rerun starts a fresh one.
+            _exact_tokens_job.clear(key, texts, options.encoding)
+            st.sidebar.caption(f"Exact token counts failed ({job.exception()}); showing the estimate.")
+        else:
+            base_df, error_bound = _with_exact_tokens(key, base_df, job), None
+    dedup_ratio = base_df.attrs.get("category_dedup_ratio")
+    if dedup_ratio:
+        st.sidebar.caption(f"{dedup_ratio:.0%} of the messages processed repeated earlier text and were categorised once.")
+    if error_bound is not None:
+        token_note = f"Estimated from a sample; all-time total within ±{_format_int(int(error_bound))} (95%)."
+
+    # The cached frame is timezone-independent; it is localised once per timezone and
+    # shared rather than round-tripped through st.cache_data.
+    exact = error_bound is None
+    df = _localised(key, timezone, exact, base_df)
     if df.empty:
         st.warning("No messages found in this export (or messages had no text).")
         st.stop()
 
     # Re-render Year selector with real options after load
     years = _year_options(df)
-    year_choice, ignore_dates, start_date, end_date = _render_filter_sidebar(years)
-
-    df_f = _filter_df(df, year_choice, None if ignore_dates else start_date, None if ignore_dates else end_date)
-
-    conv_df = conversation_level(df_f)
-    metrics = totals(df_f, conv_df)
-    cat_df = tokens_by_category(df_f)
-    by_cat_role = tokens_by_category_and_role(df_f)
-    ts_df = tokens_over_time(df_f, freq="D")
+    year_choice, ignore_dates, start_date, end_date, split_categories = _render_filter_sidebar(years)
+    scores = _category_scores(key, texts) if split_categories else None
+
+    start, end = (None, None) if ignore_dates else (start_date, end_date)
+    df_f = _filter_df(df, year_choice, start, end)
+    cube = _filter_cube(_aggregate_cube(key, timezone, exact, df), year_choice, start, end)
+    conv_days = _conversation_days(key, timezone, exact, split_categories, df, scores).slice(
+        _year_filter(year_choice), start, end)
+
+    conv_df = conv_days.conversation_level()
+    metrics = cube.totals(conv_df)
+    cat_df = conv_days.tokens_by_category() if scores is not None else cube.tokens_by_category()
+    by_cat_role = cube.tokens_by_category_and_role()
+    ts_df = cube.tokens_over_time(freq="D")
     time_cat_df = time_by_category(conv_df)
     time_ts_df = time_over_time(conv_df, freq="D")
-    hm = activity_heatmap(df_f)
-    kw = top_keywords(df_f, n=25)
-    hi = highlights(df_f, conv_df)
+    hm = cube.activity_heatmap()
+    kw = _top_keywords(key, timezone, df, df_f, texts, year_choice, ignore_dates)
+    hi = cube.highlights(conv_df)
 
     archetype = assign_archetype(cat_df)
     flair = add_flair(metrics)
 
     token_label = "Tokens (estimated)"
-    _render_archetype_summary(archetype, flair, metrics, token_label)
+    _render_archetype_summary(archetype, flair, metrics, token_label, token_note)
 
     tab_wrapped, tab_dive, tab_convos, tab_download = st.tabs(["Wrapped", "Deep dive", "Conversations", "Download"])
 
@@ -503,10 +824,12 @@ def main() -> None:
         _render_deep_dive_tab(ts_df, time_ts_df, by_cat_role, hm)
 
     with tab_convos:
-        _render_conversation_tab(conv_df)
+        filtered = None if _year_filter(year_choice) is None and ignore_dates else df_f[TEXT_INDEX_COLUMN].to_numpy()
+        _render_conversation_tab(conv_df, lambda query: _search_index(key, base_df, texts).search(
+            query, limit=50, texts=texts, messages=filtered))
 
     with tab_download:
-        _render_downloads(year_choice, timezone, archetype, metrics, cat_df, ts_df, time_cat_df, time_ts_df, hi, df_f, conv_df)
+        _render_downloads(year_choice, timezone, archetype, metrics, cat_df, ts_df, time_cat_df, time_ts_df, hi, df_f, conv_df, texts)
 
 
 if __name__ == "__main__":
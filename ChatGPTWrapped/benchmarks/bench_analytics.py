@@ -0,0 +1,160 @@
+"""Per-conversation aggregation and the dashboard's aggregate views, old vs new.
+
+Run from the ChatGPTWrapped directory::
+
+    python -m benchmarks.bench_analytics --conversations 5000 20000 50000
+
+Time per conversation should stay flat as the export grows. The views (totals,
+categories, timeline, heatmap, highlights) are timed once per year filter, from the
+filtered messages and from a slice of the ``AggregateCube``; the filter itself with
+boolean masks and with ``day_range``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import export
+from src.analytics import (
+    activity_heatmap,
+    apply_timezone,
+    build_message_dataframe,
+    conversation_level,
+    date_bounds,
+    day_range,
+    highlights,
+    tokens_by_category,
+    tokens_by_category_and_role,
+    tokens_over_time,
+    totals,
+)
+from src.categorise import categorise_series
+from src.cube import AggregateCube, ConversationDays
+from src.parse_export import build_message_batch
+from src.tokens import estimate_tokens_heuristic_vectorised
+
+
+def conversation_level_grouped(df: pd.DataFrame) -> pd.DataFrame:
+    """The reference: role splits and durations computed group by group."""
+
+    def duration_minutes(times: pd.Series, max_gap_minutes: int = 20) -> float:
+        deltas = times.sort_values().diff().dropna()
+        return deltas.clip(upper=pd.Timedelta(minutes=max_gap_minutes)).sum().total_seconds() / 60.0
+
+    g = df.groupby(["conversation_id", "conversation_title"], dropna=False, observed=True)
+    out = g.agg(
+        first_at=("created_at", "min"),
+        last_at=("created_at", "max"),
+        messages=("message_id", "count"),
+        tokens=("tokens", "sum"),
+        words=("words", "sum"),
+        user_tokens=("tokens", lambda s: s[df.loc[s.index, "is_user"]].sum()),
+        assistant_tokens=("tokens", lambda s: s[df.loc[s.index, "is_assistant"]].sum()),
+    ).reset_index()
+    cat_tokens = df.groupby(["conversation_id", "category"], dropna=False, observed=True)["tokens"].sum().reset_index()
+    cat_tokens.sort_values(["conversation_id", "tokens"], ascending=[True, False], inplace=True)
+    primary = cat_tokens.groupby("conversation_id", observed=True).first().reset_index()[["conversation_id", "category"]]
+    durations = g["created_at"].apply(duration_minutes).reset_index(name="duration_minutes")
+    out = (
+        out.merge(durations, on=["conversation_id", "conversation_title"], how="left")
+        .merge(primary, on="conversation_id", how="left")
+        .rename(columns={"category": "primary_category"})
+    )
+    out["assistant_share"] = np.where(out["tokens"] > 0, out["assistant_tokens"] / out["tokens"], np.nan)
+    return out.sort_values("tokens", ascending=False)
+
+
+def filter_with_masks(df: pd.DataFrame, year: int, start: date, end: date) -> pd.DataFrame:
+    """The reference: one boolean mask (and copy) per condition."""
+    df = df[df["year"] == year]
+    df = df[df["created_at"].dt.date >= start]
+    return df[df["created_at"].dt.date <= end]
+
+
+def filter_with_day_range(df: pd.DataFrame, year: int, start: date, end: date) -> pd.DataFrame:
+    return day_range(df, *date_bounds(year, start, end))
+
+
+def views_from_messages(df: pd.DataFrame, year: int, conv_df: pd.DataFrame) -> list:
+    df = df[df["year"] == year]
+    return [totals(df, conv_df), tokens_by_category(df), tokens_by_category_and_role(df),
+            tokens_over_time(df, freq="D"), activity_heatmap(df), highlights(df, conv_df)]
+
+
+def views_from_cube(cube: AggregateCube, year: int, conv_df: pd.DataFrame) -> list:
+    cube = cube.slice(year)
+    return [cube.totals(conv_df), cube.tokens_by_category(), cube.tokens_by_category_and_role(),
+            cube.tokens_over_time(freq="D"), cube.activity_heatmap(), cube.highlights(conv_df)]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--conversations", type=int, nargs="+", default=[5000, 20000, 50000])
+    ap.add_argument("--no-reference", action="store_true", help="Skip the slow per-group reference.")
+    ap.add_argument("--timezone", default="Australia/Melbourne")
+    args = ap.parse_args()
+
+    for n in args.conversations:
+        batch = build_message_batch(export(n))
+        texts = list(batch.iter_texts())
+        extra = {"tokens": estimate_tokens_heuristic_vectorised(texts), "category": categorise_series(texts).array}
+        df = apply_timezone(build_message_dataframe(batch, extra, timezone=None, compact=True, keep_text=False),
+                            args.timezone)
+
+        runs = [("vectorised", conversation_level)]
+        if not args.no_reference:
+            runs.append(("grouped", conversation_level_grouped))
+        results = {}
+        for label, fn in runs:
+            t0 = time.perf_counter()
+            results[label] = fn(df)
+            elapsed = time.perf_counter() - t0
+            print(f"{label:<10} conversations={n:>7,} messages={len(df):>9,}  {elapsed:7.3f}s  "
+                  f"{elapsed / n * 1e6:6.1f}us/conversation")
+        if "grouped" in results:
+            pd.testing.assert_frame_equal(results["vectorised"], results["grouped"], check_exact=True)
+
+        years = sorted(df["year"].unique())
+        for label, fn in (("masks", filter_with_masks), ("day_range", filter_with_day_range)):
+            t0 = time.perf_counter()
+            for year in years:
+                results[label] = fn(df, year, date(year, 3, 1), date(year, 9, 30))
+            elapsed = (time.perf_counter() - t0) / len(years)
+            print(f"{'filter':<10} with {label:<9} {elapsed * 1e3:8.2f}ms per year and date range")
+        pd.testing.assert_frame_equal(results["masks"], results["day_range"])
+
+        t0 = time.perf_counter()
+        cube = AggregateCube.from_frame(df)
+        print(f"{'cube':<10} cells={len(cube):>9,}  built in {time.perf_counter() - t0:7.3f}s")
+        for label, fn, source in (("messages", views_from_messages, df), ("cube", views_from_cube, cube)):
+            t0 = time.perf_counter()
+            for year in years:
+                views = fn(source, year, results["vectorised"])
+            elapsed = (time.perf_counter() - t0) / len(years)
+            print(f"{'views':<10} from {label:<8}  {elapsed * 1e3:8.1f}ms per year filter")
+            results[label] = views
+        for a, b in zip(results["messages"], results["cube"]):
+            if isinstance(a, pd.DataFrame):
+                pd.testing.assert_frame_equal(a, b, check_exact=True)
+
+        t0 = time.perf_counter()
+        days = ConversationDays.from_frame(df)
+        print(f"{'conv days':<10} rows={len(days):>9,}  built in {time.perf_counter() - t0:7.3f}s")
+        tables = {}
+        for label, fn in (("messages", lambda year: conversation_level(df[df["year"] == year])),
+                          ("days", lambda year: days.slice(year).conversation_level())):
+            t0 = time.perf_counter()
+            tables[label] = [fn(year) for year in years]
+            elapsed = (time.perf_counter() - t0) / len(years)
+            print(f"{'conv table':<10} from {label:<8}  {elapsed * 1e3:8.1f}ms per year filter")
+        for a, b in zip(tables["messages"], tables["days"]):
+            pd.testing.assert_frame_equal(a.reset_index(drop=True), b.reset_index(drop=True), check_exact=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Rule-by-rule categorisation loop vs the single-pass CategoryMatcher and categorise_series.
+
+Run from the ChatGPTWrapped directory::
+
+    python -m benchmarks.bench_categorise --conversations 2000 --prose-share 0.3 --duplicate-share 0.2
+
+``series+memo`` runs twice through one ``TextMemo``: cold, then as a re-import would.
+
+The per-rule table is for the pack in ``CHATGPT_WRAPPED_RULES_PATH`` (default: built in).
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from collections import Counter
+
+from benchmarks.synthetic import export, prose_text
+from src.categorise import DEFAULT_CATEGORY, RULES, categorise, categorise_series, rule_pack_from_env
+from src.memo import TextMemo
+from src.parse_export import build_message_batch
+
+
+def categorise_loop(text: str) -> str:
+    """The matcher's reference: each rule's regex searched in order."""
+    if not text:
+        return DEFAULT_CATEGORY
+    for r in RULES:
+        if r.pattern.search(text):
+            return r.name
+    return DEFAULT_CATEGORY
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--conversations", type=int, default=2000)
+    ap.add_argument("--prose-share", type=float, default=0.3,
+                    help="Extra share of keyword-free messages, which fall through every rule.")
+    ap.add_argument("--duplicate-share", type=float, default=0.2,
+                    help="Share of messages replaced by a copy of another (repeated prompts, regenerations).")
+    args = ap.parse_args()
+
+    texts = list(build_message_batch(export(args.conversations)).iter_texts())
+    rng = random.Random(1)
+    texts += [prose_text(rng) for _ in range(int(len(texts) * args.prose_share))]
+    for i in rng.sample(range(len(texts)), int(len(texts) * args.duplicate_share)):
+        texts[i] = texts[rng.randrange(len(texts))]
+    rng.shuffle(texts)
+
+    results = {}
+    for label, fn in (("loop", categorise_loop), ("matcher", categorise)):
+        t0 = time.perf_counter()
+        results[label] = [fn(t) for t in texts]
+        elapsed = time.perf_counter() - t0
+        print(f"{label:<8} messages={len(texts):>9,}  {elapsed:7.3f}s  {elapsed / len(texts) * 1e6:6.1f}us/message")
+    assert results["loop"] == results["matcher"]
+    share = Counter(results["matcher"])
+    print("default bucket share: {:.1%}".format(share[DEFAULT_CATEGORY] / len(texts)))
+
+    matcher = rule_pack_from_env().matcher
+    matcher.reset_stats()
+    t0 = time.perf_counter()
+    series = categorise_series(texts, matcher)
+    elapsed = time.perf_counter() - t0
+    print(f"{'series':<8} messages={len(texts):>9,}  {elapsed:7.3f}s  {elapsed / len(texts) * 1e6:6.1f}us/message")
+    if matcher.rules == RULES:
+        assert series.astype(object).tolist() == results["loop"]
+    rule_stats = matcher.stats()
+
+    memo = TextMemo()
+    for label in ("cold", "warm"):
+        t0 = time.perf_counter()
+        memoised = categorise_series(texts, matcher, memo=memo)
+        elapsed = time.perf_counter() - t0
+        dedup = memoised.attrs["dedup"]
+        print(f"{'series+memo':<8} ({label}) {elapsed:7.3f}s  {elapsed / len(texts) * 1e6:6.1f}us/message  "
+              f"duplicates={dedup.dedup_ratio:.1%}  matched={dedup.matched:,}")
+        assert memoised.equals(series)
+
+    print(f"\n{'rule':<40} {'hits':>9} {'searches':>9} {'seconds':>8}")
+    for stats in rule_stats:
+        print(f"{stats.name[:40]:<40} {stats.hits:>9,} {stats.searches:>9,} {stats.search_seconds:8.3f}")
+
+
+if __name__ == "__main__":
+    main()
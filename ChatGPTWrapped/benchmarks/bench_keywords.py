@@ -0,0 +1,89 @@
+"""Top keywords: one joined string vs block-wise counting, and cached per-year counts.
+
+Run from the ChatGPTWrapped directory::
+
+    python -m benchmarks.bench_keywords --conversations 20000 --workers 1 4
+
+Peak memory is traced allocation (``tracemalloc``) on top of the loaded dataset; it
+should stay flat for the block-wise counts as the export grows.
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+import time
+import tracemalloc
+
+import pandas as pd
+
+from benchmarks.synthetic import export
+from src.analytics import apply_timezone, build_message_dataframe, top_keywords
+from src.categorise import categorise_series
+from src.keywords import KEYWORD_STOPWORDS, KeywordCounts
+from src.parse_export import build_message_batch
+from src.text_store import TextStore, message_texts
+from src.tokens import estimate_tokens_heuristic_vectorised
+
+
+def top_keywords_joined(df: pd.DataFrame, n: int = 25, texts: TextStore = None) -> pd.DataFrame:
+    """The reference: every message joined, lowercased and tokenised in one go."""
+    text = " ".join(message_texts(df, texts).astype(str).tolist()).lower()
+    words = re.findall(r"[a-z0-9_']{3,}", text)
+    words = [w for w in words if w not in KEYWORD_STOPWORDS and not w.isdigit() and "_" not in w]
+    s = pd.Series(words).value_counts().head(n).reset_index()
+    s.columns = ["keyword", "count"]
+    return s
+
+
+def measure(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    fn(*args, **kwargs)
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    result = fn(*args, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--conversations", type=int, default=20000)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1])
+    ap.add_argument("--no-reference", action="store_true", help="Skip the joined-string reference (it needs"
+                    " several times the text size in memory).")
+    ap.add_argument("--timezone", default="Australia/Melbourne")
+    args = ap.parse_args()
+
+    batch = build_message_batch(export(args.conversations))
+    texts = TextStore.from_batch(batch)
+    extra = {"tokens": estimate_tokens_heuristic_vectorised(list(batch.iter_texts())),
+             "category": categorise_series(batch.iter_texts()).array}
+    df = apply_timezone(build_message_dataframe(batch, extra, timezone=None, compact=True, keep_text=False),
+                        args.timezone)
+    print(f"{len(df):,} messages, {texts.nbytes / 2**20:,.1f} MB of text")
+
+    runs = [] if args.no_reference else [("joined", top_keywords_joined, {})]
+    runs += [(f"blocks w={w}", top_keywords, {"workers": w}) for w in args.workers]
+    results = {}
+    for label, fn, kwargs in runs:
+        results[label], elapsed, peak = measure(fn, df, 25, texts, **kwargs)
+        print(f"{label:<14} {elapsed:7.3f}s  peak {peak / 2**20:8.1f} MB")
+    reference = results.pop("joined", None)
+    for label, top in results.items():
+        # value_counts leaves ties in arbitrary order; the counts must agree.
+        assert reference is None or top["count"].tolist() == reference["count"].tolist(), label
+
+    counts, elapsed, peak = measure(KeywordCounts.from_frame, df, texts, workers=max(args.workers))
+    print(f"{'partitions':<14} {elapsed:7.3f}s  peak {peak / 2**20:8.1f} MB  "
+          f"{len(counts)} partitions, {len(counts.vocabulary):,} words")
+    years = sorted(df["year"].unique())
+    t0 = time.perf_counter()
+    for year in years:
+        counts.top(25, year=year)
+    print(f"{'top per year':<14} {(time.perf_counter() - t0) / len(years) * 1e3:7.2f}ms from the partitions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Memory use of the per-message frame: plain vs compact schema.
+
+Run from the ChatGPTWrapped directory::
+
+    python -m benchmarks.bench_memory --conversations 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+
+import numpy as np
+
+from benchmarks.synthetic import export
+from src.analytics import apply_timezone, build_message_dataframe, memory_report
+from src.categorise import categorise
+from src.parse_export import build_message_batch
+from src.tokens import estimate_tokens_heuristic
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--conversations", type=int, default=20000)
+    ap.add_argument("--timezone", default="Australia/Melbourne")
+    args = ap.parse_args()
+
+    batch = build_message_batch(export(args.conversations))
+    texts = list(batch.iter_texts())
+    extra = {
+        "tokens": np.array([estimate_tokens_heuristic(t) for t in texts], dtype=np.int64),
+        "category": np.array([categorise(t) for t in texts], dtype=object),
+    }
+    plain = apply_timezone(build_message_dataframe(batch, extra, timezone=None), args.timezone)
+    compact = apply_timezone(build_message_dataframe(batch, extra, timezone=None, compact=True), args.timezone)
+
+    report = memory_report(plain, compact)
+    report["MB_before"] = report.pop("bytes_before") / 2**20
+    report["MB_after"] = report.pop("bytes_after") / 2**20
+    print(f"{len(plain):,} messages")
+    print(report.to_string(index=False, float_format=lambda v: f"{v:,.2f}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Serial vs process-pool parsing of a synthetic export.
+
+Run from the ChatGPTWrapped directory::
+
+    python -m benchmarks.bench_parse --conversations 20000 --workers 1 4 8 16
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import export
+from src.parse_export import build_message_batch
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--conversations", type=int, default=20000)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    conversations = export(args.conversations)
+    baseline = None
+    serial_best = None
+    for workers in args.workers:
+        best = float("inf")
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            batch = build_message_batch(conversations, workers=workers)
+            best = min(best, time.perf_counter() - t0)
+        if baseline is None:
+            baseline = batch
+        else:
+            assert np.array_equal(batch.created_at_us, baseline.created_at_us)
+            assert bytes(batch.text_buffer) == bytes(baseline.text_buffer)
+        serial_best = serial_best or best
+        print(f"workers={workers:>2}  messages={len(batch):>9,}  best={best:7.3f}s  speedup={serial_best / best:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Conversation search: scanning message text vs the inverted SearchIndex.
+
+Run from the ChatGPTWrapped directory::
+
+    python -m benchmarks.bench_search --conversations 20000
+
+Query time from the index depends on how many messages use the query's terms, not on
+the size of the export; the scan reads every message.
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import export
+from src.analytics import build_message_dataframe
+from src.parse_export import build_message_batch
+from src.search import SearchIndex, search_terms
+from src.text_store import TextStore
+
+QUERIES = ["python", "error traceback", "recipe dinner holiday", "kubernetes"]
+
+
+def scan_conversations(df: pd.DataFrame, texts: TextStore, query: str) -> set:
+    """The reference: conversations with a message mentioning any query keyword."""
+    terms = search_terms(query)
+    if not terms:
+        return set()
+    pattern = re.compile(rf"(?<![a-z0-9_'])(?:{'|'.join(map(re.escape, terms))})(?![a-z0-9_'])")
+    hits = [bool(pattern.search(t.lower())) for t in texts.iter_texts(df["msg_idx"].to_numpy())]
+    return set(df.loc[np.asarray(hits, dtype=bool), "conversation_id"].astype(str))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--conversations", type=int, default=20000)
+    ap.add_argument("--queries", nargs="+", default=QUERIES)
+    args = ap.parse_args()
+
+    batch = build_message_batch(export(args.conversations))
+    texts = TextStore.from_batch(batch)
+    n = len(texts)
+    extra = {"tokens": np.zeros(n, dtype=np.int64), "category": np.full(n, "Other", dtype=object)}
+    df = build_message_dataframe(batch, extra, timezone=None, compact=True, keep_text=False)
+
+    t0 = time.perf_counter()
+    index = SearchIndex.build(df, texts)
+    print(f"{len(df):,} messages, {texts.nbytes / 2**20:,.1f} MB of text; index of {len(index):,} terms "
+          f"in {index.nbytes / 2**20:,.1f} MB, built in {time.perf_counter() - t0:.2f}s")
+
+    for query in args.queries:
+        t0 = time.perf_counter()
+        results = index.search(query, limit=50, texts=texts)
+        indexed = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        scanned = scan_conversations(df, texts, query)
+        scan = time.perf_counter() - t0
+        matches = index.search(query, limit=len(index.conversations))
+        assert set(matches["conversation_id"]) == scanned, query
+        print(f"{query!r:<26} {len(matches):>7,} conversations  index {indexed * 1e3:8.1f}ms  "
+              f"scan {scan * 1e3:9.1f}ms  (top {len(results)} with snippets)")
+
+
+if __name__ == "__main__":
+    main()
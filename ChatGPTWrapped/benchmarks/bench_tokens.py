@@ -0,0 +1,69 @@
+"""Per-message token counting loop vs count_tokens_batch (and the sampled estimate).
+
+Run from the ChatGPTWrapped directory (needs tiktoken and its cl100k_base file)::
+
+    python -m benchmarks.bench_tokens --conversations 5000 --threads 1 4 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import export
+from src.parse_export import build_message_batch
+from src.tokens import (
+    TIKTOKEN_ENCODING,
+    TOKEN_BATCH_SIZE,
+    TOKEN_SAMPLE_SIZE,
+    count_tokens_batch,
+    encoder_stats,
+    estimate_tokens_sampled,
+    get_token_counter,
+)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--conversations", type=int, default=5000)
+    ap.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--batch-size", type=int, default=TOKEN_BATCH_SIZE)
+    ap.add_argument("--encoding", default=TIKTOKEN_ENCODING)
+    ap.add_argument("--sample-size", type=int, default=TOKEN_SAMPLE_SIZE)
+    args = ap.parse_args()
+
+    counter, has_tiktoken, err = get_token_counter(encoding=args.encoding)
+    if not has_tiktoken:
+        print(f"tiktoken unavailable ({err}); timing the heuristic instead")
+    batch = build_message_batch(export(args.conversations))
+    texts = list(batch.iter_texts())
+
+    t0 = time.perf_counter()
+    expected = np.array([counter(t) for t in texts], dtype=np.int64)
+    loop = time.perf_counter() - t0
+    print(f"loop        messages={len(texts):>9,}  {loop:7.3f}s")
+
+    for threads in args.threads:
+        t0 = time.perf_counter()
+        counts = count_tokens_batch(
+            texts, use_tiktoken=has_tiktoken, batch_size=args.batch_size, num_threads=threads, encoding=args.encoding
+        )
+        elapsed = time.perf_counter() - t0
+        assert np.array_equal(counts, expected)
+        print(f"threads={threads:>2}  messages={len(texts):>9,}  {elapsed:7.3f}s  speedup={loop / elapsed:5.2f}x")
+
+    t0 = time.perf_counter()
+    sampled = estimate_tokens_sampled(texts, batch.column("role"), sample_size=args.sample_size, encoding=args.encoding)
+    elapsed = time.perf_counter() - t0
+    error = int(sampled.counts.sum() - expected.sum())
+    print(f"sampled     messages={len(texts):>9,}  {elapsed:7.3f}s  speedup={loop / elapsed:5.2f}x  "
+          f"exact={int(sampled.exact.sum()):,}  error={error:+,}  bound=±{sampled.error_bound:,.0f}")
+
+    for name, stats in encoder_stats().items():
+        print(f"{name}: loaded in {stats.load_seconds:.3f}s, {stats.tokens:,} tokens at {stats.tokens_per_second:,.0f}/s")
+
+
+if __name__ == "__main__":
+    main()
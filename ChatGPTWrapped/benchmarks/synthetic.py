@@ -0,0 +1,83 @@
+"""Synthetic ChatGPT exports for the benchmark scripts.
+
+The generated conversations follow the shape of a real ``conversations.json``
+(a ``mapping`` of nodes with ``parent``/``children`` links, occasional regenerated
+branches, mixed ``parts`` content) with a long-tailed message length distribution.
+"""
+
+from __future__ import annotations
+
+import random
+from typing import Any, Dict, List
+
+_WORDS = (
+    "the a to and of it is for you that this with can on be data table query postgres select join index "
+    "streamlit api error traceback dependency canonical dedupe chatgpt prompt model gdpr privacy dashboard "
+    "kpi reporting valuation linkedin blog holiday recipe garden running coffee travel music book idea plan "
+    "week meeting email draft summary list review budget team customer product feature release"
+).split()
+
+# Everyday chat with no category keywords, which falls through every rule.
+_PROSE_WORDS = (
+    "the a to and of it is for you that this with can on be holiday recipe garden running coffee travel "
+    "music book idea plan week weekend dinner family friend walk movie song trip morning"
+).split()
+
+_CODE = "```python\nimport pandas as pd\n\ndef load(path):\n    return pd.read_csv(path)\n```"
+
+# Words per message: mostly short prompts, a long tail of pasted documents and code.
+_LENGTHS = (4, 12, 30, 80, 200, 500, 1500)
+_LENGTH_WEIGHTS = (20, 25, 20, 15, 10, 7, 3)
+
+
+def message_text(rng: random.Random) -> str:
+    n = rng.choices(_LENGTHS, weights=_LENGTH_WEIGHTS)[0]
+    text = " ".join(rng.choice(_WORDS) for _ in range(n))
+    if rng.random() < 0.15:
+        text += "\n" + _CODE
+    return text
+
+
+def prose_text(rng: random.Random) -> str:
+    n = rng.choices(_LENGTHS, weights=_LENGTH_WEIGHTS)[0]
+    return " ".join(rng.choice(_PROSE_WORDS) for _ in range(n))
+
+
+def conversation(rng: random.Random, index: int, start: float = 1_672_531_200.0) -> Dict[str, Any]:
+    root = f"root-{index}"
+    mapping: Dict[str, Dict[str, Any]] = {root: {"id": root, "message": None, "parent": None, "children": []}}
+    t = start + rng.random() * 3 * 365 * 86400
+    parent = root
+    for turn in range(rng.randint(2, 24)):
+        role = "user" if turn % 2 == 0 else "assistant"
+        # Assistant replies are occasionally regenerated, leaving sibling branches.
+        siblings = 2 if role == "assistant" and rng.random() < 0.1 else 1
+        for sibling in range(siblings):
+            node_id = f"{index}-{turn}-{sibling}"
+            t += rng.random() * 600
+            mapping[node_id] = {
+                "id": node_id,
+                "message": {
+                    "id": node_id,
+                    "author": {"role": role},
+                    "create_time": t,
+                    "content": {"content_type": "text", "parts": [message_text(rng)]},
+                },
+                "parent": parent,
+                "children": [],
+            }
+            mapping[parent]["children"].append(node_id)
+        parent = node_id
+    return {
+        "id": f"conv-{index}",
+        "title": f"Conversation {index % 997}",
+        "create_time": start,
+        "update_time": t,
+        "mapping": mapping,
+        "current_node": parent,
+    }
+
+
+def export(n_conversations: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    return [conversation(rng, i) for i in range(n_conversations)]
@@ -1,77 +1,385 @@
 from __future__ import annotations
 
-from typing import Dict, List
+from datetime import date, timedelta
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
+from dateutil import tz
+from pandas.tseries.frequencies import to_offset
+from pandas.tseries.offsets import Tick
+
+from .categorise import CategoryScores
+from .keywords import keyword_counts, top_counts
+from .parse_export import MessageBatch
+from .text_store import TEXT_INDEX_COLUMN, TextStore
+
+
+DEFAULT_TIMEZONE = "Australia/Melbourne"
+CALENDAR_COLUMNS = ["date", "day", "year", "month", "dow", "hour"]
+_NS_PER_HOUR = 3_600_000_000_000
+_NS_PER_DAY = 24 * _NS_PER_HOUR
+_EPOCH = date(1970, 1, 1)
+_DAY_NAMES = np.array(["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"], dtype=object)
+# Low-cardinality string columns stored as categoricals in compact frames.
+COMPACT_CATEGORY_COLUMNS = ["conversation_id", "conversation_title", "role", "category"]
+# Integer columns narrowed in compact frames. Widths are picked from the column total so
+# that any sum over a subset of rows (resample, pivot...) fits as well.
+COMPACT_INT_COLUMNS = ["tokens", "words"]
+# Longest gap between two messages of a conversation counted as active time.
+MAX_GAP_MINUTES = 20
+
+
+def _utc_from_epoch_us(epoch_us: np.ndarray) -> pd.Series:
+    return pd.Series(pd.to_datetime(epoch_us, unit="us", utc=True))
+
+
+def _utc_from_epoch_seconds(seconds: pd.Series) -> pd.Series:
+    # Split into whole seconds and a rounded microsecond fraction so the result
+    # matches datetime.fromtimestamp rather than float nanosecond rounding.
+    values = pd.to_numeric(seconds, errors="coerce").to_numpy(dtype=np.float64)
+    finite = np.isfinite(values)
+    frac, whole = np.modf(np.where(finite, values, 0.0))
+    epoch_us = whole.astype(np.int64) * 1_000_000 + np.round(frac * 1e6).astype(np.int64)
+    return _utc_from_epoch_us(epoch_us).where(finite).set_axis(seconds.index)
+
+
+def _frame_from_batch(batch: MessageBatch, extra_columns: Optional[Mapping[str, Any]] = None) -> pd.DataFrame:
+    """Wrap a MessageBatch column by column, without building per-row dicts."""
+    if not len(batch):
+        return pd.DataFrame()
+
+    columns: Dict[str, Any] = {
+        "conversation_id": batch.column("conversation_id"),
+        "conversation_title": batch.column("conversation_title"),
+        "message_id": batch.message_ids,
+        "role": batch.column("role"),
+        "created_at": _utc_from_epoch_us(batch.created_at_us),
+        "text": np.fromiter(batch.iter_texts(), dtype=object, count=len(batch)),
+    }
+    columns.update(extra_columns or {})
+    return pd.DataFrame(columns)
+
+
+def _smallest_int(values: np.ndarray) -> np.dtype:
+    bound = max(int(np.abs(values).sum()), int(np.abs(values).max(initial=0)))
+    for dtype in (np.int8, np.int16, np.int32):
+        if bound <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
 
+def is_compact(df: pd.DataFrame) -> bool:
+    """Whether ``df`` uses the compact schema (see ``compact_dtypes``)."""
+    return "role" in df.columns and isinstance(df["role"].dtype, pd.CategoricalDtype)
 
-def build_message_dataframe(rows: List[Dict]) -> pd.DataFrame:
-    df = pd.DataFrame(rows)
+
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Return ``df`` with the compact schema: categoricals for repeated strings, narrow ints.
+
+    Categories are sorted, so grouping keeps the same order as on plain strings. Calendar
+    columns, if present, are converted too (``date`` becomes midnight ``datetime64[s]``,
+    pandas having no day resolution). Already compact columns are re-checked, which
+    widens integers again when a merge has outgrown them and drops categories no row
+    uses any more.
+    """
+    if df.empty:
+        return df
+    out = df.copy(deep=False)
+    for name in COMPACT_CATEGORY_COLUMNS:
+        if name not in out.columns:
+            continue
+        if isinstance(out[name].dtype, pd.CategoricalDtype):
+            out[name] = out[name].cat.remove_unused_categories()
+        else:
+            out[name] = out[name].astype("category")
+    for name in COMPACT_INT_COLUMNS:
+        if name in out.columns:
+            values = out[name].to_numpy()
+            out[name] = values.astype(_smallest_int(values), copy=False)
+    if "date" in out.columns:
+        out["date"] = pd.to_datetime(out["date"]).astype("datetime64[s]")
+    if "year" in out.columns:
+        out["year"] = out["year"].astype(np.int16)
+    if "month" in out.columns and not isinstance(out["month"].dtype, pd.CategoricalDtype):
+        out["month"] = out["month"].astype("category")
+    if "dow" in out.columns:
+        out["dow"] = pd.Categorical(out["dow"], categories=_DAY_NAMES, ordered=True)
+    if "hour" in out.columns:
+        out["hour"] = out["hour"].astype(np.int8)
+    return out
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    """Per-column dtype and deep memory use of two versions of a frame, plus a total row."""
+    b = before.memory_usage(index=True, deep=True)
+    a = after.memory_usage(index=True, deep=True)
+    report = pd.DataFrame({
+        "dtype_before": before.dtypes.astype(str),
+        "bytes_before": b,
+        "dtype_after": after.dtypes.astype(str),
+        "bytes_after": a,
+    }).rename_axis("column").reset_index().fillna({"dtype_before": "", "dtype_after": ""})
+    report.loc[len(report)] = ["total", "", int(b.sum()), "", int(a.sum())]
+    report["ratio"] = report["bytes_before"] / report["bytes_after"].where(report["bytes_after"] > 0)
+    return report
+
+
+def apply_timezone(df: pd.DataFrame, timezone: str, compact: Optional[bool] = None) -> pd.DataFrame:
+    """Return a copy of ``df`` with ``created_at`` in ``timezone`` and the calendar columns re-derived.
+
+    This is one vectorised conversion over the column, so changing timezone never
+    re-parses or re-tokenises the export. Calendar values are looked up from a table
+    of the days spanned by the data rather than built per row. ``compact`` selects
+    the compact calendar dtypes and defaults to whatever schema ``df`` already uses.
+
+    Rows come back sorted by ``created_at`` (frames from ``build_message_dataframe``
+    already are), with ``day`` holding the local date as days since 1970-01-01, so
+    ``day_range`` can filter by binary search.
+    """
     if df.empty:
         return df
+    if compact is None:
+        compact = is_compact(df)
+
+    if not df["created_at"].is_monotonic_increasing:
+        df = df.sort_values("created_at", kind="stable")
+    created_at = df["created_at"]
+    if created_at.dt.tz is None:
+        created_at = created_at.dt.tz_localize(tz.tzlocal(), ambiguous="NaT", nonexistent="NaT")
+
+    tzinfo = tz.gettz(timezone)
+    if tzinfo is None:
+        # Unknown zone: behave like datetime.fromtimestamp(tz=None), i.e. naive local time.
+        local = created_at.dt.tz_convert(tz.tzlocal()).dt.tz_localize(None)
+        wall = local
+    else:
+        local = created_at.dt.tz_convert(tzinfo)
+        wall = local.dt.tz_localize(None)
+
+    keep = local.notna().to_numpy()
+    if not keep.all():
+        df, local, wall = df[keep], local[keep], wall[keep]
+
+    # Everything below is integer arithmetic on the wall-clock nanoseconds plus small
+    # lookup tables spanning the distinct days, never per-row Python objects.
+    wall_ns = wall.to_numpy(dtype="datetime64[ns]").view(np.int64)
+    days = wall_ns // _NS_PER_DAY
+    first_day = int(days.min()) if len(days) else 0
+    day_index = days - first_day
+    span = np.arange(first_day, first_day + int(day_index.max(initial=0)) + 1).astype("datetime64[D]")
+
+    years = span.astype("datetime64[Y]").astype(np.int64) + 1970
+    months = np.datetime_as_string(span.astype("datetime64[M]"), unit="M").astype(object)
+    dow = (days + 3) % 7  # 1970-01-01 was a Thursday
+    hour = (wall_ns - days * _NS_PER_DAY) // _NS_PER_HOUR
+    if compact:
+        month_names, month_codes = np.unique(months, return_inverse=True)
+        calendar = {
+            "date": span.astype("datetime64[s]")[day_index],
+            "day": days,
+            "year": years.astype(np.int16)[day_index],
+            "month": pd.Categorical.from_codes(month_codes[day_index], categories=month_names),
+            "dow": pd.Categorical.from_codes(dow, categories=_DAY_NAMES, ordered=True),
+            "hour": hour.astype(np.int8),
+        }
+    else:
+        calendar = {
+            "date": span.astype(object)[day_index],
+            "day": days,
+            "year": years.astype(np.int32)[day_index],
+            "month": months[day_index],
+            "dow": _DAY_NAMES[dow],
+            "hour": hour.astype(np.int32),
+        }
 
-    df["created_at"] = pd.to_datetime(df["created_at"], utc=False, errors="coerce")
-    df = df.dropna(subset=["created_at"])
-    df["date"] = df["created_at"].dt.date
-    df["year"] = df["created_at"].dt.year
-    df["month"] = df["created_at"].dt.to_period("M").astype(str)
-    df["dow"] = df["created_at"].dt.day_name()
-    df["hour"] = df["created_at"].dt.hour
+    # A shallow copy keeps the untouched columns (text in particular) shared with df.
+    out = df.copy(deep=False)
+    out["created_at"] = local
+    at = out.columns.get_loc("is_user") if "is_user" in out.columns else len(out.columns)
+    for name in CALENDAR_COLUMNS:
+        if name in out.columns:
+            out[name] = calendar[name]
+        else:
+            out.insert(at, name, calendar[name])
+            at += 1
+    return out
+
+
+def day_ordinal(d: date) -> int:
+    """``d`` as days since 1970-01-01, the unit of the ``day`` column."""
+    return (d - _EPOCH).days
+
+
+def date_bounds(year: Optional[int], start: Optional[date], end: Optional[date]) -> Tuple[Optional[date], Optional[date]]:
+    """``start`` and ``end`` narrowed to ``year`` (None leaves either side open)."""
+    if year is not None:
+        start = max(start, date(year, 1, 1)) if start else date(year, 1, 1)
+        end = min(end, date(year, 12, 31)) if end else date(year, 12, 31)
+    return start, end
+
+
+def day_range(df: pd.DataFrame, first: Optional[date] = None, last: Optional[date] = None) -> pd.DataFrame:
+    """Rows of a frame from ``apply_timezone`` whose local date is between ``first`` and
+    ``last`` inclusive (either may be None), found by binary search on ``day`` and
+    returned as a slice rather than a filtered copy."""
+    day = df["day"].to_numpy()
+    lo = int(np.searchsorted(day, day_ordinal(first), side="left")) if first else 0
+    hi = int(np.searchsorted(day, day_ordinal(last), side="right")) if last else len(day)
+    return df.iloc[lo:max(lo, hi)]
+
+
+def build_message_dataframe(rows: Union[List[Dict], MessageBatch],
+                            extra_columns: Optional[Mapping[str, Any]] = None,
+                            timezone: Optional[str] = DEFAULT_TIMEZONE,
+                            compact: bool = False,
+                            keep_text: bool = True) -> pd.DataFrame:
+    """Build the per-message frame from row dicts or, preferably, a columnar MessageBatch.
+
+    ``extra_columns`` holds per-message arrays (e.g. tokens, category) aligned with ``rows``.
+    ``created_at`` is kept in UTC and converted by ``apply_timezone``; pass
+    ``timezone=None`` to get the timezone-independent frame without calendar columns.
+    ``compact=True`` returns the compact schema described in ``compact_dtypes``.
+    ``keep_text=False`` replaces ``text`` with a ``msg_idx`` column of row positions in
+    ``rows``, for use with a ``TextStore`` built from the same rows.
+    """
+    if isinstance(rows, MessageBatch):
+        df = _frame_from_batch(rows, extra_columns)
+    else:
+        df = pd.DataFrame(rows)
+        for name, values in (extra_columns or {}).items():
+            df[name] = values
+    if df.empty:
+        return df
+    if not keep_text:
+        df.insert(df.columns.get_loc("text"), TEXT_INDEX_COLUMN, np.arange(len(df), dtype=np.int64))
+
+    if pd.api.types.is_numeric_dtype(df["created_at"]):
+        df["created_at"] = _utc_from_epoch_seconds(df["created_at"])
+    else:
+        df["created_at"] = pd.to_datetime(df["created_at"], utc=False, errors="coerce")
+    # Chronological order lets localised frames be filtered by binary search (day_range).
+    df = df.dropna(subset=["created_at"]).sort_values("created_at", kind="stable", ignore_index=True)
     df["is_user"] = df["role"].eq("user")
     df["is_assistant"] = df["role"].eq("assistant")
     df["words"] = df["text"].fillna("").astype(str).str.split().map(len)
-
-    return df
-
-
-def conversation_level(df: pd.DataFrame) -> pd.DataFrame:
+    if not keep_text:
+        df = df.drop(columns="text")
+    if compact:
+        df = compact_dtypes(df)
+
+    return apply_timezone(df, timezone) if timezone is not None else df
+
+
+def _aligned_scores(df: pd.DataFrame, scores: CategoryScores) -> CategoryScores:
+    """``scores`` rows for ``df``'s rows: through ``msg_idx`` for frames that keep their
+    text in a ``TextStore``, otherwise by position (scores built from ``df["text"]``)."""
+    if TEXT_INDEX_COLUMN in df.columns:
+        return scores.take(df[TEXT_INDEX_COLUMN].to_numpy())
+    if len(scores) != len(df):
+        raise ValueError("Scores must be built from this frame's text, or the frame must carry msg_idx.")
+    return scores
+
+
+def scored_tokens(df: pd.DataFrame, scores: CategoryScores) -> Tuple[CategoryScores, np.ndarray]:
+    """Aligned scores and each entry's tokens: its message's tokens times its hit share."""
+    aligned = _aligned_scores(df, scores)
+    tokens = df["tokens"].to_numpy(dtype=np.float64)
+    return aligned, aligned.shares() * np.repeat(tokens, np.diff(aligned.indptr))
+
+
+def apportion(weights: np.ndarray, total: int) -> np.ndarray:
+    """Round non-negative ``weights`` summing to ``total`` to integers with the same sum
+    (largest remainder first)."""
+    floor = np.floor(weights).astype(np.int64)
+    remainder = int(total) - int(floor.sum())
+    if remainder > 0:
+        floor[np.argsort(-(weights - floor), kind="stable")[:remainder]] += 1
+    return floor
+
+
+def _scored_primary_category(df: pd.DataFrame, scores: CategoryScores) -> pd.DataFrame:
+    aligned, weights = scored_tokens(df, scores)
+    conv_codes, conv_ids = pd.factorize(df["conversation_id"])
+    rows = aligned.row_ids()
+    k = len(aligned.categories)
+    keys = conv_codes[rows] * k + aligned.indices
+    by_tokens = np.bincount(keys, weights=weights, minlength=len(conv_ids) * k).reshape(-1, k)
+    # Conversations without tokens fall back to hit shares. Ties go to the first category.
+    by_hits = np.bincount(keys, weights=aligned.shares(), minlength=len(conv_ids) * k).reshape(-1, k)
+    best = np.where(by_tokens.max(axis=1) > 0, by_tokens.argmax(axis=1), by_hits.argmax(axis=1))
+    category = pd.Series(np.asarray(aligned.categories, dtype=object)[best])
+    if isinstance(df["category"].dtype, pd.CategoricalDtype):
+        category = category.astype("category")
+    return pd.DataFrame({"conversation_id": conv_ids, "category": category})
+
+
+def minutes_from_ns(total_ns: np.ndarray) -> np.ndarray:
+    """Integer nanoseconds as float minutes, rounded as ``Timedelta.total_seconds`` does:
+    whole seconds plus truncated microseconds."""
+    total_us = total_ns // 1_000
+    return (total_us // 1_000_000 + (total_us % 1_000_000) / 1e6) / 60.0
+
+
+def _active_minutes(group: np.ndarray, times: pd.Series, n_groups: int, max_gap_minutes: int = MAX_GAP_MINUTES) -> np.ndarray:
+    """Minutes between consecutive messages of each group, each gap capped at
+    ``max_gap_minutes``. Messages without a timestamp are skipped."""
+    stamps = times.to_numpy(dtype="datetime64[ns]")
+    valid = ~np.isnat(stamps)
+    group, stamps = group[valid], stamps[valid].view(np.int64)
+    order = np.lexsort((stamps, group))
+    group, stamps = group[order], stamps[order]
+    same = group[1:] == group[:-1]
+    gaps = np.minimum(np.diff(stamps)[same], max_gap_minutes * 60 * 1_000_000_000)
+    total_ns = np.zeros(n_groups, dtype=np.int64)
+    np.add.at(total_ns, group[1:][same], gaps)
+    return minutes_from_ns(total_ns)
+
+
+def conversation_level(df: pd.DataFrame, scores: Optional[CategoryScores] = None) -> pd.DataFrame:
+    """Per-conversation totals, duration and primary category.
+
+    The primary category is the one with the most tokens (ties go to the first in
+    category order). With ``scores`` each message's tokens are split across categories
+    by its keyword hits instead of all going to its first matching rule. Duration adds
+    up the gaps between consecutive messages, each capped at 20 minutes.
+    """
     if df.empty:
         return df
 
-    def _estimated_duration_minutes(times: pd.Series, max_gap_minutes: int = 20) -> float:
-        times = times.sort_values()
-        if times.empty:
-            return 0.0
-
-        deltas = times.diff().dropna()
-        capped = deltas.clip(upper=pd.Timedelta(minutes=max_gap_minutes))
-        return capped.sum().total_seconds() / 60.0
-
-    g = df.groupby(["conversation_id", "conversation_title"], dropna=False)
+    keys = ["conversation_id", "conversation_title"]
+    tokens = df["tokens"].astype(np.int64)
+    role_tokens = df[keys + ["created_at", "message_id", "tokens", "words"]].assign(
+        user_tokens=tokens.where(df["is_user"], 0),
+        assistant_tokens=tokens.where(df["is_assistant"], 0),
+    )
+    g = role_tokens.groupby(keys, dropna=False, observed=True)
     out = g.agg(
         first_at=("created_at", "min"),
         last_at=("created_at", "max"),
         messages=("message_id", "count"),
         tokens=("tokens", "sum"),
         words=("words", "sum"),
-        user_tokens=("tokens", lambda s: s[df.loc[s.index, "is_user"]].sum()),
-        assistant_tokens=("tokens", lambda s: s[df.loc[s.index, "is_assistant"]].sum()),
+        user_tokens=("user_tokens", "sum"),
+        assistant_tokens=("assistant_tokens", "sum"),
     ).reset_index()
+    out["duration_minutes"] = _active_minutes(g.ngroup().to_numpy(), df["created_at"], g.ngroups)
 
     # Find the dominant category in each conversation based on token share
-    cat_tokens = (
-        df.groupby(["conversation_id", "category"], dropna=False)["tokens"]
-        .sum()
-        .reset_index()
-    )
-    cat_tokens.sort_values(["conversation_id", "tokens"], ascending=[True, False], inplace=True)
-    primary_category = cat_tokens.groupby("conversation_id").first().reset_index()[
-        ["conversation_id", "category"]
-    ]
-
-    durations = (
-        g["created_at"]
-        .apply(_estimated_duration_minutes)
-        .reset_index(name="duration_minutes")
-    )
-
-    out = (
-        out.merge(durations, on=["conversation_id", "conversation_title"], how="left")
-        .merge(primary_category, on="conversation_id", how="left")
-        .rename(columns={"category": "primary_category"})
-    )
-
+    if scores is not None:
+        primary_category = _scored_primary_category(df, scores)
+    else:
+        cat_tokens = (
+            df.groupby(["conversation_id", "category"], dropna=False, observed=True)["tokens"]
+            .sum()
+            .reset_index()
+        )
+        cat_tokens.sort_values(["conversation_id", "tokens"], ascending=[True, False], inplace=True)
+        primary_category = cat_tokens.groupby("conversation_id", observed=True).first().reset_index()[
+            ["conversation_id", "category"]
+        ]
+
+    out = out.merge(primary_category, on="conversation_id", how="left").rename(columns={"category": "primary_category"})
     out["assistant_share"] = np.where(out["tokens"] > 0, out["assistant_tokens"] / out["tokens"], np.nan)
     return out.sort_values("tokens", ascending=False)
 
@@ -80,28 +388,54 @@ def totals(df: pd.DataFrame, conv_df: pd.DataFrame | None = None) -> Dict[str, f
     if df.empty:
         return {}
 
-    total_tokens = float(df["tokens"].sum())
-    user_tokens = float(df.loc[df["is_user"], "tokens"].sum())
-    assistant_tokens = float(df.loc[df["is_assistant"], "tokens"].sum())
+    return summary_totals(
+        messages=int(df.shape[0]),
+        conversations=int(df["conversation_id"].nunique()),
+        total_tokens=float(df["tokens"].sum()),
+        user_tokens=float(df.loc[df["is_user"], "tokens"].sum()),
+        assistant_tokens=float(df.loc[df["is_assistant"], "tokens"].sum()),
+        words=int(df["words"].sum()),
+        conv_df=conv_df,
+    )
+
+
+def summary_totals(messages: int, conversations: int, total_tokens: float, user_tokens: float,
+                   assistant_tokens: float, words: int, conv_df: pd.DataFrame | None = None) -> Dict[str, float]:
+    """The ``totals`` dict from already aggregated counts."""
     total_minutes = float(conv_df["duration_minutes"].sum()) if conv_df is not None else 0.0
 
     return {
-        "messages": int(df.shape[0]),
-        "conversations": int(df["conversation_id"].nunique()),
+        "messages": messages,
+        "conversations": conversations,
         "tokens": int(total_tokens),
         "user_tokens": int(user_tokens),
         "assistant_tokens": int(assistant_tokens),
         "assistant_token_share": (assistant_tokens / total_tokens) if total_tokens else 0.0,
-        "words": int(df["words"].sum()),
+        "words": words,
         "active_minutes": total_minutes,
         "active_hours": total_minutes / 60.0,
     }
 
 
-def tokens_by_category(df: pd.DataFrame) -> pd.DataFrame:
+def tokens_by_category(df: pd.DataFrame, scores: Optional[CategoryScores] = None) -> pd.DataFrame:
+    """Tokens per category, largest first.
+
+    With ``scores`` each message's tokens are split across categories in proportion to
+    its keyword hits (rounded so the categories still add up to the total).
+    """
     if df.empty:
         return df
-    return (df.groupby("category", dropna=False)["tokens"]
+    if scores is not None:
+        aligned, weights = scored_tokens(df, scores)
+        by_category = np.bincount(aligned.indices, weights=weights, minlength=len(aligned.categories))
+        tokens = apportion(by_category, int(df["tokens"].sum()))
+        used = by_category > 0
+        out = pd.DataFrame({
+            "category": np.asarray(aligned.categories, dtype=object)[used],
+            "tokens": tokens[used].astype(df["tokens"].dtype),
+        })
+        return out.sort_values("tokens", ascending=False, kind="stable").reset_index(drop=True)
+    return (df.groupby("category", dropna=False, observed=True)["tokens"]
             .sum()
             .sort_values(ascending=False)
             .reset_index())
@@ -110,7 +444,7 @@ def tokens_by_category(df: pd.DataFrame) -> pd.DataFrame:
 def tokens_by_category_and_role(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
         return df
-    return (df.groupby(["category", "role"], dropna=False)["tokens"]
+    return (df.groupby(["category", "role"], dropna=False, observed=True)["tokens"]
             .sum()
             .reset_index())
 
@@ -120,7 +454,7 @@ def time_by_category(conv_df: pd.DataFrame) -> pd.DataFrame:
         return pd.DataFrame(columns=["category", "duration_minutes"])
 
     return (
-        conv_df.groupby("primary_category", dropna=False)["duration_minutes"]
+        conv_df.groupby("primary_category", dropna=False, observed=True)["duration_minutes"]
         .sum()
         .sort_values(ascending=False)
         .reset_index()
@@ -129,9 +463,18 @@ def time_by_category(conv_df: pd.DataFrame) -> pd.DataFrame:
 
 
 def tokens_over_time(df: pd.DataFrame, freq: str = "D") -> pd.DataFrame:
+    """Tokens per ``freq`` bin of ``created_at`` and role, empty bins included.
+
+    For bins of whole days, frames with a ``day`` column (localised frames, cube cells)
+    are first summed per day and role; any timestamp of a day lands in that day's bin.
+    """
     if df.empty:
         return df
-    ts = df.set_index("created_at").groupby("role")["tokens"].resample(freq).sum().reset_index()
+    offset = to_offset(freq)
+    if "day" in df.columns and (not isinstance(offset, Tick) or offset.nanos % _NS_PER_DAY == 0):
+        daily = df.groupby(["day", "role"], observed=True).agg(created_at=("created_at", "min"), tokens=("tokens", "sum"))
+        df = daily.astype({"tokens": df["tokens"].dtype}).reset_index()
+    ts = df.set_index("created_at").groupby("role", observed=True)["tokens"].resample(freq).sum().reset_index()
     ts.rename(columns={"created_at": "time"}, inplace=True)
     return ts
 
@@ -157,39 +500,41 @@ def activity_heatmap(df: pd.DataFrame) -> pd.DataFrame:
     days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
     df2 = df.copy()
     df2["dow"] = pd.Categorical(df2["dow"], categories=days, ordered=True)
-    piv = pd.pivot_table(df2, values="tokens", index="dow", columns="hour", aggfunc="sum", fill_value=0)
+    piv = pd.pivot_table(df2, values="tokens", index="dow", columns="hour", aggfunc="sum", fill_value=0, observed=False)
     return piv.reindex(index=days)
 
 
-def top_keywords(df: pd.DataFrame, n: int = 25) -> pd.DataFrame:
+def top_keywords(df: pd.DataFrame, n: int = 25, texts: Optional[TextStore] = None,
+                 workers: Optional[int] = 1) -> pd.DataFrame:
+    """Most frequent words, ties in alphabetical order; ``texts`` supplies the bodies
+    when ``df`` keeps them out of line. Counted a block of messages at a time (see
+    ``keywords.keyword_counts``, which ``workers`` is passed to)."""
     if df.empty:
         return pd.DataFrame(columns=["keyword", "count"])
-
-    stop = {
-        "the","a","an","and","or","to","of","in","for","on","with","is","it","this","that","be","as","are",
-        "i","you","we","they","he","she","them","us","my","your","our","me","at","from","by","not","but",
-        "can","could","would","should","do","does","did","so","if","then","than","just","like",
-        "select","def","join","null","class","function","return","while","break","continue","import","export",
-    }
-
-    text = " ".join(df["text"].astype(str).tolist()).lower()
-    import re
-    words = re.findall(r"[a-z0-9_']{3,}", text)
-    words = [w for w in words if w not in stop and not w.isdigit() and "_" not in w]
-    if not words:
-        return pd.DataFrame(columns=["keyword", "count"])
-
-    s = pd.Series(words).value_counts().head(n).reset_index()
-    s.columns = ["keyword", "count"]
-    return s
+    return top_counts(keyword_counts(df, texts, workers=workers), n)
 
 
 def highlights(df: pd.DataFrame, conv_df: pd.DataFrame) -> Dict[str, object]:
     if df.empty:
         return {}
 
-    day = df.groupby("date")["tokens"].sum().sort_values(ascending=False)
-    peak_day = day.index[0] if len(day) else None
+    a = df[df["is_assistant"]].sort_values("tokens", ascending=False, kind="stable")
+    longest_assistant = None
+    if not a.empty:
+        row = a.iloc[0]
+        longest_assistant = {
+            "conversation_title": row["conversation_title"],
+            "tokens": int(row["tokens"]),
+            "created_at": row["created_at"],
+        }
+    return {**calendar_highlights(df, conv_df), "longest_assistant": longest_assistant}
+
+
+def calendar_highlights(df: pd.DataFrame, conv_df: pd.DataFrame) -> Dict[str, object]:
+    """``highlights`` except the longest assistant reply. Only sums tokens by ``day`` and
+    hour, so ``df`` may be pre-aggregated (see ``cube.AggregateCube``)."""
+    day = df.groupby("day")["tokens"].sum().sort_values(ascending=False)
+    peak_day = _EPOCH + timedelta(days=int(day.index[0])) if len(day) else None
     peak_day_tokens = int(day.iloc[0]) if len(day) else 0
 
     hr = df.groupby("hour")["tokens"].sum().sort_values(ascending=False)
@@ -205,20 +550,9 @@ def highlights(df: pd.DataFrame, conv_df: pd.DataFrame) -> Dict[str, object]:
             "first_at": top["first_at"],
         }
 
-    a = df[df["is_assistant"]].sort_values("tokens", ascending=False)
-    longest_assistant = None
-    if not a.empty:
-        row = a.iloc[0]
-        longest_assistant = {
-            "conversation_title": row["conversation_title"],
-            "tokens": int(row["tokens"]),
-            "created_at": row["created_at"],
-        }
-
     return {
         "peak_day": peak_day,
         "peak_day_tokens": peak_day_tokens,
         "busiest_hour": busiest_hour,
         "top_conversation": top_conv,
-        "longest_assistant": longest_assistant,
     }
@@ -1,8 +1,21 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import os
 import re
+import threading
+import time
+from collections import Counter
 from dataclasses import dataclass
-from typing import List, Pattern
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Pattern, Sequence, Set, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .memo import TextMemo
+from .text_utils import FOLDS_TO_ASCII, chunks
 
 @dataclass(frozen=True)
 class CategoryRule:
@@ -24,10 +37,569 @@ RULES: List[CategoryRule] = [
 
 DEFAULT_CATEGORY = "Personal and lifestyle"
 
+
+def rules_version(rules: Sequence[CategoryRule], default: str = DEFAULT_CATEGORY) -> str:
+    """Content hash of a rule set: changes whenever a rule, its order or the default does."""
+    return hashlib.blake2b(
+        repr([(r.name, r.pattern.pattern, r.pattern.flags) for r in rules] + [default]).encode("utf-8"),
+        digest_size=8,
+    ).hexdigest()
+
+
+# Identifies the rule set so cached, already-categorised datasets are invalidated
+# whenever a rule, its order or the default bucket changes.
+RULES_VERSION = rules_version(RULES, DEFAULT_CATEGORY)
+
+# Words of the lowercased text; texts with a FOLDS_TO_ASCII character are matched rule
+# by rule instead.
+_WORD = re.compile(r"\w+")
+_WORD_BOUNDED = re.compile(r"\\b\((?:\?:)?(.*)\)\\b", re.S)
+_ASCII_WORD_CHAR = re.compile(r"[A-Za-z0-9_]")
+_WORD_EDGE = re.compile(r"\w")
+_SEPARATORS = frozenset(" /-'\",:;!@#%&=<>~`")
+_MAX_SPELLINGS = 64
+# Rows categorised per block by categorise_series, bounding its per-rule masks.
+CATEGORISE_CHUNK_ROWS = 1 << 16
+
+
+def _split_alternatives(body: str) -> Optional[List[str]]:
+    """Split a regex body on its top-level ``|``; None if it is not well nested."""
+    parts, depth, start, i = [], 0, 0, 0
+    while i < len(body):
+        c = body[i]
+        if c == "\\":
+            i += 2
+            continue
+        if c == "[":
+            end = body.find("]", i + 2)
+            if end < 0:
+                return None
+            i = end + 1
+            continue
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+            if depth < 0:
+                return None
+        elif c == "|" and depth == 0:
+            parts.append(body[start:i])
+            start = i + 1
+        i += 1
+    if depth:
+        return None
+    parts.append(body[start:])
+    return parts
+
+
+def _leading_word(alternative: str) -> Optional[Tuple[Set[str], bool]]:
+    """Lowercase spellings of the word an alternative starts with, and whether that word
+    is the whole alternative. None when the regex is too complex to tell."""
+    spellings, i = [""], 0
+    while i < len(alternative):
+        c = alternative[i]
+        if _ASCII_WORD_CHAR.fullmatch(c):
+            spellings = [s + c.lower() for s in spellings]
+            i += 1
+        elif c == "[":
+            end = alternative.find("]", i + 1)
+            chars = alternative[i + 1:end] if end > i + 1 else ""
+            if not chars or not all(_ASCII_WORD_CHAR.fullmatch(ch) for ch in chars):
+                return None
+            spellings = [s + ch.lower() for s in spellings for ch in dict.fromkeys(chars)]
+            if len(spellings) > _MAX_SPELLINGS:
+                return None
+            i = end + 1
+        else:
+            break
+    rest = alternative[i:]
+    if not spellings[0] or rest[:1] in ("?", "*", "+", "{"):
+        return None
+    if not rest:
+        return set(spellings), True
+    if rest.startswith("\\s") or rest[0] in _SEPARATORS or (rest[0] == "\\" and rest[1:2] in _SEPARATORS | {".", "(", ")"}):
+        return set(spellings), False
+    return None
+
+
+@dataclass(frozen=True)
+class DedupStats:
+    """How much work ``categorise_series`` saved on repeated text."""
+
+    rows: int
+    distinct: int  # distinct texts, counted per block of CATEGORISE_CHUNK_ROWS
+    matched: int  # distinct texts the matcher ran on (the rest came from the memo)
+
+    @property
+    def dedup_ratio(self) -> float:
+        """Share of rows whose text repeated an earlier row's in the same block."""
+        return 1 - self.distinct / self.rows if self.rows else 0.0
+
+    @property
+    def reuse_ratio(self) -> float:
+        """Share of rows categorised without running the matcher."""
+        return 1 - self.matched / self.rows if self.rows else 0.0
+
+
+@dataclass(frozen=True)
+class RuleStats:
+    name: str
+    hits: int  # texts this rule categorised (for the default: texts no rule matched)
+    searches: int  # texts its regex was run on
+    search_seconds: float
+
+    @property
+    def seconds_per_search(self) -> float:
+        return self.search_seconds / self.searches if self.searches else 0.0
+
+
+class CategoryMatcher:
+    """A rule list compiled so each text is scanned once.
+
+    The first matching rule wins, as with trying the rules in order. Most rules are
+    ``\\b(word|other words|...)\\b`` alternations under ``re.IGNORECASE``, so the
+    matcher works as a keyword automaton: the lowercased text is split into words once,
+    a single-word alternative matches exactly when its word occurs (a dict lookup), and
+    a multi-word one can only match where its first word occurs, so its rule's regex
+    is run only then, and only for rules ahead of the best word hit. Rules whose
+    pattern does not have that shape are always searched with their regex, in order.
+    """
+
+    def __init__(self, rules: Sequence[CategoryRule], default: str = DEFAULT_CATEGORY) -> None:
+        self.rules = list(rules)
+        self.names = [r.name for r in self.rules] + [default]
+        self.version = rules_version(self.rules, default)
+        self._words: Dict[str, int] = {}
+        # Every rule each single-word alternative belongs to, for hit counting.
+        self._word_rules: Dict[str, List[int]] = {}
+        # Per rule: first words of its multi-word alternatives, or None to always search.
+        self._phrases: List[Optional[Set[str]]] = [self._index_rule(rule, i) for i, rule in enumerate(self.rules)]
+        self._searched = [i for i, phrases in enumerate(self._phrases) if phrases is None or phrases]
+        self._lock = threading.Lock()
+        self._hits = [0] * len(self.names)
+        self._searches = [0] * len(self.rules)
+        self._search_seconds = [0.0] * len(self.rules)
+        # For bulk matching: phrase first word -> positions in _searched of rules it may start.
+        self._phrase_columns: Dict[str, List[int]] = {}
+        for col, i in enumerate(self._searched):
+            for word in self._phrases[i] or ():
+                self._phrase_columns.setdefault(word, []).append(col)
+
+    def _index_rule(self, rule: CategoryRule, i: int) -> Optional[Set[str]]:
+        flags = rule.pattern.flags
+        m = _WORD_BOUNDED.fullmatch(rule.pattern.pattern)
+        alternatives = _split_alternatives(m.group(1)) if m else None
+        if alternatives is None or not flags & re.I or flags & (re.A | re.X):
+            return None
+        words: Dict[str, int] = {}
+        phrases: Set[str] = set()
+        for alternative in alternatives:
+            leading = _leading_word(alternative)
+            if leading is None:
+                return None
+            spellings, whole = leading
+            if whole:
+                words.update(dict.fromkeys(spellings, i))
+            else:
+                phrases |= spellings
+        for word, index in words.items():
+            self._words.setdefault(word, index)
+            self._word_rules.setdefault(word, []).append(index)
+        return phrases
+
+    def stats(self) -> List[RuleStats]:
+        """Per-rule hit counts and regex time since creation (or ``reset_stats``), with
+        the default category last. Expensive patterns show a high ``search_seconds``."""
+        with self._lock:
+            return [
+                RuleStats(name, self._hits[i], self._searches[i] if i < len(self.rules) else 0,
+                          self._search_seconds[i] if i < len(self.rules) else 0.0)
+                for i, name in enumerate(self.names)
+            ]
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._hits = [0] * len(self.names)
+            self._searches = [0] * len(self.rules)
+            self._search_seconds = [0.0] * len(self.rules)
+
+    def _record(self, searches: Dict[int, Tuple[int, float]], hits: Optional[Sequence[int]] = None) -> None:
+        with self._lock:
+            for i, (count, seconds) in searches.items():
+                self._searches[i] += count
+                self._search_seconds[i] += seconds
+            if hits is not None:
+                for i, count in enumerate(hits):
+                    self._hits[i] += int(count)
+
+    def _search(self, i: int, text: str, searches: Dict[int, Tuple[int, float]]) -> bool:
+        start = time.perf_counter()
+        found = self.rules[i].pattern.search(text) is not None
+        count, seconds = searches.get(i, (0, 0.0))
+        searches[i] = (count + 1, seconds + time.perf_counter() - start)
+        return found
+
+    def index(self, text: str) -> int:
+        """Position in ``names`` of the category for ``text`` (the default is last)."""
+        searches: Dict[int, Tuple[int, float]] = {}
+        result = self._index(text, searches)
+        with self._lock:
+            self._hits[result] += 1
+        if searches:
+            self._record(searches)
+        return result
+
+    def _index(self, text: str, searches: Dict[int, Tuple[int, float]]) -> int:
+        default = len(self.rules)
+        if not text:
+            return default
+        if not text.isascii() and FOLDS_TO_ASCII.search(text) is not None:
+            return next((i for i in range(len(self.rules)) if self._search(i, text, searches)), default)
+        words = set(_WORD.findall(text.lower()))
+        best = min([self._words[w] for w in words.intersection(self._words)], default=default)
+        for i in self._searched:
+            if i >= best:
+                break
+            phrases = self._phrases[i]
+            if (phrases is None or not phrases.isdisjoint(words)) and self._search(i, text, searches):
+                return i
+        return best
+
+    def __call__(self, text: str) -> str:
+        return self.names[self.index(text)]
+
+    def indices(self, texts: Sequence[Optional[str]]) -> np.ndarray:
+        """``index`` for many texts at once, as an int32 array.
+
+        One keyword scan per text gives its best single-word hit and which rules'
+        phrases could occur. Rules are then resolved in order with boolean masks: rule
+        ``i`` takes the undecided rows whose best word hit is ``i``, plus those its regex
+        confirms, and only undecided rows that could match are searched (all of them for
+        texts with case-folding characters).
+        """
+        values = np.asarray(texts, dtype=object)
+        n, default = len(values), len(self.rules)
+        word_best = np.full(n, default, dtype=np.int32)
+        folds = np.zeros(n, dtype=bool)  # rows every rule's regex must search
+        pending = np.ones(n, dtype=bool)
+        maybe_rows: List[int] = []
+        maybe_columns: List[int] = []
+        for row, text in enumerate(values.tolist()):
+            if not text:
+                pending[row] = False
+            elif not text.isascii() and FOLDS_TO_ASCII.search(text) is not None:
+                folds[row] = True
+            else:
+                words = set(_WORD.findall(text.lower()))
+                word_best[row] = min([self._words[w] for w in words.intersection(self._words)], default=default)
+                for word in words.intersection(self._phrase_columns):
+                    columns = self._phrase_columns[word]
+                    maybe_rows.extend([row] * len(columns))
+                    maybe_columns.extend(columns)
+        maybe = np.zeros((n, len(self._searched)), dtype=bool)
+        maybe[maybe_rows, maybe_columns] = True
+        maybe[:, [col for col, i in enumerate(self._searched) if self._phrases[i] is None]] = True
+
+        codes = np.full(n, default, dtype=np.int32)
+        columns = {i: col for col, i in enumerate(self._searched)}
+        searches: Dict[int, Tuple[int, float]] = {}
+        for i, rule in enumerate(self.rules):
+            hit = pending & (word_best == i)
+            search = folds | maybe[:, columns[i]] if i in columns else folds
+            rows = np.flatnonzero(pending & ~hit & search)
+            if len(rows):
+                start = time.perf_counter()
+                found = np.fromiter((rule.pattern.search(t) is not None for t in values[rows].tolist()),
+                                    dtype=bool, count=len(rows))
+                searches[i] = (len(rows), time.perf_counter() - start)
+                hit[rows[found]] = True
+            codes[hit] = i
+            pending &= ~hit
+            if not pending.any():
+                break
+        self._record(searches, np.bincount(codes, minlength=len(self.names)))
+        return codes
+
+    def hit_counts(self, texts: Sequence[Optional[str]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Matches of every rule in each text, as CSR ``(indptr, rule indices, counts)``.
+
+        A rule's count is ``len(rule.pattern.findall(text))``. Rules whose phrases
+        cannot occur in the text are counted from the same word scan as ``index``;
+        the others run ``finditer``.
+        """
+        indptr = [0]
+        rules: List[int] = []
+        counts: List[int] = []
+        everything = range(len(self.rules))
+        searches = [0] * len(self.rules)
+        seconds = [0.0] * len(self.rules)
+        for text in texts:
+            row: Dict[int, int] = {}
+            if text:
+                if not text.isascii() and FOLDS_TO_ASCII.search(text) is not None:
+                    searched: Iterable[int] = everything
+                    tokens: Counter = Counter()
+                else:
+                    tokens = Counter(_WORD.findall(text.lower()))
+                    searched = [i for i in self._searched
+                                if self._phrases[i] is None or not self._phrases[i].isdisjoint(tokens)]
+                    for word in tokens.keys() & self._word_rules.keys():
+                        for i in self._word_rules[word]:
+                            row[i] = row.get(i, 0) + tokens[word]
+                for i in searched:
+                    row.pop(i, None)
+                    start = time.perf_counter()
+                    n = sum(1 for _ in self.rules[i].pattern.finditer(text))
+                    searches[i] += 1
+                    seconds[i] += time.perf_counter() - start
+                    if n:
+                        row[i] = n
+            for i in sorted(row):
+                rules.append(i)
+                counts.append(row[i])
+            indptr.append(len(rules))
+        self._record({i: (searches[i], seconds[i]) for i in everything if searches[i]})
+        return np.asarray(indptr, dtype=np.int64), np.asarray(rules, dtype=np.int32), np.asarray(counts, dtype=np.int32)
+
+
+_COMPILED: Dict[str, CategoryMatcher] = {}
+_COMPILED_LOCK = threading.Lock()
+
+
+def compile_rules(rules: Sequence[CategoryRule], default: str = DEFAULT_CATEGORY) -> CategoryMatcher:
+    """The matcher for a rule set, compiled once per process and shared by content hash."""
+    version = rules_version(rules, default)
+    with _COMPILED_LOCK:
+        matcher = _COMPILED.get(version)
+        if matcher is None:
+            matcher = _COMPILED[version] = CategoryMatcher(rules, default)
+    return matcher
+
+
+@dataclass(frozen=True)
+class RulePack:
+    """A category taxonomy: rules tried in order, plus the bucket for messages none match."""
+
+    name: str
+    rules: Tuple[CategoryRule, ...]
+    default: str = DEFAULT_CATEGORY
+
+    @property
+    def version(self) -> str:
+        return rules_version(self.rules, self.default)
+
+    @property
+    def matcher(self) -> CategoryMatcher:
+        return compile_rules(self.rules, self.default)
+
+
+BUILTIN_RULE_PACK = RulePack("builtin", tuple(RULES), DEFAULT_CATEGORY)
+
+
+def parse_rule_pack(data: Any, name: str = "custom") -> RulePack:
+    """Build a pack from its decoded JSON/YAML form (see ``load_rule_pack``)."""
+    if not isinstance(data, dict) or not isinstance(data.get("rules"), list) or not data["rules"]:
+        raise ValueError("A rule pack needs a non-empty 'rules' list.")
+    rules = []
+    for n, spec in enumerate(data["rules"], start=1):
+        if not isinstance(spec, dict) or not isinstance(spec.get("name"), str):
+            raise ValueError(f"Rule {n} needs a 'name'.")
+        keywords, pattern = spec.get("keywords"), spec.get("pattern")
+        if (keywords is None) == (pattern is None):
+            raise ValueError(f"Rule {n} ({spec['name']}) needs exactly one of 'keywords' or 'pattern'.")
+        if keywords is not None:
+            if not isinstance(keywords, list) or not keywords or not all(isinstance(k, str) and k for k in keywords):
+                raise ValueError(f"Rule {n} ({spec['name']}): 'keywords' must be a list of strings.")
+            body = "|".join(re.escape(k) for k in keywords)
+            if all(_WORD_EDGE.match(k[0]) and _WORD_EDGE.match(k[-1]) for k in keywords):
+                pattern = r"\b(" + body + r")\b"
+            else:
+                # \b needs a word character on the inside: "c++" or "c#" would never match.
+                pattern = r"(?<!\w)(?:" + body + r")(?!\w)"
+        try:
+            compiled = re.compile(str(pattern), re.I if spec.get("ignore_case", True) else 0)
+        except re.error as e:
+            raise ValueError(f"Rule {n} ({spec['name']}): invalid pattern: {e}") from e
+        rules.append(CategoryRule(spec["name"], compiled))
+    return RulePack(str(data.get("name", name)), tuple(rules), str(data.get("default", DEFAULT_CATEGORY)))
+
+
+def load_rule_pack(path: Union[str, Path]) -> RulePack:
+    r"""Read a rule pack from a JSON file, or YAML (``.yaml``/``.yml``, needs PyYAML).
+
+    ::
+
+        name: platform-team
+        default: Other
+        rules:
+          - name: Infrastructure
+            keywords: [kubernetes, terraform, helm chart]   # whole words, any case
+          - name: Languages
+            keywords: [rust, c++, c#]                       # edges may be symbols
+          - name: Incidents
+            pattern: '\b(sev[0-4]|outage|postmortem)\b'
+            ignore_case: true                             # the default
+
+    Rules are tried in order and the first match wins. Packs whose rules are keyword
+    lists (or ``\b(...|...)\b`` alternations) get the fast single-pass matcher; a
+    keyword list with a keyword starting or ending in a symbol (``c++``) is matched
+    between non-word characters instead, by its regex.
+    """
+    path = Path(path)
+    text = path.read_text(encoding="utf-8")
+    if path.suffix.lower() in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError as e:  # pragma: no cover - optional dependency
+            raise ValueError("Reading YAML rule packs needs PyYAML (see requirements-optional.txt).") from e
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise ValueError(f"{path.name} is not valid YAML: {e}") from e
+    else:
+        data = json.loads(text)
+    return parse_rule_pack(data, name=path.stem)
+
+
+def rule_pack_from_env() -> RulePack:
+    """The pack named by ``CHATGPT_WRAPPED_RULES_PATH``, or the built-in rules."""
+    path = os.environ.get("CHATGPT_WRAPPED_RULES_PATH")
+    return load_rule_pack(path) if path else BUILTIN_RULE_PACK
+
+
+_MATCHER = compile_rules(RULES)
+
+
 def categorise(text: str) -> str:
-    if not text:
-        return DEFAULT_CATEGORY
-    for r in RULES:
-        if r.pattern.search(text):
-            return r.name
-    return DEFAULT_CATEGORY
+    return _MATCHER(text)
+
+
+def categorise_series(texts: Union[pd.Series, Iterable[Optional[str]]],
+                      matcher: Optional[CategoryMatcher] = None,
+                      memo: Optional[TextMemo] = None) -> pd.Series:
+    """Categorise a whole text column, matching ``categorise`` row for row.
+
+    Returns a categorical Series (aligned with ``texts``' index when it is a Series)
+    whose categories are the names that occur, sorted as ``compact_dtypes`` would
+    sort them. ``texts`` may be any iterable; it is consumed in blocks of
+    ``CATEGORISE_CHUNK_ROWS``, so only one block of text is alive at once.
+
+    Each distinct text in a block is matched once; with a ``memo`` (keyed by the
+    matcher's rules version) only texts it has not seen before are matched at all.
+    ``attrs["dedup"]`` on the result holds the ``DedupStats``.
+    """
+    matcher = matcher or _MATCHER
+    index = texts.index if isinstance(texts, pd.Series) else None
+    blocks = chunks(texts.to_numpy(dtype=object) if isinstance(texts, pd.Series) else texts, CATEGORISE_CHUNK_ROWS)
+    namespace = f"categories:{matcher.version}"
+    default = len(matcher.rules)
+    matched = 0
+
+    def match(distinct: List[str]) -> List[int]:
+        nonlocal matched
+        matched += len(distinct)
+        return matcher.indices(distinct).tolist()
+
+    parts, rows, distinct = [], 0, 0
+    for block in blocks:
+        # factorize codes missing text (None/NaN) as -1, which picks the appended default.
+        positions, uniques = pd.factorize(np.asarray(block, dtype=object))
+        uniques = uniques.tolist()
+        found = memo.map(namespace, uniques, match) if memo is not None else match(uniques)
+        unique_codes = np.append(np.asarray(found, dtype=np.int32), np.int32(default))
+        parts.append(unique_codes[positions])
+        rows += len(block)
+        distinct += len(uniques) + int((positions < 0).any())
+    codes = np.concatenate(parts or [np.zeros(0, dtype=np.int32)])
+    # Several rules may share a name; categories are the distinct names used, sorted.
+    used = np.unique(codes)
+    categories, inverse = np.unique(np.asarray(matcher.names, dtype=object)[used], return_inverse=True)
+    lookup = np.zeros(len(matcher.names), dtype=np.int32)
+    lookup[used] = inverse
+    out = pd.Series(pd.Categorical.from_codes(lookup[codes], categories=categories), index=index, name="category")
+    out.attrs["dedup"] = DedupStats(rows, distinct, matched)
+    return out
+
+
+@dataclass(frozen=True, eq=False)
+class CategoryScores:
+    """Keyword hits per message and category, as a sparse CSR matrix.
+
+    Row ``i`` holds ``data[indptr[i]:indptr[i + 1]]`` hits in the columns
+    ``indices[indptr[i]:indptr[i + 1]]`` of ``categories``. Unlike ``categorise``,
+    which gives each message to its first matching rule, every rule's hits count
+    (rules sharing a name add up); a message with no hits scores 1 for the default
+    category. Rows line up with the texts scored, i.e. with a ``TextStore``.
+    """
+
+    indptr: np.ndarray
+    indices: np.ndarray
+    data: np.ndarray
+    categories: List[str]
+
+    def __len__(self) -> int:
+        return int(self.indptr.shape[0]) - 1
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self), len(self.categories)
+
+    def row_ids(self) -> np.ndarray:
+        """The row of every stored entry."""
+        return np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.indptr))
+
+    def shares(self) -> np.ndarray:
+        """Each entry as a fraction of its row's hits, so every row sums to 1."""
+        totals = np.add.reduceat(self.data.astype(np.float64), self.indptr[:-1]) if len(self.data) else np.zeros(0)
+        return self.data / np.repeat(totals, np.diff(self.indptr))
+
+    def take(self, rows: Sequence[int]) -> "CategoryScores":
+        """The matrix restricted to ``rows``, in that order."""
+        rows = np.asarray(rows, dtype=np.int64)
+        starts, ends = self.indptr[rows], self.indptr[rows + 1]
+        lengths = ends - starts
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        # Position of every kept entry: its row's start plus its offset within the row.
+        positions = np.repeat(starts - indptr[:-1], lengths) + np.arange(indptr[-1])
+        return CategoryScores(indptr, self.indices[positions], self.data[positions], self.categories)
+
+    def to_scipy(self) -> Any:
+        """A ``scipy.sparse.csr_matrix`` (needs scipy)."""
+        from scipy.sparse import csr_matrix
+
+        return csr_matrix((self.data, self.indices, self.indptr), shape=self.shape)
+
+
+def category_scores(texts: Union[pd.Series, Iterable[Optional[str]]],
+                    matcher: Optional[CategoryMatcher] = None) -> CategoryScores:
+    """Score every message against every rule in one pass (see ``CategoryScores``)."""
+    matcher = matcher or _MATCHER
+    blocks = chunks(texts.to_numpy(dtype=object) if isinstance(texts, pd.Series) else texts, CATEGORISE_CHUNK_ROWS)
+    categories, column = np.unique(np.asarray(matcher.names, dtype=object), return_inverse=True)
+    default = column[-1]
+
+    indptrs, indices, data = [np.zeros(1, dtype=np.int64)], [], []
+    offset = 0
+    for block in blocks:
+        indptr, rules, counts = matcher.hit_counts(block)
+        lengths = np.diff(indptr)
+        rows = np.repeat(np.arange(len(block)), lengths)
+        # Merge rules that share a category name, and give hitless rows the default.
+        keys = np.concatenate([rows * len(categories) + column[rules],
+                               np.flatnonzero(lengths == 0) * len(categories) + default])
+        values = np.concatenate([counts, np.ones(int((lengths == 0).sum()), dtype=np.int32)])
+        keys, inverse = np.unique(keys, return_inverse=True)
+        merged = np.bincount(inverse, weights=values).astype(np.int32)
+        row_of = keys // len(categories)
+        indices.append((keys % len(categories)).astype(np.int32))
+        data.append(merged)
+        indptrs.append(offset + np.cumsum(np.bincount(row_of, minlength=len(block))).astype(np.int64))
+        offset += len(keys)
+
+    return CategoryScores(
+        np.concatenate(indptrs),
+        np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32),
+        np.concatenate(data) if data else np.zeros(0, dtype=np.int32),
+        [str(c) for c in categories],
+    )
@@ -0,0 +1,318 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .analytics import (
+    MAX_GAP_MINUTES,
+    activity_heatmap,
+    apportion,
+    calendar_highlights,
+    date_bounds,
+    day_ordinal,
+    minutes_from_ns,
+    scored_tokens,
+    summary_totals,
+    tokens_by_category,
+    tokens_by_category_and_role,
+    tokens_over_time,
+)
+from .categorise import CategoryScores
+
+# Cells are keyed by local day, hour, category and role; the weekday (like the date,
+# year and role flags) is fixed within a cell and carried along.
+CUBE_DIMENSIONS = ["day", "hour", "dow", "category", "role"]
+CUBE_MEASURES = ["tokens", "words", "messages"]
+CONVERSATION_KEYS = ["conversation_id", "conversation_title"]
+CONVERSATION_MEASURES = ["messages", "tokens", "words", "user_tokens", "assistant_tokens"]
+
+
+@dataclass(frozen=True, eq=False)
+class AggregateCube:
+    """Message measures summed by day × hour × weekday × category × role.
+
+    Built once per localised dataset (``from_frame``), it answers the dashboard's
+    aggregate views by summing cells, so filtering by year or date range costs time in
+    the number of cells rather than messages. Each cell holds the measures in
+    ``CUBE_MEASURES``, the calendar columns of the message frame, the earliest
+    ``created_at`` (any timestamp in the cell lands in the same day and hour bins) and
+    its longest assistant reply. Cells are sorted by day.
+    """
+
+    cells: pd.DataFrame
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "AggregateCube":
+        """Aggregate a frame from ``apply_timezone``."""
+        if df.empty:
+            return cls(pd.DataFrame(columns=CUBE_DIMENSIONS + CUBE_MEASURES))
+        frame = df[["day", "date", "year", "hour", "dow", "category", "role", "is_user", "is_assistant",
+                    "created_at", "tokens", "words"]]
+        g = frame.groupby(["day", "hour", "category", "role"], dropna=False, observed=True)
+        cells = g.agg(
+            date=("date", "first"),
+            year=("year", "first"),
+            dow=("dow", "first"),
+            is_user=("is_user", "first"),
+            is_assistant=("is_assistant", "first"),
+            created_at=("created_at", "min"),
+            tokens=("tokens", "sum"),
+            words=("words", "sum"),
+            messages=("tokens", "size"),
+        ).reset_index()
+        # Narrow frames stay narrow: their integer widths already fit any subset's sum.
+        cells = cells.astype({"tokens": df["tokens"].dtype, "words": df["words"].dtype})
+
+        # Longest assistant reply per cell; ties go to the earliest row, as a stable sort would.
+        cell = g.ngroup().to_numpy()
+        rows = np.flatnonzero(df["is_assistant"].to_numpy(dtype=bool))
+        tokens = df["tokens"].to_numpy(dtype=np.int64)[rows]
+        rows = rows[np.lexsort((rows, -tokens, cell[rows]))]
+        rows = rows[np.r_[True, cell[rows][1:] != cell[rows][:-1]]] if len(rows) else rows
+        longest = np.full(len(cells), -1, dtype=np.int64)
+        longest[cell[rows]] = rows
+        has = longest >= 0
+        cells["longest_row"] = longest
+        cells["longest_tokens"] = np.where(has, df["tokens"].to_numpy(dtype=np.int64)[np.maximum(longest, 0)], 0)
+        cells["longest_title"] = pd.Series(df["conversation_title"].to_numpy(dtype=object)[rows], index=cell[rows])
+        cells["longest_at"] = df["created_at"].iloc[rows].set_axis(cell[rows])
+        return cls(cells)
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    @property
+    def empty(self) -> bool:
+        return self.cells.empty
+
+    def slice(self, year: Optional[int] = None, start: Optional[date] = None,
+              end: Optional[date] = None) -> "AggregateCube":
+        """Cells of messages in ``year`` (local) and between ``start`` and ``end`` inclusive,
+        found by binary search."""
+        start, end = date_bounds(year, start, end)
+        day = self.cells["day"].to_numpy()
+        lo = int(np.searchsorted(day, day_ordinal(start), side="left")) if start else 0
+        hi = int(np.searchsorted(day, day_ordinal(end), side="right")) if end else len(day)
+        return AggregateCube(self.cells.iloc[lo:max(lo, hi)])
+
+    def measures(self, by: Sequence[str] = (), measures: Sequence[str] = CUBE_MEASURES) -> pd.DataFrame:
+        """``measures`` summed over the cells, grouped by the dimensions in ``by``, in the
+        cells' dtypes."""
+        dtypes = self.cells.dtypes[list(measures)].to_dict()
+        if not by:
+            return self.cells[list(measures)].sum().to_frame().T.astype(dtypes)
+        out = self.cells.groupby(list(by), dropna=False, observed=True)[list(measures)].sum()
+        return out.astype(dtypes).reset_index()
+
+    def totals(self, conv_df: pd.DataFrame) -> Dict[str, float]:
+        """As ``analytics.totals``; conversations are counted from ``conv_df``."""
+        cells = self.cells
+        if cells.empty:
+            return {}
+        tokens = cells["tokens"]
+        return summary_totals(
+            messages=int(cells["messages"].sum()),
+            conversations=int(conv_df["conversation_id"].nunique()),
+            total_tokens=float(tokens.sum()),
+            user_tokens=float(tokens[cells["is_user"]].sum()),
+            assistant_tokens=float(tokens[cells["is_assistant"]].sum()),
+            words=int(cells["words"].sum()),
+            conv_df=conv_df,
+        )
+
+    # These analytics functions only group and sum, so the cells stand in for messages.
+
+    def tokens_by_category(self) -> pd.DataFrame:
+        return tokens_by_category(self.cells)
+
+    def tokens_by_category_and_role(self) -> pd.DataFrame:
+        return tokens_by_category_and_role(self.cells)
+
+    def tokens_over_time(self, freq: str = "D") -> pd.DataFrame:
+        """As ``analytics.tokens_over_time``, for bins of an hour or longer."""
+        return tokens_over_time(self.cells, freq=freq)
+
+    def activity_heatmap(self) -> pd.DataFrame:
+        return activity_heatmap(self.measures(["dow", "hour"], ["tokens"]) if not self.empty else self.cells)
+
+    def highlights(self, conv_df: pd.DataFrame) -> Dict[str, object]:
+        cells = self.cells
+        if cells.empty:
+            return {}
+        longest_assistant = None
+        replies = cells[cells["longest_row"].to_numpy() >= 0]
+        if not replies.empty:
+            row = replies.sort_values(["longest_tokens", "longest_row"], ascending=[False, True]).iloc[0]
+            longest_assistant = {
+                "conversation_title": row["longest_title"],
+                "tokens": int(row["longest_tokens"]),
+                "created_at": row["longest_at"],
+            }
+        return {**calendar_highlights(cells, conv_df), "longest_assistant": longest_assistant}
+
+
+@dataclass(frozen=True, eq=False)
+class ConversationDays:
+    """Per-conversation measures summed by local day, behind ``conversation_level``.
+
+    Row ``i`` of ``rows`` holds one conversation's messages on one day (rows are sorted
+    by day): ``CONVERSATION_MEASURES``, the first and last ``created_at`` and the capped
+    gaps between consecutive messages. The gap from the conversation's previous message
+    on an earlier day (``lead_ns``, from ``lead_day``) counts only when that day is in
+    the slice, so a day range adds up exactly what its messages would. Row ``i`` of
+    ``weights`` holds its tokens per category (split by keyword hits when built with
+    scores) and of ``fallback`` its messages, or hit shares, per category.
+    """
+
+    rows: pd.DataFrame
+    conversations: pd.DataFrame
+    categories: pd.Series
+    weights: np.ndarray
+    fallback: np.ndarray
+    scored: bool
+    first_day: Optional[int] = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, scores: Optional[CategoryScores] = None) -> "ConversationDays":
+        """Aggregate a frame from ``apply_timezone``; ``scores`` as in ``conversation_level``."""
+        g = df.groupby(CONVERSATION_KEYS, dropna=False, observed=True)
+        conversations = g.size().reset_index()[CONVERSATION_KEYS]
+        conv = g.ngroup().to_numpy().astype(np.int64)
+        day = df["day"].to_numpy(dtype=np.int64)
+        width, first_day = max(len(conversations), 1), int(day.min(initial=0))
+        keys, cell = np.unique((day - first_day) * width + conv, return_inverse=True)
+        n = len(keys)
+
+        # Frame rows are in created_at order, so a cell's first and last rows bound it.
+        order = np.argsort(cell, kind="stable")
+        starts = np.searchsorted(cell[order], np.arange(n))
+        ends = np.r_[starts[1:], len(order)] - 1
+        tokens = df["tokens"].to_numpy(dtype=np.int64)
+        measures = {
+            "messages": np.ones(len(df), dtype=np.int64),
+            "tokens": tokens,
+            "words": df["words"].to_numpy(dtype=np.int64),
+            "user_tokens": np.where(df["is_user"].to_numpy(dtype=bool), tokens, 0),
+            "assistant_tokens": np.where(df["is_assistant"].to_numpy(dtype=bool), tokens, 0),
+        }
+        created_at = df["created_at"]
+        rows = pd.DataFrame({
+            "conversation": conv[order[starts]],
+            "day": keys // width + first_day,
+            "first_at": created_at.iloc[order[starts]].reset_index(drop=True),
+            "last_at": created_at.iloc[order[ends]].reset_index(drop=True),
+            **{name: np.bincount(cell, weights=values, minlength=n).astype(np.int64)
+               for name, values in measures.items()},
+        })
+        # Narrow frames stay narrow: their integer widths already fit any subset's sum.
+        rows = rows.astype({"tokens": df["tokens"].dtype, "words": df["words"].dtype})
+
+        # The capped gap to each message from its conversation's previous one, as in
+        # analytics.conversation_level. Only a conversation's first message of a day can
+        # follow one on an earlier day.
+        stamps = created_at.to_numpy(dtype="datetime64[ns]").view(np.int64)
+        by_time = np.lexsort((stamps, conv))
+        same = conv[by_time][1:] == conv[by_time][:-1]
+        follows, prev = by_time[1:][same], by_time[:-1][same]
+        gaps = np.minimum(stamps[follows] - stamps[prev], MAX_GAP_MINUTES * 60 * 1_000_000_000)
+        inner = day[follows] == day[prev]
+        gap_ns = np.zeros(n, dtype=np.int64)
+        np.add.at(gap_ns, cell[follows[inner]], gaps[inner])
+        lead_ns = np.zeros(n, dtype=np.int64)
+        lead_day = rows["day"].to_numpy().copy()
+        lead_ns[cell[follows[~inner]]] = gaps[~inner]
+        lead_day[cell[follows[~inner]]] = day[prev[~inner]]
+        rows["gap_ns"], rows["lead_ns"], rows["lead_day"] = gap_ns, lead_ns, lead_day
+
+        if scores is None:
+            codes, labels = pd.factorize(df["category"], sort=True, use_na_sentinel=False)
+            categories = pd.Series(np.asarray(labels, dtype=object)).astype(df["category"].dtype)
+            entries, weights, fallback = np.arange(len(df)), tokens, measures["messages"]
+        else:
+            aligned, weights = scored_tokens(df, scores)
+            categories = pd.Series(np.asarray(aligned.categories, dtype=object))
+            if isinstance(df["category"].dtype, pd.CategoricalDtype):
+                categories = categories.astype("category")
+            entries, codes, fallback = aligned.row_ids(), aligned.indices, aligned.shares()
+        k = len(categories)
+        flat = cell[entries] * k + codes
+        weights, fallback = (np.bincount(flat, weights=w, minlength=n * k).reshape(n, k) for w in (weights, fallback))
+        if scores is None:
+            weights, fallback = weights.astype(np.int64), fallback.astype(np.int64)
+        return cls(rows, conversations, categories, weights, fallback, scores is not None)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def slice(self, year: Optional[int] = None, start: Optional[date] = None,
+              end: Optional[date] = None) -> "ConversationDays":
+        """Rows of days in ``year`` (local) and between ``start`` and ``end`` inclusive,
+        found by binary search."""
+        start, end = date_bounds(year, start, end)
+        day = self.rows["day"].to_numpy()
+        lo = int(np.searchsorted(day, day_ordinal(start), side="left")) if start else 0
+        hi = max(lo, int(np.searchsorted(day, day_ordinal(end), side="right")) if end else len(day))
+        first_day = self.first_day
+        if start is not None:
+            first_day = day_ordinal(start) if first_day is None else max(first_day, day_ordinal(start))
+        return ConversationDays(self.rows.iloc[lo:hi], self.conversations, self.categories,
+                                self.weights[lo:hi], self.fallback[lo:hi], self.scored, first_day)
+
+    def conversation_level(self) -> pd.DataFrame:
+        """As ``analytics.conversation_level`` over the messages of these rows."""
+        rows = self.rows
+        if rows.empty:
+            return pd.DataFrame(columns=CONVERSATION_KEYS + ["first_at", "last_at"] + CONVERSATION_MEASURES
+                                + ["duration_minutes", "primary_category", "assistant_share"])
+        codes, inverse = np.unique(rows["conversation"].to_numpy(), return_inverse=True)
+        lead = rows["lead_ns"].to_numpy()
+        if self.first_day is not None:
+            lead = np.where(rows["lead_day"].to_numpy() >= self.first_day, lead, 0)
+        duration_ns = rows["gap_ns"].to_numpy() + lead
+
+        def per_conversation(values: np.ndarray) -> np.ndarray:
+            out = np.zeros((len(codes),) + values.shape[1:], dtype=np.int64 if values.dtype.kind in "iub" else values.dtype)
+            np.add.at(out, inverse, values)
+            return out
+
+        out = self.conversations.iloc[codes].reset_index(drop=True)
+        g = rows.groupby(inverse, sort=True)
+        out["first_at"] = g["first_at"].min().reset_index(drop=True)
+        out["last_at"] = g["last_at"].max().reset_index(drop=True)
+        for name in CONVERSATION_MEASURES:
+            out[name] = per_conversation(rows[name].to_numpy()).astype(rows[name].dtype)
+        out["duration_minutes"] = minutes_from_ns(per_conversation(duration_ns))
+
+        weights, fallback = per_conversation(self.weights), per_conversation(self.fallback)
+        # Ties go to the first category. Conversations without tokens fall back to hit
+        # shares when scored, otherwise to the first category they have messages in.
+        if not self.scored:
+            fallback = fallback > 0
+        best = np.where(weights.max(axis=1) > 0, weights.argmax(axis=1), fallback.argmax(axis=1))
+        primary = self.categories.iloc[best].reset_index(drop=True)
+        if self.scored and isinstance(primary.dtype, pd.CategoricalDtype):
+            # Only the categories that are someone's primary, as conversation_level gives.
+            primary = primary.astype(object).astype("category")
+        out["primary_category"] = primary
+        out["assistant_share"] = np.where(out["tokens"] > 0, out["assistant_tokens"] / out["tokens"], np.nan)
+        return out.sort_values("tokens", ascending=False)
+
+    def tokens_by_category(self) -> pd.DataFrame:
+        """As ``analytics.tokens_by_category`` with the scores these rows were built with.
+        Unscored, ``AggregateCube.tokens_by_category`` answers from fewer cells."""
+        if not self.scored:
+            raise ValueError("These rows were built without scores; use AggregateCube.tokens_by_category.")
+        if self.rows.empty:
+            return pd.DataFrame(columns=["category", "tokens"])
+        by_category = self.weights.sum(axis=0)
+        tokens = apportion(by_category, int(self.rows["tokens"].sum()))
+        used = by_category > 0
+        out = pd.DataFrame({
+            "category": np.asarray(self.categories, dtype=object)[used],
+            "tokens": tokens[used].astype(self.rows["tokens"].dtype),
+        })
+        return out.sort_values("tokens", ascending=False, kind="stable").reset_index(drop=True)
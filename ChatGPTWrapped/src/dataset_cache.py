@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Optional, Union
+
+import pandas as pd
+
+from .search import SEARCH_META_FILE, SearchIndex
+from .text_store import TextStore
+
+# Bump when the layout of cached frames changes so stale entries are never read.
+CACHE_FORMAT_VERSION = 2
+
+_HASH_BLOCK = 8 << 20
+
+
+def content_hash(data: Union[bytes, bytearray, memoryview]) -> str:
+    """Hash upload bytes in blocks, without copying them."""
+    h = hashlib.blake2b(digest_size=20)
+    view = memoryview(data).cast("B")
+    for start in range(0, len(view), _HASH_BLOCK):
+        h.update(view[start:start + _HASH_BLOCK])
+    return h.hexdigest()
+
+
+def processing_profile(**params: object) -> str:
+    """Hash everything other than the upload that shapes the built frame (tokenizer, rules...)."""
+    payload = json.dumps({"format": CACHE_FORMAT_VERSION, **params}, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=10).hexdigest()
+
+
+def dataset_key(upload_hash: str, profile: str) -> str:
+    return hashlib.blake2b(f"{upload_hash}:{profile}".encode("utf-8"), digest_size=20).hexdigest()
+
+
+def _has_pyarrow() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+class DatasetCache:
+    """Disk-backed cache of fully built message frames with an LRU size cap.
+
+    Each entry is a directory named by its key holding the frame as Parquet (or a
+    pickle when ``pyarrow`` is missing), its message text as a ``TextStore`` (read back
+    memory-mapped), the processing profile it was built with and the conversation
+    manifest used for incremental re-imports; a ``SearchIndex`` can be added to an
+    entry later. Entries are written to
+    a temporary directory and renamed into place, so concurrent replicas sharing the
+    directory never see a partial entry. Reads refresh the entry's mtime, which drives
+    LRU eviction.
+    """
+
+    def __init__(self, root: Union[str, Path], max_bytes: int) -> None:
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _entry(self, key: str) -> Path:
+        return self.root / key
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        entry = self._entry(key)
+        try:
+            if (entry / "frame.parquet").exists():
+                df = pd.read_parquet(entry / "frame.parquet")
+            elif (entry / "frame.pkl").exists():
+                df = pd.read_pickle(entry / "frame.pkl")
+            else:
+                return None
+            os.utime(entry)
+        except Exception:
+            # Evicted or half-deleted by another process: treat as a miss.
+            return None
+        return df
+
+    def get_texts(self, key: str) -> Optional[TextStore]:
+        try:
+            return TextStore.load(self._entry(key))
+        except (OSError, ValueError):
+            return None
+
+    def get_manifest(self, key: str) -> Optional[Dict[str, float]]:
+        try:
+            with open(self._entry(key) / "manifest.json", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def get_search_index(self, key: str) -> Optional[SearchIndex]:
+        try:
+            return SearchIndex.load(self._entry(key))
+        except (OSError, ValueError):
+            return None
+
+    def put_search_index(self, key: str, index: SearchIndex) -> None:
+        """Store ``index`` in an existing entry. Its files are moved in one by one with the
+        index's meta file last, so readers never load a partial index."""
+        entry = self._entry(key)
+        if not entry.is_dir():
+            return
+        tmp = Path(tempfile.mkdtemp(prefix=".tmp-", dir=self.root))
+        try:
+            index.save(tmp)
+            for f in sorted(tmp.iterdir(), key=lambda p: p.name == SEARCH_META_FILE):
+                os.replace(f, entry / f.name)
+        except OSError:
+            # Evicted meanwhile, or the disk is full: the index is rebuilt next time.
+            pass
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self.evict()
+
+    def _recent(self, profile: str) -> List[str]:
+        """Keys of the entries built with ``profile``, most recently used first."""
+        entries = []
+        for p in self.root.iterdir():
+            try:
+                if p.name.startswith(".") or (p / "profile.txt").read_text(encoding="utf-8") != profile:
+                    continue
+                entries.append((p.stat().st_mtime, p.name))
+            except OSError:
+                continue
+        return [key for _, key in sorted(entries, reverse=True)]
+
+    def latest(self, profile: str) -> Optional[str]:
+        """Key of the most recently used entry built with ``profile``."""
+        recent = self._recent(profile)
+        return recent[0] if recent else None
+
+    def incremental_base(self, profile: str, conversation_ids: Iterable[str],
+                         candidates: int = 16) -> Optional[str]:
+        """Key of the entry to import a newer export against: of the ``candidates`` most
+        recently used entries built with ``profile``, the one whose manifest holds the
+        most of ``conversation_ids`` (a sample of the new export's). Ties go to the more
+        recent entry. Returns None when none shares a conversation. In a shared cache
+        that is the case for other users' exports, which would be loaded for nothing."""
+        ids = set(conversation_ids)
+        best: Optional[tuple] = None
+        for key in self._recent(profile)[:candidates] if ids else ():
+            manifest = self.get_manifest(key)
+            shared = len(ids.intersection(manifest)) if manifest else 0
+            if shared and (best is None or shared > best[0]):
+                best = (shared, key)
+        return best[1] if best else None
+
+    def put(self, key: str, df: pd.DataFrame, profile: str = "",
+            manifest: Optional[Mapping[str, float]] = None, texts: Optional[TextStore] = None) -> None:
+        entry = self._entry(key)
+        if entry.exists():
+            os.utime(entry)
+            return
+
+        tmp = Path(tempfile.mkdtemp(prefix=".tmp-", dir=self.root))
+        try:
+            if _has_pyarrow():
+                df.to_parquet(tmp / "frame.parquet", index=False)
+            else:
+                df.to_pickle(tmp / "frame.pkl")
+            if texts is not None:
+                texts.save(tmp)
+            (tmp / "profile.txt").write_text(profile, encoding="utf-8")
+            if manifest is not None:
+                with open(tmp / "manifest.json", "w", encoding="utf-8") as fh:
+                    json.dump(dict(manifest), fh)
+            if _dir_size(tmp) > self.max_bytes:
+                return
+            os.replace(tmp, entry)
+        except OSError:
+            # Another replica won the race to write the same key.
+            pass
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self.evict()
+
+    def evict(self) -> None:
+        """Delete least recently used entries until the cache fits in ``max_bytes``."""
+        entries = []
+        for p in self.root.iterdir():
+            if p.is_dir() and not p.name.startswith("."):
+                try:
+                    entries.append((p.stat().st_mtime, _dir_size(p), p))
+                except OSError:
+                    continue
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(p, ignore_errors=True)
+            total -= size
+
+        # Leftovers from writers that crashed mid-put.
+        for p in self.root.glob(".tmp-*"):
+            try:
+                if time.time() - p.stat().st_mtime > 3600:
+                    shutil.rmtree(p, ignore_errors=True)
+            except OSError:
+                continue
+
+
+def _dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.iterdir() if f.is_file())
+
+
+def cache_from_env() -> Optional[DatasetCache]:
+    """Build the cache configured by ``CHATGPT_WRAPPED_CACHE_DIR`` / ``CHATGPT_WRAPPED_CACHE_MAX_MB``.
+
+    Returns None when no directory is configured: persisting uploads is opt-in.
+    """
+    root = os.environ.get("CHATGPT_WRAPPED_CACHE_DIR")
+    if not root:
+        return None
+    max_mb = int(os.environ.get("CHATGPT_WRAPPED_CACHE_MAX_MB", "2048"))
+    return DatasetCache(root, max_bytes=max_mb << 20)
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .analytics import compact_dtypes, is_compact
+from .parse_export import MessageBatch
+from .text_store import TEXT_INDEX_COLUMN, TextStore, concat_text_stores
+
+
+def merge_incremental(prior: pd.DataFrame, delta: pd.DataFrame, batch: MessageBatch) -> pd.DataFrame:
+    """Combine a prior snapshot with the rows rebuilt for new or changed conversations.
+
+    ``batch`` is the re-import parsed with the prior manifest as ``unchanged`` and
+    ``delta`` the frame built from it. Prior rows are kept only for conversations the
+    batch marked unchanged, so conversations that were edited or deleted since the
+    prior import drop out. Rows come back in the order a full rebuild produces:
+    by ``created_at``, and in export order among equal timestamps.
+    """
+    if prior.empty or not batch.unchanged_conversations:
+        return delta
+    reused = prior[prior["conversation_id"].isin(batch.unchanged_conversations)]
+    merged = pd.concat([reused, delta], ignore_index=True) if not delta.empty else reused
+
+    position: Dict[str, int] = {c: i for i, c in enumerate(batch.conversation_ids)}
+    order = merged["conversation_id"].map(position).to_numpy()
+    # Stable sorts: messages keep their within-conversation order from either source.
+    merged = merged.iloc[np.argsort(order, kind="stable")]
+    merged = merged.sort_values("created_at", kind="stable", ignore_index=True)
+    # Categoricals with different categories concatenate to object; re-compact them.
+    return compact_dtypes(merged) if is_compact(prior) else merged
+
+
+def merge_incremental_texts(prior: pd.DataFrame, prior_texts: TextStore, delta: pd.DataFrame,
+                            delta_texts: TextStore, batch: MessageBatch) -> Tuple[pd.DataFrame, TextStore]:
+    """``merge_incremental`` for frames that keep their text in a ``TextStore``.
+
+    Returns the merged frame with a fresh store holding only its rows, in frame order,
+    so text for dropped conversations does not accumulate across re-imports. A batch
+    with nothing new or changed builds an empty ``delta`` without columns; the merge is
+    then the prior rows of the conversations still in the export.
+    """
+    stores = [prior_texts]
+    if not delta.empty:
+        delta = delta.assign(**{TEXT_INDEX_COLUMN: delta[TEXT_INDEX_COLUMN] + len(prior_texts)})
+        stores.append(delta_texts)
+    merged = merge_incremental(prior, delta, batch)
+    if TEXT_INDEX_COLUMN not in merged.columns:
+        # Nothing reused and nothing new: the export has no messages.
+        return merged, delta_texts
+    texts = concat_text_stores(stores).take(merged[TEXT_INDEX_COLUMN].to_numpy())
+    merged[TEXT_INDEX_COLUMN] = np.arange(len(merged), dtype=np.int64)
+    return merged, texts
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import heapq
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .parallel import fork_available, forked_map
+from .text_store import TextStore, text_source
+from .text_utils import chunks
+
+KEYWORD_STOPWORDS = frozenset({
+    "the", "a", "an", "and", "or", "to", "of", "in", "for", "on", "with", "is", "it", "this", "that", "be", "as", "are",
+    "i", "you", "we", "they", "he", "she", "them", "us", "my", "your", "our", "me", "at", "from", "by", "not", "but",
+    "can", "could", "would", "should", "do", "does", "did", "so", "if", "then", "than", "just", "like",
+    "select", "def", "join", "null", "class", "function", "return", "while", "break", "continue", "import", "export",
+})
+# Runs over lowercased text.
+KEYWORD_PATTERN = re.compile(r"[a-z0-9_']{3,}")
+
+# Messages lowercased and tokenised together; bounds the transient strings to one block.
+KEYWORD_CHUNK_ROWS = 256
+# Rows per task when counting across processes, and the least worth starting them for.
+KEYWORD_TASK_ROWS = 65536
+KEYWORD_PARALLEL_MIN_ROWS = 200_000
+
+
+def is_keyword(word: str) -> bool:
+    """Whether a ``KEYWORD_PATTERN`` match counts: not a stopword, a number or an
+    identifier with underscores."""
+    return word not in KEYWORD_STOPWORDS and not word.isdigit() and "_" not in word
+
+
+def keyword_terms(text: str) -> List[str]:
+    """The keywords of one text, in order (the tokenisation behind ``count_keywords``)."""
+    return [w for w in KEYWORD_PATTERN.findall(text.lower()) if is_keyword(w)]
+
+
+def count_keywords(texts: Iterable[Optional[str]]) -> Counter:
+    """Keyword counts over ``texts``: words of three or more letters, digits or
+    apostrophes that pass ``is_keyword``.
+
+    Texts are tokenised ``KEYWORD_CHUNK_ROWS`` at a time, so memory is bounded by one
+    block plus the vocabulary. Counts of disjoint inputs add up (``Counter.update``).
+    """
+    counts: Counter = Counter()
+    for block in chunks(texts, KEYWORD_CHUNK_ROWS):
+        block_counts = Counter(KEYWORD_PATTERN.findall(" ".join(map(str, block)).lower()))
+        # Filter the distinct words rather than every occurrence.
+        for word in [w for w in block_counts if not is_keyword(w)]:
+            del block_counts[word]
+        counts.update(block_counts)
+    return counts
+
+
+def top_counts(counts: Mapping[str, int], n: int = 25) -> pd.DataFrame:
+    """The ``n`` most frequent keywords, ties in alphabetical order, from a heap."""
+    top = heapq.nsmallest(n, counts.items(), key=lambda kv: (-kv[1], kv[0]))
+    return pd.DataFrame(top, columns=["keyword", "count"])
+
+
+def _iter_rows(source: Any, rows: np.ndarray) -> Iterator[Optional[str]]:
+    # Decode a block at a time: ``iter_texts`` lists the offsets of every row it is given.
+    for start in range(0, len(rows), KEYWORD_CHUNK_ROWS):
+        block = rows[start:start + KEYWORD_CHUNK_ROWS]
+        yield from source.iter_texts(block) if isinstance(source, TextStore) else source[block]
+
+
+def _count_forked_range(payload: Tuple[Any, np.ndarray], start: int, stop: int) -> Counter:
+    source, rows = payload
+    return count_keywords(_iter_rows(source, rows[start:stop]))
+
+
+def _count_ranges(source: Any, rows: np.ndarray, ranges: Sequence[Tuple[int, int, int]],
+                  workers: Optional[int] = 1) -> Dict[int, Counter]:
+    """Keyword counts per partition, from ``(partition, start, stop)`` ranges of ``rows``.
+
+    With ``workers`` > 1 (``None`` means one per CPU) ranges are counted across forked
+    processes (``parallel.forked_map``, which workers inherit the texts through) and
+    their partial counts merged as they arrive.
+    """
+    out: Dict[int, Counter] = {}
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(rows) < KEYWORD_PARALLEL_MIN_ROWS or not fork_available():
+        for part, start, stop in ranges:
+            out.setdefault(part, Counter()).update(count_keywords(_iter_rows(source, rows[start:stop])))
+        return out
+
+    partial = forked_map(_count_forked_range, (source, rows), [(start, stop) for _, start, stop in ranges], workers)
+    for (part, _, _), counts in zip(ranges, partial):
+        out.setdefault(part, Counter()).update(counts)
+    return out
+
+
+def _split(part: int, start: int, stop: int, size: int) -> Iterator[Tuple[int, int, int]]:
+    for a in range(start, stop, size):
+        yield part, a, min(a + size, stop)
+
+
+def keyword_counts(df: pd.DataFrame, texts: Optional[TextStore] = None, workers: Optional[int] = 1) -> Counter:
+    """``count_keywords`` over the messages of ``df``; ``texts`` supplies the bodies when
+    ``df`` keeps them out of line. ``workers`` as in ``_count_ranges``."""
+    source, rows = text_source(df, texts)
+    return _count_ranges(source, rows, list(_split(0, 0, len(rows), KEYWORD_TASK_ROWS)), workers).get(0, Counter())
+
+
+@dataclass(frozen=True, eq=False)
+class KeywordCounts:
+    """Keyword counts per partition of the messages, as a sparse CSR matrix.
+
+    Partition ``i`` (row ``i`` of ``keys``, by default a local year and category) counts
+    ``data[indptr[i]:indptr[i + 1]]`` occurrences of the words
+    ``indices[indptr[i]:indptr[i + 1]]`` of ``vocabulary``, which is sorted. Built once
+    per localised dataset, any union of partitions is summed without recounting text.
+    """
+
+    keys: pd.DataFrame
+    vocabulary: np.ndarray
+    indptr: np.ndarray
+    indices: np.ndarray
+    data: np.ndarray
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, texts: Optional[TextStore] = None,
+                   by: Sequence[str] = ("year", "category"), workers: Optional[int] = 1) -> "KeywordCounts":
+        """Count a frame from ``apply_timezone``, one partition per distinct ``by``."""
+        source, rows = text_source(df, texts)
+        g = df.groupby(list(by), dropna=False, observed=True, sort=True)
+        keys = g.size().reset_index()[list(by)]
+        codes = g.ngroup().to_numpy()
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(keys) + 1)).tolist()
+        ranges = [r for part in range(len(keys))
+                  for r in _split(part, bounds[part], bounds[part + 1], KEYWORD_TASK_ROWS)]
+        counts = _count_ranges(source, rows[order], ranges, workers)
+
+        vocabulary = sorted(set().union(*counts.values()))
+        ids = {word: i for i, word in enumerate(vocabulary)}
+        indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+        indices, data = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        for part in range(len(keys)):
+            c = counts.pop(part, {})
+            indices.append(np.fromiter((ids[word] for word in c), dtype=np.int64, count=len(c)))
+            data.append(np.fromiter(c.values(), dtype=np.int64, count=len(c)))
+            indptr[part + 1] = indptr[part] + len(c)
+        return cls(keys, np.asarray(vocabulary, dtype=object), indptr, np.concatenate(indices), np.concatenate(data))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def totals(self, **where: Any) -> np.ndarray:
+        """Counts per vocabulary word over the partitions matching ``where`` (e.g.
+        ``year=2024``; no filter means all of them)."""
+        keep = np.ones(len(self.keys), dtype=bool)
+        for column, value in where.items():
+            keep &= (self.keys[column] == value).to_numpy()
+        entries = np.repeat(keep, np.diff(self.indptr))
+        return np.bincount(self.indices[entries], weights=self.data[entries],
+                           minlength=len(self.vocabulary)).astype(np.int64)
+
+    def top(self, n: int = 25, **where: Any) -> pd.DataFrame:
+        """As ``top_counts`` over the partitions matching ``where``."""
+        totals = self.totals(**where)
+        k = min(n, int(np.count_nonzero(totals)))
+        if k <= 0:
+            return pd.DataFrame(columns=["keyword", "count"])
+        # Everything tied with the k-th largest count is a candidate; the vocabulary is
+        # sorted, so ordering candidates by (-count, index) breaks ties alphabetically.
+        threshold = np.partition(totals, len(totals) - k)[len(totals) - k]
+        candidates = np.flatnonzero(totals >= threshold)
+        candidates = candidates[np.lexsort((candidates, -totals[candidates]))][:k]
+        return pd.DataFrame({"keyword": self.vocabulary[candidates], "count": totals[candidates]})
@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+_SQL_BATCH = 500  # stays under SQLite's bound-parameter limit
+# In-memory tier size. Each entry costs about 170 bytes, so the default is about 11 MB
+# per process; 0 turns the tier off.
+DEFAULT_MEMO_MAX_ENTRIES = 1 << 16
+# Disk hits whose recency update is deferred until the next store, or until this many.
+_TOUCH_FLUSH = 10_000
+
+
+def text_key(namespace: str, text: str) -> bytes:
+    """Content hash of ``text`` within ``namespace`` (e.g. a tokenizer or rules version)."""
+    h = hashlib.blake2b(namespace.encode("utf-8"), digest_size=16)
+    h.update(b"\0")
+    h.update(text.encode("utf-8", "surrogatepass"))
+    return h.digest()
+
+
+@dataclass(frozen=True)
+class MemoStats:
+    memory_hits: int
+    disk_hits: int
+    misses: int
+    memory_entries: int
+
+    @property
+    def lookups(self) -> int:
+        return self.memory_hits + self.disk_hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return (self.memory_hits + self.disk_hits) / self.lookups if self.lookups else 0.0
+
+
+class TextMemo:
+    """Values computed from message text (token counts, categories...), keyed by content hash.
+
+    Lookups go through an in-memory LRU of ``max_entries`` (0 for none) and then, when ``path`` is
+    given, a SQLite file holding at most ``max_disk_entries`` rows (least recently
+    used rows are deleted first). The file can be shared by several processes; any
+    error on it is treated as a miss so the memo never breaks processing. Keys include
+    a namespace, so one memo can hold values for several tokenizers or rule sets.
+    Thread-safe: the in-memory tier and the SQLite connection have separate locks, so a
+    long disk lookup (e.g. a background job's) never blocks memory hits, and it takes the
+    connection a batch at a time. Recency of disk hits is written with the next store
+    (or every ``_TOUCH_FLUSH`` hits) rather than on every read.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MEMO_MAX_ENTRIES, path: Optional[Union[str, Path]] = None,
+                 max_disk_entries: int = 20_000_000) -> None:
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._lru: "OrderedDict[bytes, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Guards the connection, _disk_entries and _touched.
+        self._db_lock = threading.Lock()
+        self._touched: Dict[bytes, int] = {}
+        self._memory_hits = self._disk_hits = self._misses = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._disk_entries = 0
+        if path is not None:
+            self._open(Path(path))
+
+    def _open(self, path: Path) -> None:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(str(path), timeout=30, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS memo (k BLOB PRIMARY KEY, v, used INTEGER NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS memo_used ON memo (used)")
+            self._disk_entries = db.execute("SELECT COUNT(*) FROM memo").fetchone()[0]
+            self._db = db
+            self._trim()
+        except sqlite3.Error:
+            self._db = None
+
+    def stats(self) -> MemoStats:
+        with self._lock:
+            return MemoStats(self._memory_hits, self._disk_hits, self._misses, len(self._lru))
+
+    def lookup(self, keys: Sequence[bytes]) -> List[Optional[Any]]:
+        """Values for ``keys`` (None where unknown), refreshing their recency."""
+        out: List[Optional[Any]] = [None] * len(keys)
+        missing: List[int] = []
+        with self._lock:
+            for i, k in enumerate(keys):
+                value = self._lru.get(k)
+                if value is None:
+                    missing.append(i)
+                else:
+                    self._lru.move_to_end(k)
+                    out[i] = value
+            self._memory_hits += len(keys) - len(missing)
+
+        # A batch at a time, so neither lock is held for long on a big lookup.
+        for start in range(0, len(missing), _SQL_BATCH):
+            part = missing[start:start + _SQL_BATCH]
+            found: Dict[bytes, Any] = self._disk_lookup([keys[i] for i in part])
+            with self._lock:
+                for i in part:
+                    value = found.get(keys[i])
+                    if value is not None:
+                        out[i] = value
+                        self._remember(keys[i], value)
+                self._disk_hits += len(found)
+                self._misses += len(part) - len(found)
+        return out
+
+    def store(self, keys: Sequence[bytes], values: Sequence[Any]) -> None:
+        with self._lock:
+            for k, v in zip(keys, values):
+                self._remember(k, v)
+        self._disk_store(keys, values)
+
+    def map(self, namespace: str, texts: Sequence[str], compute: Callable[[List[str]], Sequence[Any]]) -> List[Any]:
+        """``compute(texts)`` through the memo: only texts not seen before are computed."""
+        keys = [text_key(namespace, t) for t in texts]
+        values = self.lookup(keys)
+        todo = [i for i, v in enumerate(values) if v is None]
+        if todo:
+            computed = compute([texts[i] for i in todo])
+            for i, v in zip(todo, computed):
+                values[i] = v
+            self.store([keys[i] for i in todo], computed)
+        return values
+
+    def wrap(self, namespace: str, fn: Callable[[str], Any]) -> Callable[[str], Any]:
+        """Memoise a single-text function."""
+
+        def memoised(text: str) -> Any:
+            return self.map(namespace, [text], lambda missing: [fn(t) for t in missing])[0]
+
+        return memoised
+
+    def _remember(self, key: bytes, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        self._lru[key] = value
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _disk_lookup(self, keys: List[bytes]) -> Dict[bytes, Any]:
+        if self._db is None:
+            return {}
+        found: Dict[bytes, Any] = {}
+        try:
+            for start in range(0, len(keys), _SQL_BATCH):
+                part = keys[start:start + _SQL_BATCH]
+                marks = ",".join("?" * len(part))
+                with self._db_lock:
+                    found.update(self._db.execute(f"SELECT k, v FROM memo WHERE k IN ({marks})", part).fetchall())
+        except sqlite3.Error:
+            pass
+        if found:
+            now = time.time_ns()
+            with self._db_lock:
+                self._touched.update(dict.fromkeys(found, now))
+                if len(self._touched) >= _TOUCH_FLUSH:
+                    try:
+                        self._db.execute("BEGIN")
+                        self._flush_touched()
+                        self._db.execute("COMMIT")
+                    except sqlite3.Error:
+                        self._rollback()
+        return found
+
+    def _disk_store(self, keys: Sequence[bytes], values: Sequence[Any]) -> None:
+        if self._db is None or not keys:
+            return
+        now = time.time_ns()
+        with self._db_lock:
+            try:
+                before = self._db.total_changes
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO memo (k, v, used) VALUES (?, ?, ?)",
+                    [(k, v, now) for k, v in zip(keys, values)],
+                )
+                inserted = self._db.total_changes - before
+                self._flush_touched()
+                self._db.execute("COMMIT")
+                self._disk_entries += inserted
+                self._trim()
+            except sqlite3.Error:
+                self._rollback()
+
+    def _flush_touched(self) -> None:
+        """Write the deferred recency of disk hits, inside the caller's transaction."""
+        touched, self._touched = self._touched, {}
+        self._db.executemany("UPDATE memo SET used = ? WHERE k = ?", [(t, k) for k, t in touched.items()])
+
+    def _rollback(self) -> None:
+        try:
+            self._db.execute("ROLLBACK")
+        except sqlite3.Error:
+            pass
+
+    def _trim(self) -> None:
+        excess = self._disk_entries - self.max_disk_entries
+        if excess > 0 and self._db is not None:
+            deleted = self._db.execute(
+                "DELETE FROM memo WHERE k IN (SELECT k FROM memo ORDER BY used LIMIT ?)", (excess,)
+            ).rowcount
+            self._disk_entries -= max(deleted, 0)
+
+
+def memo_from_env() -> TextMemo:
+    """Build the memo configured by ``CHATGPT_WRAPPED_MEMO_PATH``, ``CHATGPT_WRAPPED_MEMO_MAX_ENTRIES``
+    and ``CHATGPT_WRAPPED_MEMO_MAX_DISK_ENTRIES``.
+
+    The in-memory tier holds ``DEFAULT_MEMO_MAX_ENTRIES`` unless configured (0 turns it
+    off); the SQLite tier is on only when a path is set.
+    """
+    path = os.environ.get("CHATGPT_WRAPPED_MEMO_PATH") or None
+    max_entries = int(os.environ.get("CHATGPT_WRAPPED_MEMO_MAX_ENTRIES", str(DEFAULT_MEMO_MAX_ENTRIES)))
+    max_disk_entries = int(os.environ.get("CHATGPT_WRAPPED_MEMO_MAX_DISK_ENTRIES", "20000000"))
+    return TextMemo(max_entries=max_entries, path=path, max_disk_entries=max_disk_entries)
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import gc
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# One forked pool at a time per process: gc.freeze() is process-wide, and serialising
+# keeps concurrent callers (e.g. Streamlit sessions) from competing for the same cores.
+_FORK_LOCK = threading.Lock()
+
+# Set in each worker by the pool's initializer. With the fork start method initargs are
+# inherited, not pickled, so a pool's input never crosses the process boundary and each
+# pool sees only its own.
+_WORKER_INPUT: Any = None
+
+
+def fork_available() -> bool:
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def _init_worker(payload: Any) -> None:
+    global _WORKER_INPUT
+    _WORKER_INPUT = payload
+
+
+def _run(fn: Callable[..., T], task: Tuple) -> T:
+    return fn(_WORKER_INPUT, *task)
+
+
+def forked_map(fn: Callable[..., T], payload: Any, tasks: Iterable[Tuple], workers: int) -> Iterator[T]:
+    """Yield ``fn(payload, *task)`` for each task, in order, computed in ``workers``
+    forked processes.
+
+    Workers inherit ``payload`` through the fork, so only the tasks and results are
+    pickled; ``fn`` must be a module-level function. At most ``2 * workers`` tasks are in
+    flight. Calls are serialised process-wide.
+
+    Forking a multi-threaded process (such as the Streamlit server, with its event loop,
+    background pools and SQLite connections) copies only the calling thread: a child
+    that needs a lock another thread held at the fork can deadlock. Use it from batch
+    jobs and benchmarks; in the app it is opt-in (``CHATGPT_WRAPPED_PARSE_WORKERS``).
+    """
+    with _FORK_LOCK:
+        # Keep the children's garbage collector off the inherited heap.
+        gc.freeze()
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"),
+                                     initializer=_init_worker, initargs=(payload,)) as pool:
+                pending: deque = deque()
+                for task in tasks:
+                    pending.append(pool.submit(_run, fn, tuple(task)))
+                    if len(pending) >= 2 * workers:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+        finally:
+            gc.unfreeze()
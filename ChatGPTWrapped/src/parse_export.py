@@ -1,10 +1,17 @@
 from __future__ import annotations
 
+import codecs
+import io
+import json
+import math
+import os
+from array import array
 from dataclasses import dataclass
-from datetime import datetime
-from typing import Any, Dict, Iterable, List, Union
+from typing import IO, Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
 
-from dateutil import tz
+import numpy as np
+
+from .parallel import fork_available, forked_map
 
 
 @dataclass(frozen=True)
@@ -13,7 +20,7 @@ class ParsedMessage:
     conversation_title: str
     message_id: str
     role: str
-    created_at: datetime
+    created_at: float  # UTC epoch seconds, as in the export's create_time
     text: str
 
 
@@ -42,14 +49,47 @@ def _safe_text_from_message(message: Dict[str, Any]) -> str:
     return ""
 
 
-def _iter_messages_from_conversation(conv: Dict[str, Any], timezone: str) -> Iterable[ParsedMessage]:
-    conv_id = str(conv.get("id") or "")
-    title = str(conv.get("title") or "(untitled)")
+BRANCHES_ALL = "all"
+BRANCHES_ACTIVE = "active"
+
+
+def _active_thread(mapping: Dict[str, Any], current_node: Any) -> Optional[List[Dict[str, Any]]]:
+    """Nodes from the root down to ``current_node`` following ``parent`` pointers."""
+    thread: List[Dict[str, Any]] = []
+    seen = set()
+    node_id = current_node
+    while isinstance(node_id, str) and node_id in mapping and node_id not in seen:
+        seen.add(node_id)
+        node = mapping[node_id]
+        thread.append(node)
+        node_id = node.get("parent")
+    thread.reverse()
+    return thread or None
+
+
+def branch_count(conv: Dict[str, Any]) -> int:
+    """Number of leaf nodes, i.e. distinct threads left by edits and regenerations."""
+    mapping = conv.get("mapping") or {}
+    parents = {node.get("parent") for node in mapping.values()}
+    return sum(1 for node_id in mapping if node_id not in parents)
+
+
+def _iter_raw_messages(conv: Dict[str, Any], branches: str = BRANCHES_ALL) -> Iterator[Tuple[str, str, float, str]]:
+    """Yield ``(message_id, role, create_time, text)`` for each usable node in a conversation.
+
+    ``branches="active"`` walks only the thread ending at ``current_node`` (what the
+    ChatGPT UI shows), skipping edited and regenerated siblings. Conversations without
+    a usable ``current_node`` fall back to every branch.
+    """
     mapping = conv.get("mapping") or {}
 
-    tzinfo = tz.gettz(timezone)
+    nodes: Iterable[Dict[str, Any]] = mapping.values()
+    if branches == BRANCHES_ACTIVE:
+        nodes = _active_thread(mapping, conv.get("current_node")) or nodes
+    elif branches != BRANCHES_ALL:
+        raise ValueError(f"Unknown branches mode: {branches!r} (expected 'all' or 'active').")
 
-    for node in mapping.values():
+    for node in nodes:
         msg = node.get("message")
         if not msg:
             continue
@@ -65,22 +105,211 @@ def _iter_messages_from_conversation(conv: Dict[str, Any], timezone: str) -> Ite
         if not isinstance(ct, (int, float)):
             continue
 
-        created_at = datetime.fromtimestamp(ct, tz=tzinfo)
-        msg_id = str(msg.get("id") or "")
+        yield str(msg.get("id") or ""), role, ct, text
+
 
+def _iter_messages_from_conversation(conv: Dict[str, Any], branches: str = BRANCHES_ALL) -> Iterable[ParsedMessage]:
+    conv_id = str(conv.get("id") or "")
+    title = str(conv.get("title") or "(untitled)")
+
+    for msg_id, role, ct, text in _iter_raw_messages(conv, branches):
         yield ParsedMessage(
             conversation_id=conv_id,
             conversation_title=title,
             message_id=msg_id,
             role=role,
-            created_at=created_at,
+            created_at=float(ct),
             text=text,
         )
 
 
-def parse_conversations(conversations_json: Union[List[Dict[str, Any]], Dict[str, Any]],
-                        timezone: str = "Australia/Melbourne") -> List[ParsedMessage]:
-    """Parse conversations.json content into a list of ParsedMessage."""
+def _epoch_us(ct: float) -> int:
+    """Microseconds since the epoch, rounded like ``datetime.fromtimestamp`` (half-even on the fraction)."""
+    frac, whole = math.modf(ct)
+    return int(whole) * 1_000_000 + round(frac * 1e6)
+
+
+@dataclass(frozen=True, eq=False)
+class MessageBatch:
+    """Columnar parse output: one typed array per field rather than one object per message.
+
+    Conversation ids, titles and roles are int32 codes into interned value lists,
+    timestamps are int64 UTC epoch microseconds and all message text lives in one
+    UTF-8 buffer, with message ``i`` spanning ``text_offsets[i]:text_offsets[i + 1]``.
+
+    ``conversation_update_times`` (aligned with ``conversation_ids``, NaN when absent)
+    forms the manifest used for incremental re-imports, and ``conversation_branch_counts``
+    holds each conversation's number of threads (see ``branch_count``). Conversations listed in
+    ``unchanged_conversations`` matched a prior import and were not walked, so they
+    contribute no messages to this batch.
+    """
+
+    conversation_codes: np.ndarray
+    conversation_ids: List[str]
+    title_codes: np.ndarray
+    titles: List[str]
+    role_codes: np.ndarray
+    roles: List[str]
+    message_ids: np.ndarray
+    created_at_us: np.ndarray
+    text_buffer: bytes
+    text_offsets: np.ndarray
+    conversation_update_times: np.ndarray
+    conversation_branch_counts: np.ndarray
+    unchanged_conversations: List[str]
+
+    def __len__(self) -> int:
+        return int(self.created_at_us.shape[0])
+
+    def text(self, i: int) -> str:
+        start, end = self.text_offsets[i], self.text_offsets[i + 1]
+        return self.text_buffer[start:end].decode("utf-8")
+
+    def iter_texts(self) -> Iterator[str]:
+        buf = memoryview(self.text_buffer)
+        offsets = self.text_offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield str(buf[start:end], "utf-8")
+
+    def column(self, name: str) -> np.ndarray:
+        """Expand an interned column to an object array that shares the interned strings."""
+        codes, values = {
+            "conversation_id": (self.conversation_codes, self.conversation_ids),
+            "conversation_title": (self.title_codes, self.titles),
+            "role": (self.role_codes, self.roles),
+        }[name]
+        return np.asarray(values, dtype=object)[codes] if len(codes) else np.empty(0, dtype=object)
+
+    def manifest(self) -> Dict[str, float]:
+        """Map every conversation in the export to its ``update_time``."""
+        return dict(zip(self.conversation_ids, self.conversation_update_times.tolist()))
+
+    def branch_counts(self) -> Dict[str, int]:
+        return dict(zip(self.conversation_ids, self.conversation_branch_counts.tolist()))
+
+
+def concat_batches(batches: List[MessageBatch]) -> MessageBatch:
+    """Concatenate batches in order, re-interning their codes into shared value lists."""
+    if len(batches) == 1:
+        return batches[0]
+
+    conversations, titles, roles = _Interner(), _Interner(), _Interner()
+
+    def remap(interner: _Interner, codes: np.ndarray, values: List[str]) -> np.ndarray:
+        lookup = np.fromiter((interner(v) for v in values), dtype=np.int32, count=len(values))
+        return lookup[codes] if len(values) else codes
+
+    text_lengths = [len(b.text_buffer) for b in batches]
+    text_starts = np.cumsum([0] + text_lengths[:-1], dtype=np.int64)
+    offsets = [np.zeros(1, dtype=np.int64)]
+    offsets += [b.text_offsets[1:] + start for b, start in zip(batches, text_starts)]
+
+    conversation_codes = [remap(conversations, b.conversation_codes, b.conversation_ids) for b in batches]
+    update_times: Dict[str, float] = {}
+    branches: Dict[str, int] = {}
+    for b in batches:
+        update_times.update(b.manifest())
+        branches.update(b.branch_counts())
+
+    return MessageBatch(
+        conversation_codes=np.concatenate([np.zeros(0, dtype=np.int32)] + conversation_codes),
+        conversation_ids=conversations.values,
+        title_codes=np.concatenate([np.zeros(0, dtype=np.int32)] + [remap(titles, b.title_codes, b.titles) for b in batches]),
+        titles=titles.values,
+        role_codes=np.concatenate([np.zeros(0, dtype=np.int32)] + [remap(roles, b.role_codes, b.roles) for b in batches]),
+        roles=roles.values,
+        message_ids=np.concatenate([np.zeros(0, dtype=object)] + [b.message_ids for b in batches]),
+        created_at_us=np.concatenate([np.zeros(0, dtype=np.int64)] + [b.created_at_us for b in batches]),
+        text_buffer=b"".join(b.text_buffer for b in batches),
+        text_offsets=np.concatenate(offsets),
+        conversation_update_times=np.array([update_times[c] for c in conversations.values], dtype=np.float64),
+        conversation_branch_counts=np.array([branches[c] for c in conversations.values], dtype=np.int32),
+        unchanged_conversations=[c for b in batches for c in b.unchanged_conversations],
+    )
+
+
+class _Interner:
+    def __init__(self) -> None:
+        self.codes: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def __call__(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class MessageBatchBuilder:
+    """Accumulate conversations straight into compact typed arrays."""
+
+    def __init__(self, branches: str = BRANCHES_ALL) -> None:
+        self.branches = branches
+        self._conversations = _Interner()
+        self._titles = _Interner()
+        self._roles = _Interner()
+        self._conversation_codes = array("i")
+        self._title_codes = array("i")
+        self._role_codes = array("i")
+        self._message_ids: List[str] = []
+        self._created_at_us = array("q")
+        self._text = bytearray()
+        self._text_offsets = array("q", [0])
+        self._update_times = array("d")
+        self._branch_counts = array("i")
+        self._unchanged: List[str] = []
+
+    def add_conversation(self, conv: Dict[str, Any], unchanged: Optional[Mapping[str, float]] = None) -> None:
+        """Append a conversation's messages, or only its manifest entry when ``unchanged``
+        (a prior import's manifest) already has it at the same ``update_time``."""
+        conv_id = str(conv.get("id") or "")
+        conv_code = self._conversations(conv_id)
+        ut = conv.get("update_time")
+        ut = float(ut) if isinstance(ut, (int, float)) else math.nan
+        branches = branch_count(conv)
+        if conv_code == len(self._update_times):
+            self._update_times.append(ut)
+            self._branch_counts.append(branches)
+        else:
+            self._update_times[conv_code] = ut
+            self._branch_counts[conv_code] = branches
+
+        if conv_id and unchanged is not None and unchanged.get(conv_id) == ut:
+            self._unchanged.append(conv_id)
+            return
+
+        title_code = self._titles(str(conv.get("title") or "(untitled)"))
+
+        for msg_id, role, ct, text in _iter_raw_messages(conv, self.branches):
+            self._conversation_codes.append(conv_code)
+            self._title_codes.append(title_code)
+            self._role_codes.append(self._roles(role))
+            self._message_ids.append(msg_id)
+            self._created_at_us.append(_epoch_us(ct))
+            self._text += text.encode("utf-8")
+            self._text_offsets.append(len(self._text))
+
+    def build(self) -> MessageBatch:
+        # The arrays are wrapped rather than copied, so the builder is spent afterwards.
+        return MessageBatch(
+            conversation_codes=np.frombuffer(self._conversation_codes, dtype=np.int32),
+            conversation_ids=self._conversations.values,
+            title_codes=np.frombuffer(self._title_codes, dtype=np.int32),
+            titles=self._titles.values,
+            role_codes=np.frombuffer(self._role_codes, dtype=np.int32),
+            roles=self._roles.values,
+            message_ids=np.array(self._message_ids, dtype=object),
+            created_at_us=np.frombuffer(self._created_at_us, dtype=np.int64),
+            text_buffer=self._text,
+            text_offsets=np.frombuffer(self._text_offsets, dtype=np.int64),
+            conversation_update_times=np.frombuffer(self._update_times, dtype=np.float64),
+            conversation_branch_counts=np.frombuffer(self._branch_counts, dtype=np.int32),
+            unchanged_conversations=self._unchanged,
+        )
+
+
+def _conversation_list(conversations_json: Union[List[Dict[str, Any]], Dict[str, Any]]) -> List[Any]:
     if isinstance(conversations_json, dict) and "conversations" in conversations_json:
         conversations = conversations_json["conversations"]
     else:
@@ -88,9 +317,216 @@ def parse_conversations(conversations_json: Union[List[Dict[str, Any]], Dict[str
 
     if not isinstance(conversations, list):
         raise ValueError("Unexpected conversations.json format: expected a list of conversations.")
+    return conversations
+
 
-    out: List[ParsedMessage] = []
+def iter_messages(conversations: Iterable[Any], branches: str = BRANCHES_ALL) -> Iterator[ParsedMessage]:
+    """Yield ParsedMessage for each conversation in turn, skipping non-dict entries."""
     for conv in conversations:
         if isinstance(conv, dict):
-            out.extend(list(_iter_messages_from_conversation(conv, timezone=timezone)))
-    return out
+            yield from _iter_messages_from_conversation(conv, branches)
+
+
+# Below this many conversations the cost of starting workers outweighs the speedup.
+PARALLEL_MIN_CONVERSATIONS = 2000
+PARALLEL_CHUNK_SIZE = 250
+
+
+def _build_chunk(chunk: Iterable[Any], unchanged: Optional[Mapping[str, float]] = None,
+                 branches: str = BRANCHES_ALL) -> MessageBatch:
+    builder = MessageBatchBuilder(branches)
+    for conv in chunk:
+        if isinstance(conv, dict):
+            builder.add_conversation(conv, unchanged=unchanged)
+    return builder.build()
+
+
+def _build_forked_range(payload: Tuple[Sequence[Any], Optional[Mapping[str, float]], str],
+                        start: int, stop: int) -> MessageBatch:
+    conversations, unchanged, branches = payload
+    return _build_chunk(conversations[start:stop], unchanged, branches)
+
+
+def _build_parallel(conversations: Sequence[Any], unchanged: Optional[Mapping[str, float]], branches: str,
+                    workers: int, chunk_size: int) -> MessageBatch:
+    # Workers inherit the conversation list, so only (start, stop) ranges and the
+    # finished batches cross the process boundary. Pickling the decoded conversations
+    # to workers costs more than parsing them.
+    tasks = [(start, start + chunk_size) for start in range(0, len(conversations), chunk_size)]
+    return concat_batches(list(forked_map(_build_forked_range, (conversations, unchanged, branches), tasks, workers)))
+
+
+def build_message_batch(conversations: Union[Iterable[Any], Dict[str, Any]],
+                        workers: Optional[int] = 1,
+                        chunk_size: int = PARALLEL_CHUNK_SIZE,
+                        unchanged: Optional[Mapping[str, float]] = None,
+                        branches: str = BRANCHES_ALL) -> MessageBatch:
+    """Parse conversations (a list, the wrapped dict form or a stream) into a MessageBatch.
+
+    With ``workers`` > 1 (``None`` means one per CPU) conversations are parsed in chunks
+    across a pool of forked processes and merged in input order, so the result is
+    identical to the serial path. A stream is materialised first in that mode, trading
+    the bounded memory of streaming for speed. Inputs smaller than
+    ``PARALLEL_MIN_CONVERSATIONS``, or platforms without ``fork``, are parsed serially.
+    See ``parallel.forked_map`` on forking inside a multi-threaded server.
+
+    ``unchanged`` is the manifest of a prior import (see ``MessageBatch.manifest``);
+    conversations it already holds at the same ``update_time`` are skipped.
+    ``branches="active"`` keeps only each conversation's current thread.
+    """
+    if isinstance(conversations, dict):
+        conversations = _conversation_list(conversations)
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and fork_available():
+        if not isinstance(conversations, Sequence):
+            conversations = list(conversations)
+        if len(conversations) >= PARALLEL_MIN_CONVERSATIONS:
+            return _build_parallel(conversations, unchanged, branches, workers, chunk_size)
+
+    return _build_chunk(conversations, unchanged, branches)
+
+
+def parse_conversations(conversations_json: Union[List[Dict[str, Any]], Dict[str, Any]],
+                        branches: str = BRANCHES_ALL) -> List[ParsedMessage]:
+    """Parse conversations.json content into a list of ParsedMessage."""
+    return list(iter_messages(_conversation_list(conversations_json), branches))
+
+
+class BufferReader(io.RawIOBase):
+    """Read-only, seekable binary file over an in-memory buffer (bytes, memoryview, mmap).
+
+    ``BytesIO`` copies any buffer that is not ``bytes`` (and ``getbuffer()`` unshares
+    its data), so wrapping an upload in one can duplicate the whole export. This reader
+    only copies the slices that are actually read, which lets ``zipfile`` decompress a
+    member straight out of the upload.
+    """
+
+    def __init__(self, data: Union[bytes, bytearray, memoryview]) -> None:
+        super().__init__()
+        self._view = memoryview(data).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b: Any) -> int:
+        chunk = self._view[self._pos:self._pos + len(b)]
+        n = len(chunk)
+        memoryview(b).cast("B")[:n] = chunk
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = len(self._view) + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence!r}")
+        if pos < 0:
+            raise ValueError("Negative seek position.")
+        self._pos = pos
+        return pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self) -> None:
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+_STREAM_CHUNK_SIZE = 1 << 20
+_JSON_WS = " \t\n\r"
+
+
+def iter_conversations(stream: IO[bytes], chunk_size: int = _STREAM_CHUNK_SIZE) -> Iterator[Any]:
+    """Yield the elements of a conversations.json array one at a time from a byte stream.
+
+    Only the conversation currently being decoded is buffered, so peak memory is bounded
+    by the largest single conversation instead of the whole export. Exports wrapped as
+    ``{"conversations": [...]}`` are rare and small, so they fall back to a full load.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    decode = json.JSONDecoder().raw_decode
+    buf = ""
+    pos = 0
+    eof = False
+
+    def fill(min_chars: int = 0) -> None:
+        nonlocal buf, pos, eof
+        # Read at least as much as is already pending so retries on a large
+        # conversation stay linear rather than re-decoding it once per chunk.
+        want = max(chunk_size, min_chars)
+        chunk = stream.read(want)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + decoder.decode(chunk or b"", final=not chunk)
+        pos = 0
+
+    def skip_ws() -> bool:
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in _JSON_WS:
+                pos += 1
+            if pos < len(buf):
+                return True
+            if eof:
+                return False
+            fill()
+
+    if not skip_ws():
+        raise ValueError("Unexpected conversations.json format: the file is empty.")
+
+    if buf[pos] == "{":
+        while not eof:
+            fill(len(buf))
+        yield from _conversation_list(json.loads(buf[pos:]))
+        return
+
+    if buf[pos] != "[":
+        raise ValueError("Unexpected conversations.json format: expected a list of conversations.")
+    pos += 1
+
+    first = True
+    while True:
+        if not skip_ws():
+            raise ValueError("Unexpected conversations.json format: the conversations list is truncated.")
+        if buf[pos] == "]":
+            return
+        if not first:
+            if buf[pos] != ",":
+                raise ValueError("Unexpected conversations.json format: expected ',' between conversations.")
+            pos += 1
+            if not skip_ws():
+                raise ValueError("Unexpected conversations.json format: the conversations list is truncated.")
+        first = False
+
+        while True:
+            try:
+                item, end = decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill(len(buf) - pos)
+                continue
+            # A scalar cut at the buffer edge can still decode (e.g. "12" of "123").
+            if end == len(buf) and not eof:
+                fill(len(buf) - pos)
+                continue
+            break
+
+        pos = end
+        yield item
+
+
+def parse_conversations_stream(stream: IO[bytes], branches: str = BRANCHES_ALL) -> Iterator[ParsedMessage]:
+    """Stream ParsedMessage straight from a conversations.json byte stream."""
+    return iter_messages(iter_conversations(stream), branches)
@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .keywords import KEYWORD_PATTERN, is_keyword, keyword_terms
+from .text_store import TEXT_INDEX_COLUMN, TextStore, map_buffer
+
+# Bump when the index layout or the tokenisation changes so stored indexes are rebuilt.
+SEARCH_INDEX_VERSION = 1
+# Written last: an entry holds a complete index only once this file exists.
+SEARCH_META_FILE = "search_meta.json"
+SEARCH_CHUNK_ROWS = 2048
+SNIPPET_CHARS = 160
+# BM25 over conversations: term-frequency saturation and length normalisation.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TERMS_FILE = "search_terms.txt"
+_CONVERSATIONS_FILE = "search_conversations.json"
+_BUFFERS = ("postings", "freqs")
+_ARRAYS = ("posting_offsets", "freq_offsets", "message_conversation", "conversation_lengths")
+# Messages are joined on NUL, which keywords never contain, so every match found in a
+# block can be traced back to its message.
+_SEPARATOR = "\x00"
+_TOKEN = re.compile(KEYWORD_PATTERN.pattern + "|" + _SEPARATOR)
+_TERM_CHAR = "a-z0-9_'"
+
+
+def encode_varints(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """LEB128-encode non-negative integers: seven bits per byte, low bits first, the
+    high bit set on every byte but a value's last. Returns the bytes and the end offset
+    of each value."""
+    values = np.asarray(values, dtype=np.int64)
+    nbytes = np.ones(len(values), dtype=np.int64)
+    rest = values >> 7
+    while rest.any():
+        nbytes += rest > 0
+        rest >>= 7
+    ends = np.cumsum(nbytes)
+    starts = ends - nbytes
+    out = np.empty(int(ends[-1]) if len(ends) else 0, dtype=np.uint8)
+    for k in range(int(nbytes.max()) if len(nbytes) else 0):
+        sel = np.flatnonzero(nbytes > k)
+        more = (nbytes[sel] > k + 1).astype(np.int64) << 7
+        out[starts[sel] + k] = ((values[sel] >> (7 * k)) & 0x7F) | more
+    return out, ends
+
+
+def decode_varints(data: np.ndarray) -> np.ndarray:
+    """The integers ``encode_varints`` wrote to ``data``."""
+    data = np.asarray(data, dtype=np.uint8)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1)) if len(ends) else ends
+    lengths = ends - starts + 1
+    out = (data[starts] & 0x7F).astype(np.int64)
+    for k in range(1, int(lengths.max()) if len(lengths) else 0):
+        sel = np.flatnonzero(lengths > k)
+        out[sel] |= (data[starts[sel] + k] & 0x7F).astype(np.int64) << (7 * k)
+    return out
+
+
+def snippet(text: str, terms: Sequence[str], width: int = SNIPPET_CHARS) -> str:
+    """About ``width`` characters of ``text`` around the first of ``terms`` to appear as
+    a whole keyword, whitespace collapsed."""
+    text = " ".join(text.split())
+    match = None
+    if terms:
+        pattern = rf"(?<![{_TERM_CHAR}])(?:{'|'.join(map(re.escape, terms))})(?![{_TERM_CHAR}])"
+        match = re.search(pattern, text, re.IGNORECASE)
+    end = min(len(text), max(0, match.start() - width // 3 if match else 0) + width)
+    start = max(0, end - width)
+    return ("…" if start else "") + text[start:end] + ("…" if end < len(text) else "")
+
+
+def search_terms(query: str) -> List[str]:
+    """The keywords of ``query`` that a search matches on."""
+    return list(dict.fromkeys(keyword_terms(query)))
+
+
+@dataclass(frozen=True, eq=False)
+class SearchIndex:
+    """Inverted index from keyword to the messages, and so conversations, using it.
+
+    ``terms`` is the sorted vocabulary, tokenised as for ``top_keywords``. Term ``i``'s
+    postings are the ascending message ids (``TextStore`` rows) that use it, stored as
+    varint-encoded gaps in ``postings[posting_offsets[i]:posting_offsets[i + 1]]``, with
+    the matching in-message counts in ``freqs`` the same way. ``message_conversation``
+    maps a message to its row of ``conversations`` (-1 when not indexed) and
+    ``conversation_lengths`` counts the keywords of each conversation. Queries decode
+    only their terms' postings and never touch the text.
+    """
+
+    terms: np.ndarray
+    postings: np.ndarray
+    posting_offsets: np.ndarray
+    freqs: np.ndarray
+    freq_offsets: np.ndarray
+    message_conversation: np.ndarray
+    conversations: np.ndarray
+    conversation_lengths: np.ndarray
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, texts: TextStore) -> "SearchIndex":
+        """Index the messages of ``df`` (a frame keeping ``msg_idx``) from ``texts``, a
+        block of ``SEARCH_CHUNK_ROWS`` messages at a time."""
+        rows = df[TEXT_INDEX_COLUMN].to_numpy(dtype=np.int64)
+        codes, conversations = pd.factorize(df["conversation_id"].to_numpy(dtype=object))
+        message_conversation = np.full(len(texts), -1, dtype=np.int32)
+        message_conversation[rows] = codes
+        rows = np.sort(rows)
+
+        vocab: Dict[str, int] = {}
+        terms, messages, freqs = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        for start in range(0, len(rows), SEARCH_CHUNK_ROWS):
+            block = rows[start:start + SEARCH_CHUNK_ROWS]
+            text = _SEPARATOR.join(t.replace(_SEPARATOR, " ") for t in texts.iter_texts(block)).lower()
+            words, uniques = pd.factorize(np.asarray(_TOKEN.findall(text), dtype=object))
+            ids = np.fromiter(
+                (-2 if w == _SEPARATOR else vocab.setdefault(w, len(vocab)) if is_keyword(w) else -1 for w in uniques),
+                dtype=np.int64, count=len(uniques),
+            )
+            term = ids[words]
+            message = np.cumsum(term == -2)  # separators seen so far: the match's message
+            keep = term >= 0
+            pairs, counts = np.unique(term[keep] * len(block) + message[keep], return_counts=True)
+            terms.append(pairs // len(block))
+            messages.append(block[pairs % len(block)])
+            freqs.append(counts)
+
+        # Renumber terms alphabetically; a stable sort keeps each term's messages ascending.
+        vocabulary = sorted(vocab)
+        rank = np.empty(len(vocab), dtype=np.int64)
+        rank[np.fromiter((vocab[w] for w in vocabulary), dtype=np.int64, count=len(vocab))] = np.arange(len(vocab))
+        term = rank[np.concatenate(terms)]
+        order = np.argsort(term, kind="stable")
+        message, freq = np.concatenate(messages)[order], np.concatenate(freqs)[order]
+        firsts = np.concatenate(([0], np.cumsum(np.bincount(term, minlength=len(vocab)))))
+        gaps = np.diff(message, prepend=0)
+        gaps[firsts[:-1]] = message[firsts[:-1]]
+
+        postings, posting_ends = encode_varints(gaps)
+        freq_bytes, freq_ends = encode_varints(freq)
+        lengths = np.bincount(message_conversation[message], weights=freq, minlength=len(conversations))
+        return cls(
+            terms=np.asarray(vocabulary, dtype=object),
+            postings=postings,
+            posting_offsets=np.concatenate(([0], posting_ends[firsts[1:] - 1])).astype(np.int64),
+            freqs=freq_bytes,
+            freq_offsets=np.concatenate(([0], freq_ends[firsts[1:] - 1])).astype(np.int64),
+            message_conversation=message_conversation,
+            conversations=np.asarray(conversations, dtype=object),
+            conversation_lengths=lengths.astype(np.int64),
+        )
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(getattr(self, name).nbytes for name in _BUFFERS + _ARRAYS))
+
+    def postings_for(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Ids of the messages using ``term``, ascending, and how often each does."""
+        i = int(np.searchsorted(self.terms, term))
+        if i == len(self.terms) or self.terms[i] != term:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        gaps = decode_varints(self.postings[self.posting_offsets[i]:self.posting_offsets[i + 1]])
+        return np.cumsum(gaps), decode_varints(self.freqs[self.freq_offsets[i]:self.freq_offsets[i + 1]])
+
+    def search(self, query: str, limit: int = 20, texts: Optional[TextStore] = None,
+               messages: Optional[Sequence[int]] = None) -> pd.DataFrame:
+        """Conversations matching ``query``, best first.
+
+        The query is tokenised like message text and conversations are ranked by BM25
+        over their keywords: any query term may match, rarer terms weigh more. Only the
+        message ids in ``messages`` match when given (e.g. the rows of a filtered frame).
+        Each result names its best-matching message, and with ``texts`` a snippet of it.
+        """
+        columns = ["conversation_id", "score", "hits", "message"] + (["snippet"] if texts is not None else [])
+        terms = search_terms(query)
+        allowed = None
+        if messages is not None:
+            allowed = np.zeros(len(self.message_conversation), dtype=bool)
+            allowed[np.asarray(messages, dtype=np.int64)] = True
+
+        n = len(self.conversations)
+        lengths = self.conversation_lengths
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(float(lengths.mean()) if n else 0.0, 1.0))
+        scores, hits = np.zeros(n), np.zeros(n, dtype=np.int64)
+        found, weights = [np.empty(0, dtype=np.int64)], [np.empty(0)]
+        for term in terms:
+            ids, freq = self.postings_for(term)
+            if allowed is not None:
+                keep = allowed[ids]
+                ids, freq = ids[keep], freq[keep]
+            if not len(ids):
+                continue
+            tf = np.bincount(self.message_conversation[ids], weights=freq, minlength=n)
+            matching = np.count_nonzero(tf)
+            idf = np.log1p((n - matching + 0.5) / (matching + 0.5))
+            scores += idf * tf * (BM25_K1 + 1) / (tf + norm)
+            hits += tf.astype(np.int64)
+            found.append(ids)
+            weights.append(idf * freq)
+
+        matched = np.flatnonzero(hits)
+        if not len(matched):
+            return pd.DataFrame(columns=columns)
+        top = matched[np.lexsort((matched, -scores[matched]))][:limit]
+
+        # Best message of each top conversation: the highest idf-weighted hits, then the earliest.
+        rank = np.full(n, -1, dtype=np.int64)
+        rank[top] = np.arange(len(top))
+        ids, weight = np.concatenate(found), np.concatenate(weights)
+        keep = rank[self.message_conversation[ids]] >= 0
+        ids, inverse = np.unique(ids[keep], return_inverse=True)
+        weight = np.bincount(inverse, weights=weight[keep])
+        conv = rank[self.message_conversation[ids]]
+        order = np.lexsort((ids, -weight, conv))
+        firsts = order[np.concatenate(([True], conv[order][1:] != conv[order][:-1]))]
+        best = np.empty(len(top), dtype=np.int64)
+        best[conv[firsts]] = ids[firsts]
+
+        out = pd.DataFrame({
+            "conversation_id": self.conversations[top],
+            "score": scores[top],
+            "hits": hits[top],
+            "message": best,
+        })
+        if texts is not None:
+            out["snippet"] = [snippet(texts.text(i), terms) for i in best.tolist()]
+        return out
+
+    def save(self, directory: Union[str, Path]) -> None:
+        directory = Path(directory)
+        (directory / _TERMS_FILE).write_text("\n".join(self.terms.tolist()), encoding="utf-8")
+        with open(directory / _CONVERSATIONS_FILE, "w", encoding="utf-8") as fh:
+            json.dump(self.conversations.tolist(), fh)
+        for name in _BUFFERS:
+            getattr(self, name).tofile(directory / f"search_{name}.bin")
+        for name in _ARRAYS:
+            np.save(directory / f"search_{name}.npy", getattr(self, name))
+        (directory / SEARCH_META_FILE).write_text(json.dumps({"version": SEARCH_INDEX_VERSION}), encoding="utf-8")
+
+    @classmethod
+    def load(cls, directory: Union[str, Path]) -> "SearchIndex":
+        """Read a saved index, memory-mapping its postings. Raises ``ValueError`` for an
+        index saved by another ``SEARCH_INDEX_VERSION``."""
+        directory = Path(directory)
+        meta = json.loads((directory / SEARCH_META_FILE).read_text(encoding="utf-8"))
+        if meta.get("version") != SEARCH_INDEX_VERSION:
+            raise ValueError(f"Search index version {meta.get('version')} is not {SEARCH_INDEX_VERSION}.")
+        terms = (directory / _TERMS_FILE).read_text(encoding="utf-8")
+        with open(directory / _CONVERSATIONS_FILE, encoding="utf-8") as fh:
+            conversations = json.load(fh)
+        arrays: Dict[str, np.ndarray] = {}
+        for name in _BUFFERS:
+            arrays[name] = map_buffer(directory / f"search_{name}.bin")
+        for name in _ARRAYS:
+            arrays[name] = np.load(directory / f"search_{name}.npy", mmap_mode="r")
+        return cls(
+            terms=np.asarray(terms.split("\n") if terms else [], dtype=object),
+            conversations=np.asarray(conversations, dtype=object),
+            **arrays,
+        )
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .parse_export import MessageBatch
+
+TEXT_INDEX_COLUMN = "msg_idx"
+_BUFFER_FILE = "text.bin"
+_OFFSETS_FILE = "text_offsets.npy"
+
+
+@dataclass(frozen=True, eq=False)
+class TextStore:
+    """Message bodies kept outside the analytics frame.
+
+    All text lives in one UTF-8 byte buffer with row ``i`` spanning
+    ``offsets[i]:offsets[i + 1]``, the same layout as ``MessageBatch``. Frames built
+    with ``keep_text=False`` carry a ``msg_idx`` column pointing into the store, so
+    filtering and copying a frame never touches message bodies; they are decoded only
+    by the consumers that need them (keywords, CSV export, search).
+    """
+
+    buffer: np.ndarray
+    offsets: np.ndarray
+
+    @classmethod
+    def from_batch(cls, batch: MessageBatch) -> "TextStore":
+        """Share the batch's buffers without copying them."""
+        return cls(np.frombuffer(batch.text_buffer, dtype=np.uint8), batch.text_offsets)
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str]) -> "TextStore":
+        buf = bytearray()
+        offsets = [0]
+        for t in texts:
+            buf += (t or "").encode("utf-8")
+            offsets.append(len(buf))
+        return cls(np.frombuffer(buf, dtype=np.uint8), np.asarray(offsets, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return int(self.offsets.shape[0]) - 1
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.buffer.nbytes + self.offsets.nbytes)
+
+    def text(self, i: int) -> str:
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def iter_texts(self, rows: Optional[Sequence[int]] = None) -> Iterator[str]:
+        buf = memoryview(self.buffer)
+        if rows is None:
+            offsets = self.offsets.tolist()
+            for start, end in zip(offsets, offsets[1:]):
+                yield str(buf[start:end], "utf-8")
+            return
+        rows = np.asarray(rows, dtype=np.int64)
+        starts, ends = self.offsets[rows].tolist(), self.offsets[rows + 1].tolist()
+        for start, end in zip(starts, ends):
+            yield str(buf[start:end], "utf-8")
+
+    def texts(self, rows: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Decode ``rows`` (default: all) into an object array of str."""
+        count = len(self) if rows is None else len(rows)
+        return np.fromiter(self.iter_texts(rows), dtype=object, count=count)
+
+    def take(self, rows: Sequence[int]) -> "TextStore":
+        """A new store holding ``rows`` in order. Consecutive rows are copied as one run."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return TextStore(np.empty(0, dtype=np.uint8), np.zeros(1, dtype=np.int64))
+        lengths = self.offsets[rows + 1] - self.offsets[rows]
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+        run_starts = np.concatenate(([0], breaks))
+        run_ends = np.concatenate((breaks, [len(rows)]))
+        buf = np.empty(int(offsets[-1]), dtype=np.uint8)
+        for a, b in zip(run_starts.tolist(), run_ends.tolist()):
+            src = self.buffer[self.offsets[rows[a]]:self.offsets[rows[b - 1] + 1]]
+            buf[offsets[a]:offsets[b]] = src
+        return TextStore(buf, offsets)
+
+    def save(self, directory: Union[str, Path]) -> None:
+        directory = Path(directory)
+        self.buffer.tofile(directory / _BUFFER_FILE)
+        np.save(directory / _OFFSETS_FILE, self.offsets)
+
+    @classmethod
+    def load(cls, directory: Union[str, Path]) -> "TextStore":
+        """Memory-map a saved store: pages are read only when texts are decoded."""
+        directory = Path(directory)
+        return cls(map_buffer(directory / _BUFFER_FILE), np.load(directory / _OFFSETS_FILE))
+
+
+def map_buffer(path: Union[str, Path]) -> np.ndarray:
+    """Memory-map a byte file read-only; an empty file (which mmap rejects) gives an
+    empty array."""
+    if not Path(path).stat().st_size:
+        return np.empty(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+def concat_text_stores(stores: Sequence[TextStore]) -> TextStore:
+    if len(stores) == 1:
+        return stores[0]
+    buffer = np.concatenate([s.buffer for s in stores])
+    shifts = np.cumsum([0] + [int(s.offsets[-1]) for s in stores[:-1]])
+    offsets = np.concatenate([stores[0].offsets[:1]] + [s.offsets[1:] + shift for s, shift in zip(stores, shifts)])
+    return TextStore(buffer, offsets)
+
+
+def text_source(df: pd.DataFrame, texts: Optional[TextStore] = None) -> Tuple[Union[np.ndarray, TextStore], np.ndarray]:
+    """Where ``df``'s message bodies are read from (its ``text`` column or ``texts``) and
+    the rows to read there, in frame order, for consumers that decode a block at a time."""
+    if "text" in df.columns:
+        return df["text"].to_numpy(dtype=object), np.arange(len(df), dtype=np.int64)
+    if texts is None:
+        raise ValueError("This frame keeps its text out of line; pass the TextStore it was built with.")
+    return texts, df[TEXT_INDEX_COLUMN].to_numpy(dtype=np.int64)
+
+
+def message_texts(df: pd.DataFrame, texts: Optional[TextStore] = None) -> pd.Series:
+    """The message bodies of ``df``'s rows, from its ``text`` column or from ``texts``."""
+    if "text" in df.columns:
+        return df["text"]
+    store, rows = text_source(df, texts)
+    return pd.Series(store.texts(rows), index=df.index, dtype=object, name="text")
+
+
+def with_text(df: pd.DataFrame, texts: Optional[TextStore] = None) -> pd.DataFrame:
+    """Materialise the ``text`` column in place of ``msg_idx`` (e.g. for a CSV export)."""
+    if "text" in df.columns:
+        return df
+    out = df.drop(columns=TEXT_INDEX_COLUMN)
+    out.insert(df.columns.get_loc(TEXT_INDEX_COLUMN), "text", message_texts(df, texts))
+    return out
@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+import re
+from itertools import islice
+from typing import Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
+# The only characters that case-fold onto, or lowercase into, ASCII letters (dotted and
+# dotless I, long s, Kelvin sign). re.IGNORECASE matches them against ASCII letters but
+# str.lower() does not map them onto ASCII, so a case-insensitive pattern equals a check
+# on the lowercased text only for texts without them.
+FOLDS_TO_ASCII = re.compile("[\u0130\u0131\u017f\u212a]")
+
+
+def chunks(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Consecutive lists of up to ``size`` items, so only one block is held at a time."""
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
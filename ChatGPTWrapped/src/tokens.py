@@ -1,7 +1,32 @@
 from __future__ import annotations
 
+import os
 import re
-from typing import Callable, Optional, Tuple
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .memo import TextMemo
+from .text_utils import FOLDS_TO_ASCII, chunks
+
+TIKTOKEN_ENCODING = "cl100k_base"
+# tiktoken encodings offered in the UI: GPT-3.5/GPT-4 and GPT-4o era models.
+SUPPORTED_ENCODINGS = ("cl100k_base", "o200k_base")
+# Part of processed-dataset cache keys; bump when the heuristic changes.
+HEURISTIC_TOKENIZER = "heuristic-v1"
+# Texts counted per batch, and threads each batch is split across.
+TOKEN_BATCH_SIZE = 1024
+TOKEN_THREADS = min(8, os.cpu_count() or 1)
+# Sampled counting: how to count tokens for an upload, and the exact-count budget.
+TOKENS_EXACT = "exact"
+TOKENS_SAMPLED = "sampled"
+TOKEN_SAMPLE_SIZE = 20_000
+TOKEN_SAMPLE_MIN_PER_STRATUM = 200
 
 _CODE_HINTS = re.compile(r"(\bSELECT\b|\bCREATE\b|\bFROM\b|\bWHERE\b|def\s+|import\s+|```|\{|\};)", re.I)
 
@@ -15,23 +40,297 @@ def estimate_tokens_heuristic(text: str) -> int:
     divisor = 3.1 if _CODE_HINTS.search(t) else 4.0
     return max(1, int(len(t) / divisor))
 
-def get_token_counter() -> Tuple[Callable[[str], int], bool, Optional[Exception]]:
-    """Return a lightweight token estimation function and availability info.
+# _CODE_HINTS decomposed for bulk use. Literal hints are checked first, gated on a
+# one-character scan (memchr) where possible. For the keywords, re.IGNORECASE equals
+# plain lowercasing except around FOLDS_TO_ASCII, so each keyword becomes a substring
+# check on the lowercased text, confirmed by a small case-sensitive regex only where
+# it occurs. That is several times cheaper than one case-insensitive alternation tried
+# at every position.
+_KEYWORD_HINTS = tuple(
+    [(kw, re.compile(rf"\b{kw}\b")) for kw in ("select", "create", "from", "where")]
+    + [(kw, re.compile(rf"{kw}\s")) for kw in ("def", "import")]
+)
+
+
+def _has_code_hint(t: str) -> bool:
+    """``_CODE_HINTS.search(t) is not None``, computed the cheap way."""
+    if "{" in t or ("`" in t and "```" in t) or ("}" in t and "};" in t):
+        return True
+    if t.isascii() or FOLDS_TO_ASCII.search(t) is None:
+        low = t.lower()
+        for kw, pattern in _KEYWORD_HINTS:
+            if kw in low and pattern.search(low):
+                return True
+        return False
+    return _CODE_HINTS.search(t) is not None
+
+
+def estimate_tokens_heuristic_vectorised(texts: Union[pd.Series, Sequence[Optional[str]], np.ndarray]) -> np.ndarray:
+    """``estimate_tokens_heuristic`` over a whole column at once, as an int64 array.
+
+    Stripping and lengths are bulk pandas string operations, code hints are found
+    mostly with substring scans instead of the case-insensitive regex, and the divide
+    and clamp are numpy. Results are identical to the scalar function (missing
+    values count as empty text).
+    """
+    values = texts.to_numpy(dtype=object) if isinstance(texts, pd.Series) else np.asarray(texts, dtype=object)
+    s = pd.Series(values, dtype=object)
+    if s.empty:
+        return np.zeros(0, dtype=np.int64)
+    stripped = s.fillna("").str.strip()
+    lengths = stripped.str.len().to_numpy(dtype=np.float64)
+    codey = np.fromiter(map(_has_code_hint, stripped.to_numpy()), dtype=bool, count=len(stripped))
+    estimate = np.trunc(lengths / np.where(codey, 3.1, 4.0)).astype(np.int64)
+    return np.where(lengths > 0, np.maximum(estimate, 1), 0).astype(np.int64)
+
+
+@dataclass(frozen=True)
+class EncoderStats:
+    load_seconds: float
+    texts: int
+    tokens: int
+    encode_seconds: float
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.encode_seconds if self.encode_seconds else 0.0
+
+
+class _EncoderRegistry:
+    """Process-wide tiktoken encodings, each loaded once on first use.
 
-    Tries to import ``tiktoken`` for more realistic counts and falls back to the
-    heuristic estimator when the dependency is missing.
+    Loading an encoding imports tiktoken and may download and parse its BPE file, so
+    it happens at most once per process, under a lock so concurrent sessions wait for
+    the first load instead of repeating it. A failed load is remembered too, so a host
+    without tiktoken or network does not retry on every rerun.
     """
 
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._encodings: Dict[str, Any] = {}
+        self._errors: Dict[str, Exception] = {}
+        self._load_seconds: Dict[str, float] = {}
+        self._usage: Dict[str, List[float]] = {}  # name -> [texts, tokens, seconds]
+        self._counters: Dict[str, Callable[[str], int]] = {}
+
+    def get(self, name: str) -> Any:
+        """Return the encoding, raising the load error if it is unavailable."""
+        enc = self._encodings.get(name)
+        if enc is not None:
+            return enc
+        with self._lock:
+            if name not in self._encodings and name not in self._errors:
+                start = time.perf_counter()
+                try:
+                    import tiktoken
+
+                    self._encodings[name] = tiktoken.get_encoding(name)
+                except Exception as e:  # pragma: no cover - optional dependency
+                    self._errors[name] = e
+                self._load_seconds[name] = time.perf_counter() - start
+                self._usage[name] = [0, 0, 0.0]
+            if name in self._errors:
+                raise self._errors[name]
+            return self._encodings[name]
+
+    def counter(self, name: str) -> Callable[[str], int]:
+        """A single-text counter for ``name``, built once and recording its throughput."""
+        counter = self._counters.get(name)
+        if counter is None:
+            enc = self.get(name)
+            usage = self._usage[name]
+            lock = self._lock
+
+            def counter(text: str) -> int:
+                if not text:
+                    return 0
+                start = time.perf_counter()
+                n = len(enc.encode(text))
+                with lock:
+                    usage[0] += 1
+                    usage[1] += n
+                    usage[2] += time.perf_counter() - start
+                return n
+
+            self._counters[name] = counter
+        return counter
+
+    def record(self, name: str, texts: int, tokens: int, seconds: float) -> None:
+        with self._lock:
+            usage = self._usage[name]
+            usage[0] += texts
+            usage[1] += tokens
+            usage[2] += seconds
+
+    def stats(self) -> Dict[str, EncoderStats]:
+        with self._lock:
+            return {
+                name: EncoderStats(self._load_seconds[name], int(u[0]), int(u[1]), u[2])
+                for name, u in self._usage.items()
+                if name in self._encodings
+            }
+
+
+_REGISTRY = _EncoderRegistry()
+
+
+def get_encoding(name: str = TIKTOKEN_ENCODING) -> Optional[Any]:
+    """The shared tiktoken encoding ``name``, or None when it cannot be loaded."""
     try:
-        import tiktoken
+        return _REGISTRY.get(name)
+    except Exception:
+        return None
+
+
+def encoder_stats() -> Dict[str, EncoderStats]:
+    """Load time and encode throughput of every encoding loaded in this process."""
+    return _REGISTRY.stats()
+
 
-        enc = tiktoken.get_encoding("cl100k_base")
+def tokenizer_name(use_tiktoken: bool = True, encoding: str = TIKTOKEN_ENCODING) -> str:
+    """Identify the counter these options resolve to, for cache keys and memo namespaces."""
+    return f"tiktoken/{encoding}" if use_tiktoken and get_encoding(encoding) is not None else HEURISTIC_TOKENIZER
 
-        def counter(text: str) -> int:
-            if not text:
-                return 0
-            return len(enc.encode(text))
 
-        return counter, True, None
+def get_token_counter(memo: Optional[TextMemo] = None,
+                      encoding: str = TIKTOKEN_ENCODING) -> Tuple[Callable[[str], int], bool, Optional[Exception]]:
+    """Return a lightweight token estimation function and availability info.
+
+    Uses the shared ``tiktoken`` ``encoding`` for more realistic counts and falls back
+    to the heuristic estimator when the dependency is missing. With a ``memo`` the
+    returned function looks counts up by content hash before counting.
+    """
+
+    try:
+        result: Tuple[Callable[[str], int], bool, Optional[Exception]] = (_REGISTRY.counter(encoding), True, None)
+        name = f"tiktoken/{encoding}"
     except Exception as e:  # pragma: no cover - optional dependency
-        return estimate_tokens_heuristic, False, e
+        result, name = (estimate_tokens_heuristic, False, e), HEURISTIC_TOKENIZER
+
+    if memo is not None:
+        result = (memo.wrap(f"tokens:{name}", result[0]), result[1], result[2])
+    return result
+
+
+def count_tokens_batch(texts: Iterable[str], use_tiktoken: bool = True,
+                       batch_size: int = TOKEN_BATCH_SIZE, num_threads: int = TOKEN_THREADS,
+                       memo: Optional[TextMemo] = None, encoding: str = TIKTOKEN_ENCODING) -> np.ndarray:
+    """Count tokens for many texts at once, returning an int64 array aligned with ``texts``.
+
+    With ``tiktoken`` each batch of ``batch_size`` texts is split into one contiguous
+    slice per thread; tiktoken releases the GIL while encoding, so the slices encode in
+    parallel. (``Encoding.encode_batch`` schedules one future per text and builds a new
+    pool per call, which costs more than it saves on short messages.) Counts are
+    identical to ``get_token_counter``'s. ``texts`` is consumed lazily, so only one
+    batch is alive at once. With a ``memo`` only texts it has not seen are counted.
+    """
+    enc = get_encoding(encoding) if use_tiktoken else None
+    namespace = f"tokens:{tokenizer_name(enc is not None, encoding)}"
+    threads = max(1, num_threads) if enc is not None else 1
+
+    def count(chunk: List[str]) -> List[int]:
+        if enc is None:
+            return estimate_tokens_heuristic_vectorised(chunk).tolist()
+        return [len(enc.encode(t)) if t else 0 for t in chunk]
+
+    def count_parallel(chunk: List[str]) -> List[int]:
+        start = time.perf_counter()
+        if threads == 1 or len(chunk) < 2:
+            out = count(chunk)
+        else:
+            step = -(-len(chunk) // threads)
+            out = []
+            for part in pool.map(count, [chunk[i:i + step] for i in range(0, len(chunk), step)]):
+                out.extend(part)
+        if enc is not None:
+            _REGISTRY.record(encoding, len(chunk), sum(out), time.perf_counter() - start)
+        return out
+
+    counts: List[int] = []
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="tokens") as pool:
+        # The heuristic is vectorised, so it gets bigger batches to amortise pandas overhead.
+        for chunk in chunks(texts, max(threads, batch_size) if enc is not None else max(batch_size, 1 << 16)):
+            if memo is not None:
+                counts.extend(memo.map(namespace, chunk, count_parallel))
+            else:
+                counts.extend(count_parallel(chunk))
+    return np.asarray(counts, dtype=np.int64)
+
+
+@dataclass(frozen=True)
+class SampledTokenCounts:
+    """Token counts from ``estimate_tokens_sampled``.
+
+    ``counts`` are exact where ``exact`` is set and estimated elsewhere.
+    ``tokens_per_char`` holds the fitted ratio for each ``(role, code)`` stratum, and
+    ``error_bound`` is a ~95% bound, in tokens, on the error of ``counts.sum()``.
+    """
+
+    counts: np.ndarray
+    exact: np.ndarray
+    tokens_per_char: Dict[Tuple[str, bool], float]
+    error_bound: float
+
+    @property
+    def relative_error(self) -> float:
+        total = int(self.counts.sum())
+        return self.error_bound / total if total else 0.0
+
+
+def estimate_tokens_sampled(texts: Sequence[str], roles: Sequence[str], sample_size: int = TOKEN_SAMPLE_SIZE,
+                            encoding: str = TIKTOKEN_ENCODING, memo: Optional[TextMemo] = None,
+                            seed: int = 0) -> SampledTokenCounts:
+    """Approximate tiktoken counts by tokenising a stratified sample exactly.
+
+    Messages are split into strata by role and by whether they look like code (the
+    heuristic's ``_CODE_HINTS``). About ``sample_size`` messages, allocated to strata
+    in proportion to their size with at least ``TOKEN_SAMPLE_MIN_PER_STRATUM`` each,
+    are counted exactly; every other message gets ``round(len(text) * ratio)`` using
+    its stratum's tokens-per-character ratio. The error bound is the usual one for a
+    stratified ratio estimator. Without tiktoken, or when every message fits in the
+    sample, all counts are exact.
+    """
+    values = np.asarray(texts, dtype=object)
+    n = len(values)
+    enc = get_encoding(encoding)
+    if enc is None or n <= sample_size:
+        counts = count_tokens_batch(values, use_tiktoken=enc is not None, memo=memo, encoding=encoding)
+        return SampledTokenCounts(counts, np.ones(n, dtype=bool), {}, 0.0)
+
+    lengths = np.fromiter(map(len, values), dtype=np.int64, count=n)
+    codey = np.fromiter(map(_has_code_hint, values), dtype=bool, count=n)
+    role_codes, role_names = pd.factorize(pd.Series(np.asarray(roles, dtype=object)), use_na_sentinel=False)
+    strata = role_codes.astype(np.int64) * 2 + codey
+
+    rng = np.random.default_rng(seed)
+    members = np.argsort(strata, kind="stable")
+    bounds = np.flatnonzero(np.diff(strata[members])) + 1
+    groups = np.split(members, bounds)
+    picks: List[np.ndarray] = []
+    for rows in groups:
+        share = max(TOKEN_SAMPLE_MIN_PER_STRATUM, round(sample_size * len(rows) / n))
+        picks.append(rows if share >= len(rows) else np.sort(rng.choice(rows, size=share, replace=False)))
+
+    sample = np.concatenate(picks)
+    exact = np.zeros(n, dtype=bool)
+    exact[sample] = True
+    counts = np.zeros(n, dtype=np.int64)
+    counts[sample] = count_tokens_batch(values[sample], memo=memo, encoding=encoding)
+
+    ratios: Dict[Tuple[str, bool], float] = {}
+    variance = 0.0
+    for rows, picked in zip(groups, picks):
+        y, x = counts[picked].astype(np.float64), lengths[picked].astype(np.float64)
+        ratio = y.sum() / x.sum() if x.sum() else 0.0
+        stratum = int(strata[rows[0]])
+        ratios[(str(role_names[stratum // 2]), bool(stratum % 2))] = float(ratio)
+        rest = rows[~exact[rows]]
+        if not len(rest):
+            continue
+        estimate = np.rint(lengths[rest] * ratio).astype(np.int64)
+        counts[rest] = np.where(lengths[rest] > 0, np.maximum(estimate, 1), 0)
+        if len(picked) > 1:
+            residual_var = float(np.var(y - ratio * x, ddof=1))
+            variance += len(rows) ** 2 * (1 - len(picked) / len(rows)) * residual_var / len(picked)
+
+    return SampledTokenCounts(counts, exact, ratios, 1.96 * variance ** 0.5)
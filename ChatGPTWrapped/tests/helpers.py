@@ -0,0 +1,28 @@
+"""Small processed datasets for the tests, built the way the app builds them."""
+
+from __future__ import annotations
+
+from typing import Any, List, Mapping, Optional, Tuple
+
+import pandas as pd
+
+from benchmarks.synthetic import export
+from src.analytics import build_message_dataframe
+from src.categorise import categorise_series
+from src.parse_export import MessageBatch, build_message_batch
+from src.text_store import TextStore
+from src.tokens import estimate_tokens_heuristic_vectorised
+
+
+def conversations(n: int = 40, seed: int = 0) -> List[Any]:
+    return export(n, seed=seed)
+
+
+def load(convs: List[Any], unchanged: Optional[Mapping[str, float]] = None
+         ) -> Tuple[MessageBatch, pd.DataFrame, TextStore]:
+    """Parse, tokenise and categorise ``convs`` into a compact frame with out-of-line text."""
+    batch = build_message_batch(convs, unchanged=unchanged)
+    extra = {"tokens": estimate_tokens_heuristic_vectorised(list(batch.iter_texts())),
+             "category": categorise_series(batch.iter_texts()).array}
+    df = build_message_dataframe(batch, extra, timezone=None, compact=True, keep_text=False)
+    return batch, df, TextStore.from_batch(batch)
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+from src.analytics import apply_timezone, conversation_level, date_bounds, day_range, tokens_by_category
+from src.categorise import category_scores
+from src.cube import ConversationDays
+from tests.helpers import conversations, load
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    _, df, texts = load(conversations(300))
+    return apply_timezone(df, "Australia/Melbourne"), category_scores(texts.iter_texts())
+
+
+def _bounds(df):
+    # Whole years, an open-ended range, and ranges starting on days some conversation
+    # continues into from the day before.
+    days = ConversationDays.from_frame(df).rows
+    carried = days.loc[days["lead_ns"] > 0, "day"].unique()[:3]
+    starts = [date(1970, 1, 1) + timedelta(days=int(d)) for d in carried]
+    return ([(None, None, None), (2024, None, None), (None, date(2023, 6, 1), None), (2025, date(2025, 3, 1), date(2025, 5, 31))]
+            + [(None, start, start + timedelta(days=2)) for start in starts])
+
+
+@pytest.mark.parametrize("split", [False, True], ids=["first-rule", "scored"])
+def test_conversation_days_match_conversation_level(dataset, split):
+    df, scores = dataset
+    scores = scores if split else None
+    days = ConversationDays.from_frame(df, scores)
+    for year, start, end in _bounds(df):
+        messages = day_range(df, *date_bounds(year, start, end))
+        expected, got = conversation_level(messages, scores), days.slice(year, start, end).conversation_level()
+        pd.testing.assert_frame_equal(got, expected, check_exact=True)
+        if split:
+            pd.testing.assert_frame_equal(days.slice(year, start, end).tokens_by_category(),
+                                          tokens_by_category(messages, scores))
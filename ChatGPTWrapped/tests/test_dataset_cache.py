@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import pandas as pd
+import pytest
+
+from src.dataset_cache import DatasetCache, content_hash, dataset_key, processing_profile
+from src.text_store import with_text
+from tests.helpers import conversations, load
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return DatasetCache(tmp_path / "cache", max_bytes=1 << 30)
+
+
+def test_entry_round_trip(cache):
+    batch, df, texts = load(conversations(20))
+    cache.put("k", df, profile="p", manifest=batch.manifest(), texts=texts)
+
+    got, got_texts = cache.get("k"), cache.get_texts("k")
+    pd.testing.assert_frame_equal(got, df)
+    assert with_text(got, got_texts).equals(with_text(df, texts))
+    assert cache.get_manifest("k") == batch.manifest()
+    assert cache.latest("p") == "k" and cache.latest("other") is None
+
+
+def test_missing_entry_is_a_miss(cache):
+    assert cache.get("absent") is None
+    assert cache.get_texts("absent") is None
+    assert cache.get_manifest("absent") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    _, df, texts = load(conversations(20))
+    probe = DatasetCache(tmp_path / "probe", max_bytes=1 << 30)
+    probe.put("k", df, texts=texts)
+    size = sum(f.stat().st_size for f in (tmp_path / "probe" / "k").iterdir())
+
+    cache = DatasetCache(tmp_path / "cache", max_bytes=2 * size + size // 2)
+    for key in ("a", "b"):
+        cache.put(key, df, texts=texts)
+    cache.get("a")  # now more recently used than "b"
+    cache.put("c", df, texts=texts)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_incremental_base_shares_conversations(cache):
+    _, df, _ = load(conversations(5))
+    cache.put("mine", df, profile="p", manifest={"a": 1.0, "b": 2.0, "c": 3.0})
+    cache.put("theirs", df, profile="p", manifest={"x": 1.0})
+    cache.put("other-profile", df, profile="q", manifest={"a": 1.0, "b": 2.0, "c": 3.0})
+
+    assert cache.incremental_base("p", ["a", "b", "new"]) == "mine"
+    assert cache.incremental_base("p", ["new"]) is None
+    assert cache.incremental_base("p", []) is None
+
+
+def test_keys():
+    raw = b"[]" * 10_000
+    assert content_hash(raw) == content_hash(memoryview(raw)) != content_hash(raw + b" ")
+    assert processing_profile(a=1, b=2) == processing_profile(b=2, a=1) != processing_profile(a=1, b=3)
+    assert dataset_key("h", "p") != dataset_key("h", "q")
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import copy
+
+import pytest
+
+from src.incremental import merge_incremental_texts
+from src.text_store import TEXT_INDEX_COLUMN, with_text
+from tests.helpers import conversations, load
+
+
+def _reimport(prior_convs, convs):
+    prior_batch, prior, prior_texts = load(prior_convs)
+    batch, delta, delta_texts = load(convs, unchanged=prior_batch.manifest())
+    return batch, merge_incremental_texts(prior, prior_texts, delta, delta_texts, batch)
+
+
+def _assert_matches_full_rebuild(convs, merged, texts):
+    _, full, full_texts = load(convs)
+    assert merged[TEXT_INDEX_COLUMN].tolist() == list(range(len(merged)))
+    assert len(texts) == len(merged)
+    assert with_text(merged, texts).equals(with_text(full, full_texts))
+
+
+def test_new_and_edited_conversations_match_full_rebuild():
+    convs = conversations(40)
+    newer = copy.deepcopy(convs) + conversations(50, seed=1)[40:]
+    for conv in newer[5:10]:
+        node = next(n for n in conv["mapping"].values() if n.get("message"))
+        node["message"]["content"] = {"content_type": "text", "parts": ["edited postgres text"]}
+        conv["update_time"] += 100
+    batch, (merged, texts) = _reimport(convs, newer)
+    assert len(batch.unchanged_conversations) == 35
+    _assert_matches_full_rebuild(newer, merged, texts)
+
+
+@pytest.mark.parametrize("keep", [slice(None), slice(10, None)], ids=["no-delta", "deletions-only"])
+def test_reimport_with_nothing_new_reuses_prior_rows(keep):
+    convs = conversations(40)
+    newer = copy.deepcopy(convs[keep])
+    batch, (merged, texts) = _reimport(convs, newer)
+    assert len(batch) == 0
+    _assert_matches_full_rebuild(newer, merged, texts)
+
+
+def test_reimport_of_an_empty_export():
+    _, (merged, texts) = _reimport(conversations(5), [])
+    assert merged.empty and len(texts) == 0
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import pytest
+
+from src.analytics import apply_timezone
+from src.keywords import KeywordCounts, count_keywords, keyword_counts, keyword_terms, top_counts
+from src.text_store import message_texts, with_text
+from tests.helpers import conversations, load
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    _, df, texts = load(conversations(200))
+    return apply_timezone(df, "Australia/Melbourne"), texts
+
+
+def test_count_keywords():
+    counts = count_keywords(["The Python error, python's ERROR", "", "404 x_y ab join"])
+    assert counts == {"python": 1, "error": 2, "python's": 1}
+    assert keyword_terms("The Python error") == ["python", "error"]
+    assert top_counts({"b": 2, "a": 2, "c": 3}, n=2).values.tolist() == [["c", 3], ["a", 2]]
+
+
+def test_keyword_counts_from_store_and_text_column(dataset):
+    df, texts = dataset
+    expected = count_keywords(message_texts(df, texts))
+    assert keyword_counts(df, texts) == expected
+    assert keyword_counts(with_text(df, texts)) == expected
+
+
+def test_keyword_counts_per_partition_match_count_keywords(dataset):
+    df, texts = dataset
+    counts = KeywordCounts.from_frame(df, texts)
+    words = counts.vocabulary.tolist()
+
+    def totals(**where):
+        return {w: int(c) for w, c in zip(words, counts.totals(**where)) if c}
+
+    assert totals() == count_keywords(message_texts(df, texts))
+    assert counts.top(25).equals(top_counts(count_keywords(message_texts(df, texts)), 25))
+    for year in df["year"].unique().tolist():
+        messages = df[df["year"] == year]
+        assert totals(year=year) == count_keywords(message_texts(messages, texts))
+        category = messages["category"].iloc[0]
+        both = messages[messages["category"] == category]
+        assert totals(year=year, category=category) == count_keywords(message_texts(both, texts))
+        assert counts.top(10, year=year).equals(top_counts(count_keywords(message_texts(messages, texts)), 10))
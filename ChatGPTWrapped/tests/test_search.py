@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import re
+
+import numpy as np
+import pytest
+
+from src.dataset_cache import DatasetCache
+from src.keywords import keyword_terms
+from src.search import SearchIndex, decode_varints, encode_varints, search_terms
+from tests.helpers import conversations, load
+
+QUERIES = ["python", "error traceback", "Recipe, dinner & holiday", "kubernetes", "the and"]
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    _, df, texts = load(conversations(150))
+    return df, texts, SearchIndex.build(df, texts)
+
+
+def _scan(df, texts, query, rows=None):
+    """Conversations with a message using any keyword of ``query``, by reading every message."""
+    terms = search_terms(query)
+    if not terms:
+        return set()
+    pattern = re.compile(rf"(?<![a-z0-9_'])(?:{'|'.join(map(re.escape, terms))})(?![a-z0-9_'])")
+    if rows is not None:
+        df = df[df["msg_idx"].isin(rows)]
+    hits = [bool(pattern.search(t.lower())) for t in texts.iter_texts(df["msg_idx"].to_numpy())]
+    return set(df.loc[np.asarray(hits, dtype=bool), "conversation_id"].astype(str))
+
+
+@pytest.mark.parametrize("values", [[], [0], [1, 127, 128, 300, 16383, 16384, 2**31, 2**62], list(range(1000))],
+                         ids=["empty", "zero", "boundaries", "range"])
+def test_varints_round_trip(values):
+    data, ends = encode_varints(np.asarray(values, dtype=np.int64))
+    assert decode_varints(data).tolist() == values
+    assert data.dtype == np.uint8 and len(ends) == len(values)
+    assert ends.tolist()[-1:] == ([len(data)] if values else [])
+
+
+def test_postings_match_messages(dataset):
+    df, texts, index = dataset
+    ids, freqs = index.postings_for("python")
+    assert (np.diff(ids) > 0).all()
+    for i in df["msg_idx"].tolist():
+        count = keyword_terms(texts.text(i)).count("python")
+        assert count == (freqs[ids == i].item() if i in ids else 0)
+    assert len(index.postings_for("not-a-term")[0]) == 0
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_search_matches_a_scan(dataset, query):
+    df, texts, index = dataset
+    results = index.search(query, limit=len(index.conversations), texts=texts)
+    assert set(results["conversation_id"]) == _scan(df, texts, query)
+    assert results["score"].is_monotonic_decreasing
+    for conv, message, text in zip(results["conversation_id"], results["message"], results["snippet"]):
+        assert df.loc[df["msg_idx"] == message, "conversation_id"].astype(str).item() == conv
+        assert any(term in text.lower() for term in search_terms(query))
+
+
+def test_search_within_messages(dataset):
+    df, texts, index = dataset
+    rows = df["msg_idx"].to_numpy()[: len(df) // 3]
+    results = index.search("python error", limit=len(index.conversations), messages=rows)
+    assert set(results["conversation_id"]) == _scan(df, texts, "python error", rows)
+    assert set(results["message"]).issubset(rows.tolist())
+
+
+def test_save_and_load(dataset, tmp_path):
+    df, texts, index = dataset
+    cache = DatasetCache(tmp_path, max_bytes=1 << 30)
+    assert cache.get_search_index("k") is None
+    cache.put("k", df, texts=texts)
+    cache.put_search_index("k", index)
+    loaded = cache.get_search_index("k")
+    assert loaded.terms.tolist() == index.terms.tolist()
+    for query in QUERIES:
+        assert loaded.search(query, texts=texts).equals(index.search(query, texts=texts))
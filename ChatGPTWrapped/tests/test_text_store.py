@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.analytics import build_message_dataframe
+from src.text_store import TEXT_INDEX_COLUMN, TextStore, concat_text_stores, message_texts, with_text
+from tests.helpers import conversations, load
+
+TEXTS = ["", "plain ascii", "ünïcödé ✓ 日本語", "", "line\nbreaks\ttabs"]
+
+
+def test_from_texts_round_trip():
+    store = TextStore.from_texts(TEXTS)
+    assert len(store) == len(TEXTS)
+    assert list(store.iter_texts()) == TEXTS
+    assert [store.text(i) for i in range(len(TEXTS))] == TEXTS
+    assert list(store.texts([4, 2, 2])) == [TEXTS[4], TEXTS[2], TEXTS[2]]
+
+
+def test_take_and_concat():
+    store = TextStore.from_texts(TEXTS)
+    rows = [3, 1, 2, 4, 0, 1]
+    assert list(store.take(rows).iter_texts()) == [TEXTS[i] for i in rows]
+    assert len(store.take([])) == 0
+    both = concat_text_stores([store, TextStore.from_texts(["more"]), store])
+    assert list(both.iter_texts()) == TEXTS + ["more"] + TEXTS
+
+
+@pytest.mark.parametrize("texts", [TEXTS, [], ["", ""]], ids=["texts", "no-rows", "empty-texts"])
+def test_save_and_load(tmp_path, texts):
+    TextStore.from_texts(texts).save(tmp_path)
+    assert list(TextStore.load(tmp_path).iter_texts()) == texts
+
+
+def test_frame_without_text_matches_frame_with_it():
+    batch, df, texts = load(conversations(20))
+    assert "text" not in df.columns and sorted(df[TEXT_INDEX_COLUMN]) == list(range(len(batch)))
+    in_batch_order = df.sort_values(TEXT_INDEX_COLUMN)
+    extra = {name: in_batch_order[name].array for name in ("tokens", "category")}
+    full = build_message_dataframe(batch, extra, timezone=None, compact=True, keep_text=True)
+    assert with_text(df, texts).equals(full)
+
+    subset = df.iloc[np.arange(0, len(df), 7)]
+    pd.testing.assert_series_equal(message_texts(subset, texts), full["text"].iloc[np.arange(0, len(df), 7)])
+    with pytest.raises(ValueError):
+        message_texts(subset)